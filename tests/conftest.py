@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def zepid_cache_dir(tmpdir_factory, monkeypatch):
+    # parsed data sets are cached in a temporary directory rather than the user's cache
+    monkeypatch.setenv('ZEPID_CACHE_DIR', str(tmpdir_factory.getbasetemp().join('zepid_cache')))
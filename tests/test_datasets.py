@@ -1,6 +1,10 @@
+import os
+import pytest
+import numpy as np
 import pandas as pd
 
 import zepid as ze
+from zepid import datasets
 
 
 class TestSampleData:
@@ -149,3 +153,83 @@ class TestCaseControl:
     def test_correct_nobs(self):
         df = ze.load_case_control_data()
         assert df.shape[0] == 11
+
+
+class TestCaching:
+
+    @pytest.fixture
+    def cache(self, tmpdir, monkeypatch):
+        monkeypatch.setenv('ZEPID_CACHE_DIR', str(tmpdir))
+        monkeypatch.setattr(datasets, '_loaded', {})
+        return str(tmpdir)
+
+    def test_returns_copy(self, cache):
+        df = ze.load_sciatica_data()
+        df['surgery'] = -1
+        assert (ze.load_sciatica_data()['surgery'] != -1).all()
+
+    def test_cached_file_matches_parsed(self, cache):
+        parsed = ze.load_gvhd_data()
+        assert len(os.listdir(cache)) == 1
+        datasets._loaded.clear()
+        pd.testing.assert_frame_equal(ze.load_gvhd_data(), parsed)
+
+    def test_cached_file_compact(self, cache):
+        ze.load_gvhd_data()
+        path = os.path.join(cache, os.listdir(cache)[0])
+        assert os.path.getsize(path) < 1000000
+
+    def test_no_disk_cache(self, cache, monkeypatch):
+        monkeypatch.setenv('ZEPID_CACHE_DIR', '')
+        ze.load_sample_data(False)
+        assert len(os.listdir(cache)) == 0
+
+
+class TestSyntheticCohorts:
+
+    def test_timefixed_truth(self):
+        cohort = ze.datasets.TimeFixedCohort(effect=-0.5, confounding=0)
+        df = cohort.sample(n=1000000, seed=2019)
+        risks = df.groupby('A')['Y'].mean()
+        assert abs(risks[1] - cohort.risk_1) < 0.005
+        assert abs(risks[0] - cohort.risk_0) < 0.005
+
+    def test_timefixed_chunks(self):
+        cohort = ze.datasets.TimeFixedCohort()
+        chunks = list(cohort.chunks(n=2500, chunk_size=1000, seed=1))
+        assert [c.shape[0] for c in chunks] == [1000, 1000, 500]
+        df = pd.concat(chunks)
+        assert list(df['id']) == list(range(2500))
+        pd.testing.assert_frame_equal(df, pd.concat(list(cohort.chunks(n=2500, chunk_size=1000, seed=1))))
+
+    def test_timevary_long_format(self):
+        cohort = ze.datasets.TimeVaryCohort(time_points=5)
+        df = cohort.sample(n=5000, seed=1)
+        assert df['t'].max() == 5
+        # follow-up ends at the outcome
+        last = df.groupby('id').tail(1)
+        assert (last['Y'] == 1).sum() == df['Y'].sum()
+        assert ((last['Y'] == 1) | (last['t'] == 5)).all()
+        assert (df.groupby('id')['t'].count() == df.groupby('id')['t'].max()).all()
+
+    def test_timevary_truth(self):
+        cohort = ze.datasets.TimeVaryCohort(time_points=3)
+        assert (cohort.risk_curve[['risk_1', 'risk_0']].diff().dropna() > 0).all().all()
+        assert cohort.risk_curve['risk_1'].iloc[-1] == cohort.risk_1
+        cohort = ze.datasets.TimeVaryCohort(time_points=1, effect=-0.5)
+        df = cohort.sample(n=1000000, seed=2019)
+        # with a single time point, standardizing by W and L gives the truth
+        strata = df.groupby(['W', 'L', 'A'])['Y'].mean().unstack()
+        weights = df.groupby(['W', 'L']).size() / df.shape[0]
+        assert abs(np.sum(strata[1] * weights) - cohort.risk_1) < 0.005
+        assert abs(np.sum(strata[0] * weights) - cohort.risk_0) < 0.005
+
+    def test_parquet(self, tmpdir):
+        pytest.importorskip('pyarrow')
+        cohort = ze.datasets.TimeVaryCohort(time_points=3)
+        cohort.to_parquet(str(tmpdir), n=300, chunk_size=100, seed=1)
+        assert len(os.listdir(str(tmpdir))) == 3
+        df = pd.read_parquet(str(tmpdir))
+        pd.testing.assert_frame_equal(df.reset_index(drop=True),
+                                      pd.concat(list(cohort.chunks(n=300, chunk_size=100, seed=1)),
+                                                ignore_index=True))
@@ -5,6 +5,9 @@ import numpy.testing as npt
 import pandas.testing as pdt
 from scipy.stats import logistic
 from lifelines import KaplanMeierFitter
+import statsmodels.api as sm
+import statsmodels.formula.api as smf
+import patsy
 
 from zepid import load_sample_data, spline
 from zepid.causal.gformula import TimeFixedGFormula, TimeVaryGFormula
@@ -165,6 +168,14 @@ class TestTimeFixedGFormula:
         r0 = g.marginal_outcome
         npt.assert_allclose(r0, 0.404286, rtol=1e-5)
 
+    def test_weighted_model_matches_gee(self, data):
+        g = TimeFixedGFormula(data, exposure='A', outcome='Y', weights='w')
+        g.outcome_model(model='A + L + A:L', print_results=False)
+        f = smf.gee('Y ~ A + L + A:L', data.index, data, family=sm.families.family.Binomial(),
+                    weights=data['w']).fit()
+        npt.assert_allclose(g._outcome_model.params, f.params, atol=1e-8)
+        npt.assert_allclose(g._outcome_model.bse, f.bse, rtol=1e-6)
+
     # TODO add test for Poisson distributed outcome
 
     def test_stochastic_conditional_probability(self, data):
@@ -406,6 +417,40 @@ class TestTimeVaryGFormula:
         pdt.assert_frame_equal(lf, expected_lf[['A_0', 'A_1', 'A_2', 'Y_0', 'Y_1', 'Y_2', 'W_0', 'W_1', 'W_2', 'L_0',
                                                 'L_1', 'L_2']], check_names=False)
 
+    def test_long_to_panel_conversion(self, longdata):
+        g = TimeVaryGFormula(longdata, idvar='id', exposure='A', outcome='Y',
+                             time_out='t', method='SequentialRegression')
+        panel, ids, times, columns, others = g._long_to_panel(longdata, id='id', t='t')
+        assert panel.shape == (1, 3, 4)
+        assert times == [0, 1, 2]
+        assert columns == ['A', 'Y', 'W', 'L']
+        npt.assert_equal(panel[0, :, columns.index('L')], [25, 20, 31])
+        npt.assert_equal(panel[0, 2, :], [1, 1, 5, 31])
+
+    def test_long_to_panel_missing_time(self, longdata):
+        longdata = pd.concat([longdata, pd.DataFrame({'id': [2], 't': [0], 'A': [1], 'Y': [1], 'W': [3], 'L': [10]})],
+                             ignore_index=True)
+        g = TimeVaryGFormula(longdata, idvar='id', exposure='A', outcome='Y',
+                             time_out='t', method='SequentialRegression')
+        panel, ids, times, columns, others = g._long_to_panel(longdata, id='id', t='t')
+        npt.assert_equal(ids, [1, 2])
+        assert np.isnan(panel[1, 1:, :]).all()
+
+    def test_long_to_panel_string_column(self, longdata):
+        longdata['site'] = ['a', 'b', 'b']
+        g = TimeVaryGFormula(longdata, idvar='id', exposure='A', outcome='Y',
+                             time_out='t', method='SequentialRegression')
+        panel, ids, times, columns, others = g._long_to_panel(longdata, id='id', t='t')
+        assert panel.dtype == np.float64
+        assert columns == ['A', 'Y', 'W', 'L']
+        npt.assert_equal(others['site'][0], ['a', 'b', 'b'])
+
+    def test_error_long_to_panel_duplicates(self, longdata):
+        g = TimeVaryGFormula(longdata, idvar='id', exposure='A', outcome='Y',
+                             time_out='t', method='SequentialRegression')
+        with pytest.raises(ValueError):
+            g._long_to_panel(pd.concat([longdata, longdata]), id='id', t='t')
+
     def test_monte_carlo_for_single_t(self, sim_t_fixed_data):
         # Estimating monte carlo for single t
         gt = TimeVaryGFormula(sim_t_fixed_data, idvar='id', exposure='A', outcome='Y',
@@ -422,6 +467,161 @@ class TestTimeVaryGFormula:
         # Expected behavior; same results between the estimation methods
         npt.assert_allclose(gf.marginal_outcome, np.mean(gt.predicted_outcomes['Y']), rtol=1e-3)
 
+    @pytest.fixture
+    def mcgf(self, sim_t_fixed_data):
+        g = TimeVaryGFormula(sim_t_fixed_data, idvar='id', exposure='A', outcome='Y', time_out='t', time_in='t0')
+        g.outcome_model('A + W1_sq + W2 + W3', print_results=False)
+        g.exposure_model('W1_sq', print_results=False)
+        return g
+
+    def test_error_mc_output(self, mcgf):
+        with pytest.raises(ValueError):
+            mcgf.fit(treatment='all', sample=100, output='wide')
+        with pytest.raises(ValueError):
+            mcgf.fit(treatment='all', sample=100, output='summary', sink='fail')
+
+    def test_mc_compact_output(self, mcgf):
+        np.random.seed(20)
+        mcgf.fit(treatment='all', sample=1000, t_max=3)
+        full = mcgf.predicted_outcomes
+        np.random.seed(20)
+        mcgf.fit(treatment='all', sample=1000, t_max=3, output='compact')
+        compact = mcgf.predicted_outcomes
+        assert compact['A'].dtype == np.int8
+        assert compact['Y'].dtype == np.int8
+        assert compact['t'].dtype == np.int16
+        pdt.assert_frame_equal(compact.sort_values(by=['uid_g_zepid', 't0']).reset_index(drop=True),
+                               full, check_dtype=False)
+
+    def test_mc_summary_output(self, mcgf):
+        np.random.seed(20)
+        mcgf.fit(treatment='all', sample=1000, t_max=3)
+        full = mcgf.predicted_outcomes
+        np.random.seed(20)
+        mcgf.fit(treatment='all', sample=1000, t_max=3, output='summary')
+        summary = mcgf.predicted_outcomes
+        npt.assert_equal(np.asarray(summary['at_risk']), np.asarray(full.groupby('t')['Y'].count()))
+        npt.assert_equal(np.asarray(summary['events']), np.asarray(full.groupby('t')['Y'].sum()))
+        npt.assert_allclose(summary['risk'], np.asarray(full.groupby('t')['Y'].sum().cumsum() / 1000))
+
+    def test_mc_stream_to_sink(self, mcgf, tmpdir):
+        pytest.importorskip('pyarrow')
+        np.random.seed(20)
+        mcgf.fit(treatment='all', sample=1000, t_max=3)
+        full = mcgf.predicted_outcomes
+        np.random.seed(20)
+        mcgf.fit(treatment='all', sample=1000, t_max=3, output='compact', sink=str(tmpdir))
+        assert mcgf.predicted_outcomes is None
+        assert len(tmpdir.listdir()) == 3
+        streamed = pd.read_parquet(str(tmpdir))
+        pdt.assert_frame_equal(streamed.sort_values(by=['uid_g_zepid', 't0']).reset_index(drop=True),
+                               full, check_dtype=False)
+
+    def test_error_mc_tolerance(self, mcgf):
+        with pytest.raises(ValueError):
+            mcgf.fit(treatment='all', sample=100, tolerance=0)
+
+    def test_mc_standard_error(self, mcgf):
+        mcgf.fit(treatment='all', sample=1000, output='summary')
+        r = mcgf.predicted_outcomes['risk'].iloc[-1]
+        npt.assert_allclose(mcgf.mc_standard_error, np.sqrt(r * (1 - r) / 1000))
+        assert mcgf.mc_sample_size == 1000
+
+    def test_mc_adaptive_tolerance(self, mcgf):
+        np.random.seed(20)
+        mcgf.fit(treatment='all', sample=500, tolerance=0.01)
+        assert mcgf.mc_standard_error <= 0.01
+        assert mcgf.mc_sample_size > 500
+        assert mcgf.mc_sample_size % 500 == 0
+        assert mcgf.predicted_outcomes['uid_g_zepid'].nunique() == mcgf.mc_sample_size
+        assert mcgf.predicted_outcomes['uid_g_zepid'].is_monotonic_increasing
+
+    def test_mc_adaptive_time_budget(self, mcgf):
+        with pytest.warns(UserWarning):
+            mcgf.fit(treatment='all', sample=500, tolerance=0.0001, time_budget=0, output='summary')
+        assert mcgf.mc_sample_size == 500
+        assert mcgf.mc_standard_error > 0.0001
+
+    def test_mc_adaptive_max_batches(self, mcgf):
+        with pytest.raises(ValueError):
+            mcgf.fit(treatment='all', sample=100, tolerance=0.01, max_batches=0)
+        with pytest.warns(UserWarning, match='max_batches'):
+            mcgf.fit(treatment='all', sample=200, tolerance=1e-6, max_batches=3, output='summary')
+        assert mcgf.mc_sample_size == 600
+        assert mcgf.mc_standard_error > 1e-6
+
+    def test_mc_standard_error_all_times(self, mcgf):
+        mcgf.fit(treatment='all', sample=1000, output='summary', all_times=True)
+        r = mcgf.predicted_outcomes['risk']
+        npt.assert_allclose(mcgf.mc_standard_error, np.max(np.sqrt(r * (1 - r) / 1000)))
+
+    def test_mc_checkpoint_resume(self, mcgf, tmpdir, monkeypatch):
+        np.random.seed(33)
+        mcgf.fit(treatment='natural', sample=2000, t_max=4)
+        expected = mcgf.predicted_outcomes
+
+        # Interrupting the simulation during the third time step
+        original = mcgf._mc_step
+
+        def interrupted(g, i, *args, **kwargs):
+            if i == 2:
+                raise KeyboardInterrupt
+            return original(g, i, *args, **kwargs)
+
+        monkeypatch.setattr(mcgf, '_mc_step', interrupted)
+        np.random.seed(33)
+        with pytest.raises(KeyboardInterrupt):
+            mcgf.fit(treatment='natural', sample=2000, t_max=4, checkpoint=str(tmpdir))
+        assert len(tmpdir.listdir()) > 0
+        # the resampled population is saved once per batch, and the checkpoints refer to it
+        state = pd.read_pickle(str(tmpdir.join('gformula_state.pkl')))
+        assert state['gs'] == str(tmpdir.join('gformula_batch_1_population.pkl'))
+        monkeypatch.undo()
+
+        np.random.seed(999)
+        mcgf.fit(treatment='natural', sample=2000, t_max=4, checkpoint=str(tmpdir))
+        pdt.assert_frame_equal(mcgf.predicted_outcomes, expected)
+        assert len(tmpdir.listdir()) == 0
+
+    def test_mc_checkpoint_new_directory(self, mcgf, tmpdir):
+        path = tmpdir.join('new', 'checkpoint')
+        for output in ['full', 'compact', 'summary']:
+            np.random.seed(33)
+            mcgf.fit(treatment='natural', sample=500, t_max=3, output=output)
+            expected = mcgf.predicted_outcomes
+            np.random.seed(33)
+            mcgf.fit(treatment='natural', sample=500, t_max=3, output=output, checkpoint=str(path))
+            pdt.assert_frame_equal(mcgf.predicted_outcomes, expected)
+            assert path.listdir() == []
+
+    def test_error_mc_checkpoint_arguments(self, mcgf, tmpdir):
+        mcgf._save_checkpoint(str(tmpdir), {'settings': {'treatment': 'all'}})
+        with pytest.raises(ValueError):
+            mcgf.fit(treatment='none', sample=100, checkpoint=str(tmpdir))
+
+    def test_error_mc_plans(self, mcgf):
+        with pytest.raises(ValueError):
+            mcgf.fit_plans('all', sample=100)
+        with pytest.raises(ValueError):
+            mcgf.fit_plans(['all', 'all'], sample=100)
+
+    def test_mc_plans_common_random_numbers(self, mcgf):
+        np.random.seed(20)
+        mcgf.fit_plans(['all', 'none', "g['W3'] > 0"], sample=5000, t_max=2)
+        s = mcgf.plan_summary
+        assert list(s.index) == ['all', 'none', "g['W3'] > 0"]
+        npt.assert_allclose(s['risk'], [mcgf.predicted_outcomes[p]['risk'].iloc[-1] for p in s.index])
+        npt.assert_allclose(s['risk_difference'], s['risk'] - s.loc['all', 'risk'])
+        # Paired differences under common random numbers are more precise than independent runs
+        independent = np.sqrt(s['mc_standard_error']**2 + s.loc['all', 'mc_standard_error']**2)
+        assert (s['rd_mc_standard_error'].iloc[1:] < independent.iloc[1:]).all()
+
+    def test_mc_plans_match_fit(self, mcgf):
+        mcgf.fit_plans(['all', 'none'], sample=50000, t_max=1, output='full')
+        r_plan = np.mean(mcgf.predicted_outcomes['all']['Y'])
+        mcgf.fit(treatment='all', sample=50000)
+        npt.assert_allclose(r_plan, np.mean(mcgf.predicted_outcomes['Y']), atol=0.01)
+
     def test_sequential_regression_for_single_t(self, sim_t_fixed_data):
         # Estimating sequential regression for single t
         gt = TimeVaryGFormula(sim_t_fixed_data, idvar='id', exposure='A', outcome='Y',
@@ -437,6 +637,66 @@ class TestTimeVaryGFormula:
         # Expected behavior; same results between the estimation methods
         npt.assert_allclose(gf.marginal_outcome, gt.predicted_outcomes)
 
+    @pytest.fixture
+    def timevary_data(self):
+        df = load_sample_data(timevary=True)
+        df['lag_art'] = df['art'].shift(1)
+        df['lag_art'] = np.where(df.groupby('id').cumcount() == 0, 0, df['lag_art'])
+        df['lag_cd4'] = df['cd4'].shift(1)
+        df['lag_cd4'] = np.where(df.groupby('id').cumcount() == 0, df['cd40'], df['lag_cd4'])
+        return df
+
+    def test_restricted_model_matches_formula_fit(self, timevary_data):
+        g = TimeVaryGFormula(timevary_data, idvar='id', exposure='art', outcome='dead', time_in='enter',
+                             time_out='out')
+        g.exposure_model('male + age0 + cd40 + cd4', restriction="g['lag_art']==0", print_results=False)
+        df = timevary_data.loc[timevary_data['lag_art'] == 0]
+        f = smf.glm('art ~ male + age0 + cd40 + cd4', df, family=sm.families.family.Binomial()).fit()
+        npt.assert_allclose(g.exp_model.params, f.params)
+        info, keep = g._designs['exposure']
+        x = np.asarray(patsy.build_design_matrices([info], timevary_data.iloc[:5])[0])[:, keep]
+        npt.assert_allclose(g.exp_model.predict(x), f.predict(timevary_data.iloc[:5]))
+
+    def test_restricted_design_matches_formula_fit(self, timevary_data):
+        # the design is built from the full data, so categories absent under the restriction are dropped from the fit
+        # and center() uses the full mean, which only changes the intercept of the formula fit to the restricted data
+        timevary_data['grp'] = np.where(timevary_data['lag_art'] == 1, 'lo', np.where(timevary_data['male'] == 1,
+                                                                                     'hi', 'mid'))
+        model = 'C(grp) + center(age0) + cd40 + cd4'
+        g = TimeVaryGFormula(timevary_data, idvar='id', exposure='art', outcome='dead', time_in='enter',
+                             time_out='out')
+        g.exposure_model(model, restriction="g['lag_art']==0", print_results=False)
+        df = timevary_data.loc[timevary_data['lag_art'] == 0]
+        f = smf.glm('art ~ ' + model, df, family=sm.families.family.Binomial()).fit()
+        assert list(g.exp_model.params.index) == list(f.params.index)
+        npt.assert_allclose(g.exp_model.params[1:], f.params[1:])
+        info, keep = g._designs['exposure']
+        x = np.asarray(patsy.build_design_matrices([info], df.iloc[:20])[0])[:, keep]
+        npt.assert_allclose(g.exp_model.predict(x), f.predict(df.iloc[:20]))
+
+    def test_deferred_models_match(self, timevary_data):
+        fits = []
+        for defer, n_jobs in [(False, 1), (True, 1), (True, 2)]:
+            g = TimeVaryGFormula(timevary_data, idvar='id', exposure='art', outcome='dead', time_in='enter',
+                                 time_out='out', defer_models=defer)
+            g.exposure_model('male + age0 + cd40 + cd4', restriction="g['lag_art']==0", print_results=False)
+            g.outcome_model('art + male + age0 + cd40 + cd4', print_results=False)
+            g.add_covariate_model(label=1, covariate='cd4', model='male + age0 + cd40 + lag_cd4 + lag_art',
+                                  var_type='continuous', print_results=False)
+            if defer:
+                assert g.exp_model is None
+                g.fit_models(n_jobs=n_jobs)
+            fits.append([g.exp_model.params, g.out_model.params, g._covariate_models[0].params])
+        for f in fits[1:]:
+            for p, q in zip(fits[0], f):
+                npt.assert_allclose(p, q)
+
+    def test_error_fit_models_jobs(self, timevary_data):
+        g = TimeVaryGFormula(timevary_data, idvar='id', exposure='art', outcome='dead', time_in='enter',
+                             time_out='out', defer_models=True)
+        with pytest.raises(ValueError):
+            g.fit_models(n_jobs=0)
+
     def test_complete_mc_procedure_completes(self):
         df = load_sample_data(timevary=True)
         df['lag_art'] = df['art'].shift(1)
@@ -506,6 +766,50 @@ class TestTimeVaryGFormula:
         g.fit(treatment="none")
         npt.assert_allclose(g.predicted_outcomes, 0.661226, rtol=1e-5)
 
+    def test_sr_plans_match_fit(self, data):
+        g = TimeVaryGFormula(data, idvar='id', exposure='A', outcome='Y', time_out='t2', method='SequentialRegression',
+                             weights='w')
+        g.outcome_model('A + L', print_results=False)
+        g.fit_plans(['all', 'none', "g['t'] != 2"])
+        npt.assert_allclose(g.plan_summary['risk'], [0.4051569, 0.661226, g.predicted_outcomes["g['t'] != 2"]],
+                            rtol=1e-5)
+        npt.assert_allclose(g.plan_summary.loc['none', 'risk_difference'], 0.661226 - 0.4051569, rtol=1e-4)
+        g.fit(treatment="g['t'] != 2")
+        npt.assert_allclose(g.plan_summary['risk'].iloc[2], g.predicted_outcomes)
+
+    def test_sr_plans_parallel(self, data):
+        g = TimeVaryGFormula(data, idvar='id', exposure='A', outcome='Y', time_out='t2', method='SequentialRegression')
+        g.outcome_model('A + L', print_results=False)
+        g.fit_plans(['all', 'none'], n_jobs=2)
+        npt.assert_allclose(g.plan_summary['risk'], [g.predicted_outcomes['all'], g.predicted_outcomes['none']])
+        g.fit(treatment='none')
+        npt.assert_allclose(g.plan_summary.loc['none', 'risk'], g.predicted_outcomes)
+
+    def test_sr_plans_single_pool(self, data, monkeypatch):
+        from zepid.causal.gformula import TimeVary
+        pools = []
+
+        class CountedPool(TimeVary.ProcessPoolExecutor):
+            def __init__(self, *args, **kwargs):
+                pools.append(self)
+                super(CountedPool, self).__init__(*args, **kwargs)
+
+        monkeypatch.setattr(TimeVary, 'ProcessPoolExecutor', CountedPool)
+        g = TimeVaryGFormula(data, idvar='id', exposure='A', outcome='Y', time_out='t', method='SequentialRegression')
+        g.outcome_model('A + L', print_results=False)
+        g.fit_plans(['all', 'none'], n_jobs=2)
+        assert len(pools) == 1
+        npt.assert_allclose(g.plan_summary['risk'], [0.4051569, 0.661226], rtol=1e-5)
+
+    def test_sr_category_changes_over_time(self, data):
+        # the design is set up once from all times, and gives the same estimates as coding each time separately
+        data['grp'] = np.where(data['t'] == 3, np.where(data['id'] % 3 == 0, 'x', 'y'),
+                               np.where(data['id'] % 2 == 0, 'y', 'z'))
+        g = TimeVaryGFormula(data, idvar='id', exposure='A', outcome='Y', time_out='t', method='SequentialRegression')
+        g.outcome_model('A + L + C(grp)', print_results=False)
+        g.fit_plans(['all', 'none'])
+        npt.assert_allclose(g.plan_summary['risk'], [0.4050009, 0.6611055], rtol=1e-5)
+
     def test_sr_custom_treatment(self, data):
         g = TimeVaryGFormula(data, idvar='id', exposure='A', outcome='Y', time_out='t2', method='SequentialRegression')
         out_m = 'A + L'
@@ -522,6 +826,17 @@ class TestTimeVaryGFormula:
         g.fit(treatment="none", t_max=2)
         npt.assert_allclose(g.predicted_outcomes, 0.51228, rtol=1e-5)
 
+    def test_sr_string_column(self, data):
+        # a non-numeric column, used by the model or not, does not change the estimates
+        data['site'] = np.where(data['id'] % 2 == 0, 'a', 'b')
+        g = TimeVaryGFormula(data, idvar='id', exposure='A', outcome='Y', time_out='t', method='SequentialRegression')
+        g.outcome_model('A + L', print_results=False)
+        g.fit(treatment="all", t_max=2)
+        npt.assert_allclose(g.predicted_outcomes, 0.33492, rtol=1e-5)
+        g.outcome_model('A + L + C(site)', print_results=False)
+        g.fit(treatment="all", t_max=2)
+        npt.assert_allclose(g.predicted_outcomes, 0.33456, rtol=1e-4)
+
     def test_sr_warning_outside_time_point(self, data):
         g = TimeVaryGFormula(data, idvar='id', exposure='A', outcome='Y', time_out='t2', method='SequentialRegression')
         g.outcome_model('A + L', print_results=False)
@@ -1,8 +1,12 @@
 import pytest
 import numpy as np
+import pandas as pd
+import numpy.testing as npt
+import matplotlib.pyplot as plt
 
 from zepid import load_sample_data
-from zepid.graphics import EffectMeasurePlot, functional_form_plot
+from zepid.graphics import (EffectMeasurePlot, functional_form_plot, roc, roc_curve, roc_auc, spaghetti_plot,
+                            binned_loess, binned_kde, export_figures)
 
 
 class TestForestPlot:  # referred to as EffectMeasurePlot in zepid
@@ -41,6 +45,34 @@ class TestForestPlot:  # referred to as EffectMeasurePlot in zepid
         assert p.linec == changes[2]
         assert p.pc == changes[3]
 
+    def test_table_text(self, plotter, data):
+        p = plotter(label=data[0], effect_measure=data[1], lcl=data[2], ucl=data[3])
+        est, ci = p._table_text(p.df, decimal=1)
+        assert list(est[:5]) == ['', '0.9', '', '', '1.22']
+        assert list(ci[:5]) == ['', '(0.8, 1.2)', '', '', '(0.80, 1.84)']
+        ax = p.plot()
+        assert ax.figure.axes[1].texts[1].get_text().split('\n')[1] == '0.94'
+        plt.close()
+
+    def test_from_results(self, plotter):
+        results = pd.DataFrame({'RiskRatio': [1.0, 1.5], 'RR_LCL': [1.0, 1.1], 'RR_UCL': [1.0, 2.0]},
+                               index=['Ref:0', '1'])
+        p = plotter.from_results(results, measure='RiskRatio')
+        assert list(p.df['study']) == ['Ref:0', '1']
+        npt.assert_allclose(p.df['UCL'], [1.0, 2.0])
+        assert p.em == 'RiskRatio'
+        with pytest.raises(ValueError):
+            plotter.from_results(results, measure='OddsRatio')
+
+    def test_to_pdf(self, plotter, tmpdir):
+        results = pd.DataFrame({'RiskRatio': np.linspace(0.5, 2, 95)})
+        results['RR_LCL'] = results['RiskRatio'] * 0.8
+        results['RR_UCL'] = results['RiskRatio'] * 1.25
+        path = str(tmpdir.join('forest.pdf'))
+        plotter.from_results(results, measure='RiskRatio').to_pdf(path, rows_per_page=40)
+        with open(path, 'rb') as f:
+            assert b'/Count 3' in f.read()
+
 
 class TestFunctionalFormPlot:
 
@@ -53,3 +85,195 @@ class TestFunctionalFormPlot:
     def test_error_outcome_type(self, data):
         with pytest.raises(ValueError):
             functional_form_plot(data, 'cd40', var='age0', outcome_type='categorical')
+
+    def test_loess_matches_lowess_of_binned_model(self, data):
+        # for binary outcomes, the LOESS curve smooths the predictions of the model with a category for each value
+        from statsmodels.nonparametric.smoothers_lowess import lowess
+        import statsmodels.api as sm
+        import statsmodels.formula.api as smf
+        df = data.dropna(subset=['age0', 'dead']).reset_index(drop=True)
+        plt.figure()
+        ax = functional_form_plot(df, outcome='dead', var='age0', discrete=True, model_results=False)
+        line = [l for l in ax.get_lines() if l.get_label() == 'LOESS'][0]
+        plt.close('all')
+        means = smf.glm('dead ~ C(age0)', df, family=sm.families.family.Binomial()).fit().fittedvalues
+        expected = np.unique(lowess(means, df['age0'], frac=0.4), axis=0)
+        npt.assert_allclose(line.get_xdata(), expected[:, 0])
+        npt.assert_allclose(line.get_ydata(), expected[:, 1], atol=1e-5)
+
+
+class TestBinnedLoess:
+
+    def test_matches_lowess(self):
+        from statsmodels.nonparametric.smoothers_lowess import lowess
+        np.random.seed(20)
+        x = np.random.randint(0, 60, size=1000).astype(float)
+        y = np.sin(x / 10) + np.random.normal(size=1000)
+        expected = np.unique(lowess(y, x, frac=0.4, it=0), axis=0)
+        curve = binned_loess(x, y, frac=0.4)
+        npt.assert_allclose(curve['x'], expected[:, 0])
+        npt.assert_allclose(curve['smoothed'], expected[:, 1], atol=1e-5)
+        assert curve['n'].sum() == 1000
+
+    def test_robustness_iterations(self):
+        from statsmodels.nonparametric.smoothers_lowess import lowess
+        np.random.seed(21)
+        x = np.random.randint(0, 60, size=777).astype(float)
+        y = np.sin(x / 10) + np.random.standard_t(2, size=777)
+        for it in [0, 3]:
+            expected = np.unique(lowess(y, x, frac=0.3, it=it), axis=0)
+            npt.assert_allclose(binned_loess(x, y, frac=0.3, it=it)['smoothed'], expected[:, 1], atol=1e-5)
+        with pytest.raises(ValueError):
+            binned_loess(x, y, it=-1)
+
+    def test_bins(self):
+        np.random.seed(20)
+        x = np.random.uniform(0, 10, size=100000)
+        y = np.random.binomial(1, 1 / (1 + np.exp(-(x - 5))))
+        curve = binned_loess(x, y, frac=0.3, bins=50)
+        assert curve.shape[0] == 50
+        assert (curve['lower'] < curve['smoothed']).all() and (curve['smoothed'] < curve['upper']).all()
+        npt.assert_allclose(curve['smoothed'], 1 / (1 + np.exp(-(curve['x'] - 5))), atol=0.03)
+
+    def test_error_missing(self):
+        with pytest.raises(ValueError):
+            binned_loess([1, 2, np.nan], [1, 0, 1])
+
+
+class TestBinnedKDE:
+
+    @pytest.fixture
+    def data(self):
+        np.random.seed(30)
+        return np.random.beta(2, 5, size=5000), np.random.uniform(size=5000)
+
+    def test_matches_gaussian_kde(self, data):
+        from scipy.stats import gaussian_kde
+        x = np.linspace(0, 1, 200)
+        for bw in ['scott', 'silverman', 0.2]:
+            npt.assert_allclose(binned_kde(values=data[0], bw_method=bw, x=x)[1],
+                                gaussian_kde(data[0], bw_method=bw)(x), atol=1e-4)
+        npt.assert_allclose(binned_kde(values=data[0], weights=data[1], x=x)[1],
+                            gaussian_kde(data[0], weights=data[1])(x), atol=1e-4)
+
+    def test_histogram(self, data):
+        from scipy.stats import gaussian_kde
+        counts, edges = np.histogram(data[0], bins=1000)
+        x, density = binned_kde(counts=counts, edges=edges)
+        npt.assert_allclose(np.trapz(density, x), 1)
+        npt.assert_allclose(np.interp(0.2, x, density), gaussian_kde(data[0])(0.2), rtol=1e-3)
+
+    def test_error_no_data(self):
+        with pytest.raises(ValueError):
+            binned_kde(counts=[1, 2, 3])
+
+
+class TestSpaghettiPlot:
+
+    @pytest.fixture
+    def data(self):
+        df = pd.DataFrame()
+        df['id'] = [3, 1, 1, 2, 3, 1, 3, 2]
+        df['t'] = [2, 1, 0, 0, 0, 2, 1, 1]
+        df['v'] = [5, 4, 3, 2, 1, 6, 7, 8]
+        return df
+
+    def test_one_line_per_id(self, data):
+        ax = spaghetti_plot(data, idvar='id', variable='v', time='t')
+        lines = ax.collections[0].get_segments()
+        assert len(lines) == 3
+        npt.assert_equal(lines[0], [[0, 3], [1, 4], [2, 6]])
+        npt.assert_equal(lines[2], [[0, 1], [1, 7], [2, 5]])
+        plt.close()
+
+    def test_sample(self, data):
+        ax = spaghetti_plot(data, idvar='id', variable='v', time='t', sample=2, alpha='auto', random_state=1)
+        assert len(ax.collections[0].get_segments()) == 2
+        plt.close()
+
+
+class TestROC:
+
+    @pytest.fixture
+    def data(self):
+        np.random.seed(101)
+        df = pd.DataFrame()
+        df['y'] = np.random.binomial(1, 0.4, size=200)
+        df['p'] = np.round(np.random.uniform(size=200) * 0.6 + 0.3 * df['y'], 2)
+        return df
+
+    def test_curve_matches_cutpoints(self, data):
+        curve = roc_curve(data, true='y', threshold='p')
+        values = np.unique(data['p'])
+        values = [values[-1] + 0.001] + list(reversed(values)) + [values[0] - 0.001]
+        npt.assert_allclose(curve['threshold'], values)
+        for v, se, fpr in zip(curve['threshold'], curve['sensitivity'], curve['fpr']):
+            prediction = data['p'] >= v
+            npt.assert_allclose(se, prediction[data['y'] == 1].mean())
+            npt.assert_allclose(fpr, prediction[data['y'] == 0].mean())
+
+    def test_auc_delong(self, data):
+        cases = np.asarray(data.loc[data['y'] == 1, 'p'])
+        controls = np.asarray(data.loc[data['y'] == 0, 'p'])
+        psi = (cases[:, None] > controls[None, :]) + 0.5 * (cases[:, None] == controls[None, :])
+        v10, v01 = psi.mean(axis=1), psi.mean(axis=0)
+        se = np.sqrt(np.var(v10, ddof=1) / cases.shape[0] + np.var(v01, ddof=1) / controls.shape[0])
+        r = roc_auc(data, true='y', threshold='p')
+        npt.assert_allclose(r['auc'], psi.mean())
+        npt.assert_allclose(r['se'], se)
+        curve = roc_curve(data, true='y', threshold='p')
+        npt.assert_allclose(r['auc'], np.trapz(curve['sensitivity'], curve['fpr']))
+
+    def test_downsample(self, data):
+        curve = roc_curve(data, true='y', threshold='p', points=20)
+        assert curve.shape[0] <= 20
+        npt.assert_allclose(curve.iloc[[0, -1]][['sensitivity', 'fpr']], [[0, 0], [1, 1]])
+
+    def test_error_true_values(self, data):
+        data['y'] = data['y'] * 2
+        with pytest.raises(ValueError):
+            roc_curve(data, true='y', threshold='p')
+
+
+class TestExportFigures:
+
+    @pytest.fixture
+    def data(self):
+        np.random.seed(101)
+        df = pd.DataFrame()
+        df['y'] = np.random.binomial(1, 0.4, size=200)
+        df['p'] = np.random.uniform(size=200) * 0.6 + 0.3 * df['y']
+        return df
+
+    @pytest.fixture
+    def forest(self):
+        return EffectMeasurePlot(label=['A', 'B', 'C'], effect_measure=[0.8, 1.1, 1.5], lcl=[0.6, 0.9, 1.2],
+                                 ucl=[1.0, 1.4, 1.9])
+
+    def test_draws_on_given_axes(self, data, forest):
+        plt.close('all')
+        fig, (ax1, ax2) = plt.subplots(1, 2)
+        ax = roc(data, true='y', threshold='p', youden_index=False, ax=ax1)
+        assert ax is ax1
+        forest.plot(ax=ax2)
+        assert len(fig.axes) == 3  # the effect measure plot and its table take the place of ax2
+        plt.close('all')
+
+    def test_export(self, data, forest, tmpdir):
+        plt.close('all')
+        specs = [{'plot': roc, 'args': (data, 'y', 'p'), 'kwargs': {'youden_index': False},
+                  'path': str(tmpdir.join('roc.png'))},
+                 {'plot': forest.plot, 'path': str(tmpdir.join('forest.pdf')), 'figsize': (6, 3)},
+                 {'plot': spaghetti_plot, 'kwargs': {'df': data.reset_index(), 'idvar': 'y', 'variable': 'p',
+                                                     'time': 'index'}, 'path': str(tmpdir.join('spaghetti.png'))}]
+        paths = export_figures(specs, processes=2)
+        assert paths == [spec['path'] for spec in specs]
+        with open(paths[0], 'rb') as f:
+            assert f.read(4) == b'\x89PNG'
+        with open(paths[1], 'rb') as f:
+            assert f.read(4) == b'%PDF'
+        assert plt.get_fignums() == []  # pyplot is not used
+
+    def test_error_spec(self, tmpdir):
+        with pytest.raises(ValueError):
+            export_figures([{'plot': roc}])
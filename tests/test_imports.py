@@ -0,0 +1,69 @@
+import os
+import sys
+import subprocess
+import pytest
+
+import zepid
+
+# Libraries that are slow to import, which should only be imported when they are needed
+heavy = ['pandas', 'matplotlib', 'statsmodels', 'patsy', 'scipy.stats']
+
+
+def run(code, *options):
+    """Runs code in a new Python process (so modules imported by other tests do not count) and returns its output"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.abspath(zepid.__file__)))
+    return subprocess.run([sys.executable] + list(options) + ['-c', code], env=env, check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+
+def imported(code):
+    """Heavy libraries imported by running code"""
+    out = run(code + '\nimport sys\nprint(" ".join(sys.modules))').stdout.split()
+    return [m for m in heavy if m in out]
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason='lazy loading requires Python 3.7 or later')
+class TestLazyImports:
+
+    def test_import_zepid(self):
+        assert imported('import zepid') == []
+
+    def test_import_calc(self):
+        assert imported('from zepid.calc import risk_ratio; risk_ratio(10, 20, 50, 50)') == []
+
+    def test_import_subpackages(self):
+        assert imported('import zepid.graphics, zepid.causal, zepid.sensitivity_analysis') == []
+
+    def test_import_datasets_and_sensitivity(self):
+        # loading data, and setting up bias analyses, needs neither SciPy nor matplotlib
+        out = run('from zepid import load_sample_data\n'
+                  'from zepid.datasets import TimeFixedCohort, TimeVaryCohort\n'
+                  'from zepid.sensitivity_analysis import MultipleBiasAnalysis, MonteCarloRR, StreamingSummary\n'
+                  'from zepid.sensitivity_analysis import trapezoidal, confounding_grid\n'
+                  'load_sample_data(False)\n'
+                  'import sys\nprint(" ".join(sys.modules))').stdout.split()
+        assert [m for m in out if m.split('.')[0] in ['scipy', 'matplotlib']] == []
+
+    def test_attributes_load(self):
+        assert imported('from zepid import RiskRatio') == ['pandas']
+        assert 'matplotlib' in imported('import zepid; zepid.graphics.roc')
+        assert 'statsmodels' in imported('import zepid; zepid.causal.ipw.IPTW')
+
+    def test_attributes_match(self):
+        from zepid.base import RiskRatio
+        from zepid.causal.ipw.IPTW import IPTW
+        from zepid.sensitivity_analysis.grid import confounding_grid
+        assert zepid.RiskRatio is RiskRatio
+        assert zepid.causal.ipw.IPTW is IPTW
+        assert zepid.sensitivity_analysis.confounding_grid is confounding_grid
+        assert 'load_sample_data' in dir(zepid)
+        with pytest.raises(AttributeError):
+            zepid.not_a_function
+
+    def test_import_time(self):
+        # -X importtime reports the microseconds spent importing each module. Importing zepid should take a small
+        # fraction of the seconds needed to import its dependencies
+        times = run('import zepid', '-X', 'importtime').stderr.splitlines()
+        total = [int(line.split('|')[1]) for line in times if line.split('|')[-1].strip() == 'zepid']
+        assert total[0] < 250000
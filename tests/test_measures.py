@@ -8,8 +8,10 @@ from scipy.stats import logistic
 import zepid as ze
 from zepid import (RiskRatio, RiskDifference, OddsRatio, NNT, IncidenceRateRatio, IncidenceRateDifference,
                    Sensitivity, Specificity, Diagnostics, interaction_contrast, interaction_contrast_ratio, spline,
-                   table1_generator)
+                   SplineBasis, table1_generator)
 from zepid.calc import sensitivity, specificity
+import zepid.base
+from zepid.base import _bootstrap_failures
 
 
 @pytest.fixture
@@ -338,6 +340,48 @@ class TestInteractionContrasts:
                                          ci='bootstrap', print_results=False)
         assert icr[1] < -0.4908 < icr[2]
 
+    def test_bootstrap_resample_and_processes(self, data_ic):
+        icr_w = interaction_contrast_ratio(data_ic, exposure='exp', outcome='y', modifier='mod', ci='bootstrap',
+                                           b_sample=100, seed=2, print_results=False)
+        icr_i = interaction_contrast_ratio(data_ic, exposure='exp', outcome='y', modifier='mod', ci='bootstrap',
+                                           b_sample=100, seed=2, resample='index', print_results=False)
+        icr_p = interaction_contrast_ratio(data_ic, exposure='exp', outcome='y', modifier='mod', ci='bootstrap',
+                                           b_sample=100, seed=2, processes=2, print_results=False)
+        for icr in [icr_w, icr_i, icr_p]:
+            assert icr[1] < -0.4908 < icr[2]
+        # same seed and processes gives the same replicates
+        npt.assert_allclose(icr_w, interaction_contrast_ratio(data_ic, exposure='exp', outcome='y', modifier='mod',
+                                                              ci='bootstrap', b_sample=100, seed=2,
+                                                              print_results=False))
+        with pytest.raises(ValueError):
+            interaction_contrast_ratio(data_ic, exposure='exp', outcome='y', modifier='mod', ci='bootstrap',
+                                       resample='rows', print_results=False)
+
+    def test_interaction_contrast_bootstrap_ci(self, data_ic):
+        ic = interaction_contrast(data_ic, exposure='exp', outcome='y', modifier='mod', ci='bootstrap', b_sample=100,
+                                  seed=3, print_results=True)
+        npt.assert_allclose(np.round(ic[0], 4), -0.1009)
+        assert ic[1] < -0.1009 < ic[2]
+
+    def test_bootstrap_processes_reproducible(self, data_ic):
+        ics = [interaction_contrast(data_ic, exposure='exp', outcome='y', modifier='mod', ci='bootstrap', b_sample=50,
+                                    seed=5, processes=2, print_results=False) for i in range(2)]
+        npt.assert_equal(ics[0], ics[1])
+
+    def test_bootstrap_all_replicates_failed(self, data_ic, monkeypatch):
+        monkeypatch.setattr(zepid.base, '_bootstrap_glm_fits',
+                            lambda job: np.full((job[6], job[1].shape[1]), np.nan))
+        with pytest.raises(ValueError, match='All bootstrap replicates'):
+            interaction_contrast(data_ic, exposure='exp', outcome='y', modifier='mod', ci='bootstrap', b_sample=20,
+                                 seed=5, print_results=False)
+
+    def test_bootstrap_failures(self):
+        boot = np.array([[1., 2.], [np.nan, np.nan], [3., 4.]])
+        with pytest.warns(UserWarning, match='1 of 3'):
+            assert _bootstrap_failures(boot, 3) == 1
+        with pytest.raises(ValueError):
+            _bootstrap_failures(np.full((2, 2), np.nan), 2)
+
 
 class TestSplines:
 
@@ -475,6 +519,44 @@ class TestSplines:
                                                       {'rsp': (20.0 - 5.0)**2 - (20.0 - 16.0)**2}])
         pdt.assert_series_equal(spline_data['rsp'], expected_splines['rsp'])
 
+    def test_missing_values(self, spline_data):
+        spline_data.loc[2, 'v'] = np.nan
+        sp = spline(spline_data, 'v', n_knots=2, knots=[5, 16], restricted=True)
+        npt.assert_equal(np.asarray(sp['rspline0']), [0, 0, np.nan, 10, 11])
+
+    def test_basis_matches_spline(self):
+        df = ze.load_sample_data(False)
+        sb = SplineBasis(['age0', 'cd40'], n_knots=4, term=3, restricted=True).fit(df)
+        X = sb.transform(df)
+        assert sb.columns == ['age0_rspline0', 'age0_rspline1', 'age0_rspline2',
+                              'cd40_rspline0', 'cd40_rspline1', 'cd40_rspline2']
+        npt.assert_allclose(X[:, :3], spline(df, 'age0', n_knots=4, term=3, restricted=True))
+        npt.assert_allclose(X[:, 3:], spline(df, 'cd40', n_knots=4, term=3, restricted=True))
+        npt.assert_allclose(sb.knots['age0'], df['age0'].quantile([0.05, 0.35, 0.65, 0.95]))
+
+    def test_basis_chunks(self):
+        df = ze.load_sample_data(False)
+        sb = SplineBasis(['age0', 'cd40'], n_knots=3, knots={'age0': [30, 40, 50]}).fit(df)
+        X = np.zeros((df.shape[0], 1 + len(sb.columns)), dtype=np.float32)
+        for i in range(0, df.shape[0], 100):
+            sb.transform(df.iloc[i:i + 100], out=X[i:i + 100, 1:])
+        npt.assert_allclose(X[:, 1:], sb.transform(df), rtol=1e-6)
+        npt.assert_equal(X[:, 0], 0)
+        npt.assert_allclose(sb.transform({'age0': [35., 45.], 'cd40': [0, 0]})[:, :3], [[5, 0, 0], [15, 5, 0]])
+
+    def test_basis_array(self, spline_data):
+        sb = SplineBasis('v', n_knots=2, knots={'v': [5, 16]}, term=2, restricted=True)
+        npt.assert_allclose(sb.transform(np.asarray(spline_data['v'])),
+                            spline(spline_data, 'v', n_knots=2, knots=[5, 16], term=2, restricted=True))
+
+    def test_basis_errors(self, spline_data):
+        with pytest.raises(ValueError):
+            SplineBasis('v', n_knots=2).transform(spline_data)
+        with pytest.raises(ValueError):
+            SplineBasis('v', n_knots=3, knots={'w': [1, 2, 3]})
+        with pytest.raises(ValueError):
+            SplineBasis('v', n_knots=2).fit(spline_data).transform(spline_data, out=np.empty((5, 3)))
+
 
 class TestTable1:
 
@@ -511,6 +593,43 @@ class TestTable1:
                              continuous_measure='mean', strat_by='exp')
         assert isinstance(t, type(pd.DataFrame()))
 
+    def test_stratified_values(self, data):
+        data['strata'] = np.arange(data.shape[0]) % 5
+        data.loc[::7, 'continuous'] = np.nan
+        data.loc[::11, 'y'] = np.nan
+        t = table1_generator(data, cols=['y', 'continuous'], variable_type=['category', 'continuous'],
+                             strat_by='strata')
+        for j in range(5):
+            sf = data.loc[data['strata'] == j]
+            assert t.loc[('TOTAL', ''), ('strata=' + str(j), 'n')] == sf.shape[0]
+            assert t.loc[('y', 1), ('strata=' + str(j), 'n')] == np.sum(sf['y'] == 1)
+            npt.assert_allclose(t.loc[('y', 1), ('strata=' + str(j), '% / IQR')], np.mean(sf['y'].dropna() == 1))
+            assert t.loc[('y', 'Missing'), ('strata=' + str(j), 'n')] == sf['y'].isnull().sum()
+            npt.assert_allclose(t.loc[('continuous', ''), ('strata=' + str(j), 'n')], sf['continuous'].median())
+            npt.assert_allclose(t.loc[('continuous', ''), ('strata=' + str(j), '% / IQR')],
+                                np.percentile(sf['continuous'].dropna(), [25, 75]).round(3))
+            assert t.loc[('continuous', 'Missing'), ('strata=' + str(j), 'n')] == sf['continuous'].isnull().sum()
+
+    def test_mean_sd(self, data):
+        t = table1_generator(data, cols=['continuous'], variable_type=['continuous'], continuous_measure='mean',
+                             strat_by='exp')
+        for j in [0, 1]:
+            sf = data.loc[data['exp'] == j, 'continuous']
+            npt.assert_allclose(t.loc[('continuous', ''), ('exp=' + str(j), 'n')], np.mean(sf))
+            npt.assert_allclose(t.loc[('continuous', ''), ('exp=' + str(j), '% / SD')], np.round(np.std(sf), 3))
+
+    def test_approximate_quantiles(self, data):
+        exact = table1_generator(data, cols=['continuous'], variable_type=['continuous'], strat_by='exp')
+        approx = table1_generator(data, cols=['continuous'], variable_type=['continuous'], strat_by='exp',
+                                  quantile_bins=1000)
+        width = (data['continuous'].max() - data['continuous'].min()) / 1000
+        for j in [0, 1]:
+            c = ('exp=' + str(j), 'n')
+            npt.assert_allclose(approx.loc[('continuous', ''), c], exact.loc[('continuous', ''), c], atol=width)
+            c = ('exp=' + str(j), '% / IQR')
+            npt.assert_allclose(approx.loc[('continuous', ''), c], exact.loc[('continuous', ''), c],
+                                atol=width + 0.001)
+
     def test_catch_different_lengths(self, data):
         with pytest.raises(ValueError):
             table1_generator(data, cols=['exp', 'mod', 'y', 'continuous'],
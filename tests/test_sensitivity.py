@@ -1,8 +1,12 @@
 import pytest
+from functools import partial
 import numpy as np
 import numpy.testing as npt
+import matplotlib.pyplot as plt
 
-from zepid.sensitivity_analysis import trapezoidal, MonteCarloRR
+from zepid.sensitivity_analysis import (trapezoidal, triangular, lognormal_ratio, bounded_beta, MonteCarloRR,
+                                       MultipleBiasAnalysis, StreamingSummary, QuasiRandom, confounding_grid,
+                                       confounding_tipping_point)
 
 
 class TestTrapezoidalDistribution:
@@ -16,6 +20,50 @@ class TestTrapezoidalDistribution:
         assert np.max(n) <= 1.8
 
 
+    def test_single_draws_match_array(self):
+        np.random.seed(31)
+        singles = [trapezoidal(mini=0.9, mode1=1.1, mode2=1.7, maxi=1.8) for i in range(100)]
+        np.random.seed(31)
+        npt.assert_allclose(trapezoidal(mini=0.9, mode1=1.1, mode2=1.7, maxi=1.8, size=100), singles)
+
+    def test_generator(self):
+        n1 = trapezoidal(mini=0.9, mode1=1.1, mode2=1.7, maxi=1.8, size=100, random_state=np.random.default_rng(5))
+        n2 = trapezoidal(mini=0.9, mode1=1.1, mode2=1.7, maxi=1.8, size=100, random_state=5)
+        npt.assert_equal(n1, n2)
+
+    def test_error_size(self):
+        with pytest.raises(ValueError):
+            trapezoidal(mini=0.9, mode1=1.1, mode2=1.7, maxi=1.8, size=10.5)
+
+    def test_error_parameters(self):
+        with pytest.raises(ValueError):
+            trapezoidal(mini=0.9, mode1=1.7, mode2=1.1, maxi=1.8)
+
+
+class TestBiasDistributions:
+
+    def test_triangular_bounds(self):
+        n = triangular(mini=0.9, mode=1.2, maxi=1.6, size=10000, random_state=1)
+        assert np.min(n) >= 0.9
+        assert np.max(n) <= 1.6
+
+    def test_lognormal_ratio_limits(self):
+        n = lognormal_ratio(lower=1.1, upper=2.5, size=100000, random_state=1)
+        npt.assert_allclose(np.percentile(n, [2.5, 97.5]), [1.1, 2.5], rtol=0.02)
+
+    def test_bounded_beta_bounds(self):
+        n = bounded_beta(alpha=20, beta=5, mini=0.7, maxi=0.95, size=10000, random_state=1)
+        assert np.min(n) >= 0.7
+        assert np.max(n) <= 0.95
+        npt.assert_allclose(np.mean(n), 0.7 + 0.25 * 20 / 25, rtol=0.01)
+
+    def test_error_parameters(self):
+        with pytest.raises(ValueError):
+            lognormal_ratio(lower=0, upper=2.5)
+        with pytest.raises(ValueError):
+            bounded_beta(alpha=-1, beta=5)
+
+
 class TestMonteCarloBiasAnalysis:
 
     @pytest.fixture
@@ -39,3 +87,246 @@ class TestMonteCarloBiasAnalysis:
     def test_percentiles_rr(self, mcba):
         m = np.percentile(mcba.corrected_RR, q=[2.5, 97.5])
         npt.assert_allclose(m, [0.729893, 0.875549], rtol=1e-5)
+
+
+    def test_summary_exact_percentiles(self, mcba, capsys):
+        mcba.summary()
+        out = capsys.readouterr().out
+        assert 'Median corrected Risk Ratio:  ' + str(np.round(np.median(mcba.corrected_RR), 3)) in out
+        assert 'relative error' not in out
+
+    def test_plot_on_given_axes(self, mcba):
+        plt.close('all')
+        fig, (ax1, ax2) = plt.subplots(1, 2)
+        assert mcba.plot(ax=ax2) is ax2
+        assert len(ax1.lines) == 0 and len(ax2.lines) == 1
+        plt.close('all')
+
+    @pytest.fixture
+    def mcrr_functions(self):
+        mcrr = MonteCarloRR(observed_RR=0.73322, sample=16384)
+        mcrr.confounder_RR_distribution(partial(trapezoidal, 0.9, 1.1, 1.7, 1.8))
+        mcrr.prop_confounder_exposed(partial(trapezoidal, 0.25, 0.28, 0.32, 0.35))
+        mcrr.prop_confounder_unexposed(partial(trapezoidal, 0.55, 0.58, 0.62, 0.65))
+        return mcrr
+
+    def test_mc_error(self, mcba):
+        assert list(mcba.mc_error.index) == [2.5, 25, 50, 75, 97.5]
+        assert (mcba.mc_error > 0).all()
+
+    def test_distribution_functions(self, mcrr_functions):
+        mcrr_functions.fit(replicates=16, random_state=4)
+        assert len(mcrr_functions.corrected_RR) == 16384
+        npt.assert_allclose(np.median(mcrr_functions.corrected_RR), 0.806774, rtol=0.01)
+
+    def test_distribution_functions_default_random_state(self, mcrr_functions):
+        np.random.seed(8)
+        mcrr_functions.fit()
+        expected = mcrr_functions.corrected_RR.copy()
+        np.random.seed(8)
+        mcrr_functions.fit()
+        npt.assert_equal(mcrr_functions.corrected_RR, expected)
+        npt.assert_allclose(np.median(expected), 0.806774, rtol=0.01)
+
+    def test_quasi_random_more_precise(self, mcrr_functions):
+        mcrr_functions.fit(method='random', replicates=16, random_state=4)
+        random_error = mcrr_functions.mc_error
+        mcrr_functions.fit(method='sobol', replicates=16, random_state=4)
+        assert (mcrr_functions.mc_error < random_error).all()
+        npt.assert_allclose(np.median(mcrr_functions.corrected_RR), 0.806774, rtol=0.01)
+
+    def test_error_quasi_random_arrays(self, mcba):
+        with pytest.raises(ValueError):
+            mcba.fit(method='sobol')
+
+
+class TestMultipleBiasAnalysis:
+
+    def test_error_cells(self):
+        with pytest.raises(ValueError):
+            MultipleBiasAnalysis(a=40, b=60, c=0, d=80)
+
+    def test_fixed_exposure_misclassification(self):
+        mba = MultipleBiasAnalysis(a=40, b=60, c=20, d=80)
+        mba.exposure_misclassification(sensitivity_cases=0.9, specificity_cases=0.95)
+        mba.fit(draws=1000, random_error=False)
+        a, c = 37 / 0.85, 60 - 37 / 0.85
+        b, d = 53 / 0.85, 140 - 53 / 0.85
+        npt.assert_allclose(mba.quantiles.loc['systematic error'], (a / (a + b)) / (c / (c + d)), rtol=1e-4)
+
+    def test_confounder_matches_monte_carlo_rr(self):
+        rng = np.random.default_rng(71)
+        mcrr = MonteCarloRR(observed_RR=2, sample=100000)
+        mcrr.confounder_RR_distribution(trapezoidal(0.9, 1.1, 1.7, 1.8, size=100000, random_state=rng))
+        mcrr.prop_confounder_exposed(trapezoidal(0.25, 0.28, 0.32, 0.35, size=100000, random_state=rng))
+        mcrr.prop_confounder_unexposed(trapezoidal(0.55, 0.58, 0.62, 0.65, size=100000, random_state=rng))
+        mcrr.fit()
+
+        mba = MultipleBiasAnalysis(a=40, b=60, c=20, d=80)
+        mba.unmeasured_confounder(rr_confounder=partial(trapezoidal, 0.9, 1.1, 1.7, 1.8),
+                                  prop_exposed=partial(trapezoidal, 0.25, 0.28, 0.32, 0.35),
+                                  prop_unexposed=partial(trapezoidal, 0.55, 0.58, 0.62, 0.65))
+        mba.fit(draws=100000, random_error=False, replicates=1, random_state=71)
+        npt.assert_allclose(mba.quantiles.loc['systematic error'],
+                            np.percentile(mcrr.corrected_RR, q=[2.5, 25, 50, 75, 97.5]), rtol=1e-4)
+
+    def test_chunks_and_random_error(self):
+        mba = MultipleBiasAnalysis(a=40, b=60, c=20, d=80)
+        mba.outcome_misclassification(sensitivity_exposed=partial(triangular, 0.8, 0.9, 1.0),
+                                      specificity_exposed=partial(triangular, 0.95, 0.98, 1.0))
+        mba.selection_bias(0.8, 0.7, 0.7, 0.6)
+        mba.fit(draws=50000, chunk_size=7000, random_state=3)
+        assert mba.n_draws == 50000
+        q = mba.quantiles
+        assert list(q.index) == ['systematic error', 'total error']
+        # random error widens the interval
+        assert q.loc['total error', 2.5] < q.loc['systematic error', 2.5]
+        assert q.loc['total error', 97.5] > q.loc['systematic error', 97.5]
+
+    def test_default_random_state(self):
+        # without random_state, the draws come from numpy's global random state
+        mba = MultipleBiasAnalysis(a=40, b=60, c=20, d=80)
+        mba.unmeasured_confounder(rr_confounder=partial(trapezoidal, 0.9, 1.1, 1.7, 1.8),
+                                  prop_exposed=partial(trapezoidal, 0.25, 0.28, 0.32, 0.35),
+                                  prop_unexposed=partial(trapezoidal, 0.55, 0.58, 0.62, 0.65))
+        np.random.seed(12)
+        mba.fit(draws=5000)
+        q = mba.quantiles
+        np.random.seed(12)
+        mba.fit(draws=5000)
+        npt.assert_equal(mba.quantiles.values, q.values)
+
+    def test_plot_on_given_axes(self):
+        mba = MultipleBiasAnalysis(a=40, b=60, c=20, d=80)
+        mba.selection_bias(0.8, 0.7, 0.7, 0.6)
+        mba.fit(draws=5000, random_state=3)
+        plt.close('all')
+        fig, (ax1, ax2) = plt.subplots(1, 2)
+        assert mba.plot(ax=ax1) is ax1
+        assert mba.plot(total_error=False, ax=ax2) is ax2
+        assert len(ax1.lines) == 1 and len(ax2.lines) == 1
+        plt.close('all')
+
+    def test_quasi_random(self):
+        mba = MultipleBiasAnalysis(a=40, b=60, c=20, d=80)
+        mba.exposure_misclassification(sensitivity_cases=partial(trapezoidal, 0.75, 0.85, 0.95, 1.0),
+                                       specificity_cases=partial(triangular, 0.8, 0.9, 0.95))
+        mba.fit(draws=2**14, replicates=16, method='random', random_state=2)
+        random_error = mba.mc_error
+        mba.fit(draws=2**14, replicates=16, method='sobol', random_state=2)
+        assert mba.mc_error.shape == (2, 5)
+        assert (mba.mc_error.loc['systematic error'] < random_error.loc['systematic error']).all()
+
+
+class TestQuasiRandom:
+
+    def test_dimensions_evenly_spread(self):
+        qr = QuasiRandom(dimensions=2, seed=3)
+        u1, u2 = qr.uniform(size=1024), qr.uniform(size=1024)
+        # each of the 16 x 16 squares of the unit square holds the same number of points
+        counts = np.histogram2d(u1, u2, bins=16, range=[[0, 1], [0, 1]])[0]
+        npt.assert_equal(counts, 4)
+
+    def test_distributions(self):
+        qr = QuasiRandom(dimensions=4, method='halton', seed=3)
+        n = trapezoidal(mini=0.9, mode1=1.1, mode2=1.7, maxi=1.8, size=1000, random_state=qr)
+        assert 0.9 <= np.min(n) and np.max(n) <= 1.8
+        n = triangular(mini=0.9, mode=1.2, maxi=1.6, size=1000, random_state=qr)
+        assert 0.9 <= np.min(n) and np.max(n) <= 1.6
+        npt.assert_allclose(np.mean(n), (0.9 + 1.2 + 1.6) / 3, rtol=1e-3)
+        n = lognormal_ratio(lower=1.1, upper=2.5, size=1000, random_state=qr)
+        npt.assert_allclose(np.median(n), np.sqrt(1.1 * 2.5), rtol=1e-2)
+        n = bounded_beta(alpha=20, beta=5, mini=0.7, maxi=0.95, size=1000, random_state=qr)
+        npt.assert_allclose(np.mean(n), 0.9, rtol=1e-3)
+
+    def test_error_block_size(self):
+        qr = QuasiRandom(dimensions=2)
+        qr.uniform(size=128)
+        with pytest.raises(ValueError):
+            qr.uniform(size=64)
+
+    def test_error_method(self):
+        with pytest.raises(ValueError):
+            QuasiRandom(dimensions=2, method='latin')
+
+
+class TestConfoundingGrid:
+
+    def test_grid_matches_formula(self):
+        rrc, p1, p0 = np.linspace(1, 3, 5), np.linspace(0.1, 0.5, 3), np.linspace(0.1, 0.5, 4)
+        grid = confounding_grid(observed_RR=[[0.73, 0.5, 1.1], [1.4, 1.1, 1.8]], rr_confounder=rrc,
+                                prop_exposed=p1, prop_unexposed=p0)
+        assert grid.shape == (2, 3, 5, 3, 4)
+        npt.assert_allclose(grid[1, 0, 2, 1, 3], 1.4 / ((p1[1]*(rrc[2]-1)+1) / (p0[3]*(rrc[2]-1)+1)))
+        # no confounding when the proportions are equal or RRc is 1
+        npt.assert_allclose(grid[:, :, 0], np.array([[0.73, 0.5, 1.1], [1.4, 1.1, 1.8]])[:, :, None, None]
+                            * np.ones((3, 4)))
+
+    def test_tipping_point(self):
+        p = np.linspace(0.05, 0.95, 19)
+        tip = confounding_tipping_point(lower=[1.2, 0.5, 0.8], upper=[2.1, 0.9, 1.3], prop_exposed=p,
+                                        prop_unexposed=p)
+        assert tip.shape == (3, 19, 19)
+        # corrected limit closest to the null is 1 at the tipping point
+        for k, limit in enumerate([1.2, 0.9]):
+            i, j = 15, 2
+            grid = confounding_grid(limit, tip[k, i, j], p[i], p[j])
+            npt.assert_allclose(grid.ravel(), 1)
+        npt.assert_equal(tip[2], 1)
+        # equal proportions can never remove the association
+        assert np.isnan(np.diag(tip[0])).all()
+
+    def test_error_parameters(self):
+        with pytest.raises(ValueError):
+            confounding_grid(1.5, rr_confounder=[0, 1], prop_exposed=0.2, prop_unexposed=0.1)
+        with pytest.raises(ValueError):
+            confounding_grid(1.5, rr_confounder=2, prop_exposed=1.2, prop_unexposed=0.1)
+        with pytest.raises(ValueError):
+            confounding_tipping_point(lower=1.5, upper=1.2, prop_exposed=0.2, prop_unexposed=0.1)
+
+
+class TestStreamingSummary:
+
+    @pytest.fixture
+    def values(self):
+        return np.random.default_rng(9).lognormal(mean=0.2, sigma=0.5, size=200000)
+
+    def test_quantiles_within_accuracy(self, values):
+        s = StreamingSummary(relative_accuracy=0.0001)
+        for chunk in np.array_split(values, 7):
+            s.update(chunk)
+        q = [2.5, 25, 50, 75, 97.5]
+        npt.assert_allclose(s.quantile(q), np.percentile(values, q), rtol=0.0005)
+        npt.assert_allclose(s.mean(), np.mean(values))
+        assert s.count == values.shape[0]
+
+    def test_merge(self, values):
+        whole = StreamingSummary()
+        whole.update(values)
+        first, second = StreamingSummary(), StreamingSummary()
+        first.update(values[:50000])
+        second.update(values[50000:])
+        first.merge(second)
+        npt.assert_equal(first.counts, whole.counts)
+        npt.assert_allclose(first.quantile([2.5, 50, 97.5]), whole.quantile([2.5, 50, 97.5]))
+
+    def test_error_merge_different_accuracy(self):
+        with pytest.raises(ValueError):
+            StreamingSummary(relative_accuracy=0.001).merge(StreamingSummary(relative_accuracy=0.01))
+
+    def test_error_nonpositive(self):
+        with pytest.raises(ValueError):
+            StreamingSummary().update([1.2, 0.])
+
+    def test_warn_outside_range(self, values):
+        s = StreamingSummary(min_value=0.5, max_value=2)
+        s.update(values)
+        with pytest.warns(UserWarning):
+            s.quantile([0.1, 99.9])
+
+    def test_histogram(self, values):
+        s = StreamingSummary()
+        s.update(values)
+        counts, edges = s.histogram(bins=50)
+        assert np.sum(counts) == values.shape[0]
+        npt.assert_allclose([edges[0], edges[-1]], [np.min(values), np.max(values)])
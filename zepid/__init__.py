@@ -34,16 +34,16 @@ Sensitivity Analyses:
 
 See http://zepid.readthedocs.io/en/latest/ for a full guide through all the package features
 """
-from .base import (RiskRatio, RiskDifference, NNT, OddsRatio, IncidenceRateRatio, IncidenceRateDifference, Sensitivity,
-                   Specificity, Diagnostics, interaction_contrast, interaction_contrast_ratio, spline, table1_generator)
-from .datasets import (load_sample_data, load_ewing_sarcoma_data, load_gvhd_data, load_sciatica_data,
-                       load_leukemia_data, load_longitudinal_data, load_binge_drinking_data, load_case_control_data)
-
-import zepid.calc
-import zepid.graphics
-import zepid.causal.gformula
-import zepid.causal.ipw
-import zepid.causal.doublyrobust
-import zepid.sensitivity_analysis
-
+from ._lazy import attach
 from .version import __version__
+
+# Subpackages and their contents are imported when first used, so importing zepid is quick
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    submodules=['base', 'calc', 'causal', 'datasets', 'graphics', 'sensitivity_analysis'],
+    attributes={'base': ['RiskRatio', 'RiskDifference', 'NNT', 'OddsRatio', 'IncidenceRateRatio',
+                         'IncidenceRateDifference', 'Sensitivity', 'Specificity', 'Diagnostics', 'interaction_contrast',
+                         'interaction_contrast_ratio', 'spline', 'SplineBasis', 'table1_generator'],
+                'datasets': ['load_sample_data', 'load_ewing_sarcoma_data', 'load_gvhd_data', 'load_sciatica_data',
+                             'load_leukemia_data', 'load_longitudinal_data', 'load_binge_drinking_data',
+                             'load_case_control_data']})
@@ -0,0 +1,56 @@
+"""Lazy loading of the zepid subpackages and their contents. Importing zepid only imports a subpackage (and the
+libraries it uses, like statsmodels and matplotlib) when one of its attributes is first used, following PEP 562. On
+Python versions before 3.7, which do not support module __getattr__, everything is imported at once instead
+"""
+import sys
+import importlib
+
+
+def attach(package, submodules=(), attributes=None):
+    """Sets up lazy loading for a package. Returns the __getattr__, __dir__, and __all__ for the package __init__
+
+    Parameters
+    ------------
+    package : str
+        Name of the package, __name__ in the package __init__
+    submodules : list, optional
+        Submodules (or subpackages) to import when they are first used
+    attributes : dict, optional
+        Dictionary of submodule names and the list of names each provides. The submodule is imported when one of the
+        names is first used
+
+    Returns
+    ------------
+    tuple
+        The __getattr__ function, __dir__ function, and __all__ list of the package
+
+    Examples
+    ------------
+    In the __init__ of a package
+
+    >>>from zepid._lazy import attach
+    >>>__getattr__, __dir__, __all__ = attach(__name__, submodules=['graphics'], attributes={'base': ['RiskRatio']})
+    """
+    submodules = set(submodules)
+    attributes = {} if attributes is None else attributes
+    provided_by = {name: module for module, names in attributes.items() for name in names}
+    __all__ = sorted(submodules | set(provided_by))
+
+    def __getattr__(name):
+        if name in submodules:
+            value = importlib.import_module(package + '.' + name)
+        elif name in provided_by:
+            value = getattr(importlib.import_module(package + '.' + provided_by[name]), name)
+        else:
+            raise AttributeError('module ' + repr(package) + ' has no attribute ' + repr(name))
+        setattr(sys.modules[package], name, value)  # later uses skip __getattr__
+        return value
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[package])) | set(__all__))
+
+    if sys.version_info < (3, 7):
+        for name in __all__:
+            __getattr__(name)
+
+    return __getattr__, __dir__, __all__
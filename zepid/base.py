@@ -2,15 +2,11 @@ import warnings
 import math
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from scipy.stats import norm
-import statsmodels.api as sm
-import statsmodels.formula.api as smf
-from statsmodels.genmod.families import links
 from tabulate import tabulate
 
 from zepid.calc.utils import (risk_ci, incidence_rate_ci, risk_ratio, risk_difference, number_needed_to_treat,
-                              odds_ratio, incidence_rate_difference, incidence_rate_ratio, sensitivity, specificity)
+                              odds_ratio, incidence_rate_difference, incidence_rate_ratio, sensitivity, specificity,
+                              normal_ppf)
 
 
 #########################################################################################################
@@ -180,7 +176,7 @@ class RiskRatio:
         print('Missing E&D: ', self._missing_ed)
         print('======================================================================')
 
-    def plot(self, measure='risk_ratio', scale='linear', center=1, **errorbar_kwargs):
+    def plot(self, measure='risk_ratio', scale='linear', center=1, ax=None, **errorbar_kwargs):
         """Plot the risk ratios or the risks along with their corresponding confidence intervals. This option is an
         alternative to summary(), which displays results in a table format.
 
@@ -195,6 +191,8 @@ class RiskRatio:
         center : str, optional
             Sets a reference line. For the risk ratio, the reference line defaults to 1. For risks, no reference line is
             displayed.
+        ax : matplotlib axes, optional
+            Axes to draw on. Default is None, which draws on the current axes of pyplot
         errorbar_kwargs: add additional kwargs to be passed to the plotting function ``matplotlib.errorbar``. See defaults here:
             https://matplotlib.org/api/_as_gen/matplotlib.pyplot.errorbar.html
 
@@ -205,14 +203,14 @@ class RiskRatio:
         if measure == 'risk_ratio':
             ax = _plotter(estimate=self.results['RiskRatio'], lcl=self.results['RR_LCL'], ucl=self.results['RR_UCL'],
                           labels=self.results.index,
-                          center=center, **errorbar_kwargs)
+                          center=center, ax=ax, **errorbar_kwargs)
             if scale == 'log':
                 ax.set_xscale('log')
             ax.set_title('Risk Ratio')
         elif measure == 'risk':
             ax = _plotter(estimate=self.results['Risk'], lcl=self.results['Risk_LCL'], ucl=self.results['Risk_UCL'],
                           labels=self.results.index,
-                          center=np.nan, **errorbar_kwargs)
+                          center=np.nan, ax=ax, **errorbar_kwargs)
             ax.set_title('Risk')
             ax.set_xlim([0, 1])
         else:
@@ -383,7 +381,7 @@ class RiskDifference:
         print('Missing E&D: ', self._missing_ed)
         print('======================================================================')
 
-    def plot(self, measure='risk_difference', center=0, **errorbar_kwargs):
+    def plot(self, measure='risk_difference', center=0, ax=None, **errorbar_kwargs):
         """Plot the risk differences or the risks along with their corresponding confidence intervals. This option is an
         alternative to summary(), which displays results in a table format.
 
@@ -396,6 +394,8 @@ class RiskDifference:
         center : str, optional
             Sets a reference line. For the risk difference, the reference line defaults to 0. For risks, no reference
             line is displayed.
+        ax : matplotlib axes, optional
+            Axes to draw on. Default is None, which draws on the current axes of pyplot
         errorbar_kwargs: add additional kwargs to be passed to the plotting function ``matplotlib.errorbar``. See defaults here:
             https://matplotlib.org/api/_as_gen/matplotlib.pyplot.errorbar.html
 
@@ -406,12 +406,12 @@ class RiskDifference:
         if measure == 'risk_difference':
             ax = _plotter(estimate=self.results['RiskDifference'], lcl=self.results['RD_LCL'],
                           ucl=self.results['RD_UCL'], labels=self.results.index,
-                          center=center, **errorbar_kwargs)
+                          center=center, ax=ax, **errorbar_kwargs)
             ax.set_title('Risk Difference')
         elif measure == 'risk':
             ax = _plotter(estimate=self.results['Risk'], lcl=self.results['Risk_LCL'], ucl=self.results['Risk_UCL'],
                           labels=self.results.index,
-                          center=np.nan, **errorbar_kwargs)
+                          center=np.nan, ax=ax, **errorbar_kwargs)
             ax.set_title('Risk')
             ax.set_xlim([0, 1])
         else:
@@ -719,7 +719,7 @@ class OddsRatio:
         print('Missing E&D: ', self._missing_ed)
         print('======================================================================')
 
-    def plot(self, scale='linear', center=1, **errorbar_kwargs):
+    def plot(self, scale='linear', center=1, ax=None, **errorbar_kwargs):
         """Plot the odds ratios along with their corresponding confidence intervals. This option is an
         alternative to summary(), which displays results in a table format.
 
@@ -729,6 +729,8 @@ class OddsRatio:
             Scale for the x-axis. Default is a linear scale. A log-scale can be requested by setting scale='log'
         center : str, optional
             Sets a reference line. The reference line defaults to 1.
+        ax : matplotlib axes, optional
+            Axes to draw on. Default is None, which draws on the current axes of pyplot
         errorbar_kwargs: add additional kwargs to be passed to the plotting function ``matplotlib.errorbar``. See defaults here:
             https://matplotlib.org/api/_as_gen/matplotlib.pyplot.errorbar.html
 
@@ -738,7 +740,7 @@ class OddsRatio:
         """
         ax = _plotter(estimate=self.results['OddsRatio'], lcl=self.results['OR_LCL'], ucl=self.results['OR_UCL'],
                       labels=self.results.index,
-                      center=center, **errorbar_kwargs)
+                      center=center, ax=ax, **errorbar_kwargs)
         if scale == 'log':
             ax.set_xscale('log')
         ax.set_title('Odds Ratio')
@@ -912,7 +914,7 @@ class IncidenceRateRatio:
         print('Missing T:   ', self._missing_t)
         print('======================================================================')
 
-    def plot(self, measure='incidence_rate_ratio', scale='linear', center=1, **errorbar_kwargs):
+    def plot(self, measure='incidence_rate_ratio', scale='linear', center=1, ax=None, **errorbar_kwargs):
         """Plot the risk ratios or the risks along with their corresponding confidence intervals. This option is an
         alternative to summary(), which displays results in a table format.
 
@@ -928,6 +930,8 @@ class IncidenceRateRatio:
         center : str, optional
             Sets a reference line. For the incidence rate ratio, the reference line defaults to 1. For incidence rates,
             no reference line is displayed.
+        ax : matplotlib axes, optional
+            Axes to draw on. Default is None, which draws on the current axes of pyplot
         errorbar_kwargs: add additional kwargs to be passed to the plotting function ``matplotlib.errorbar``. See defaults here:
             https://matplotlib.org/api/_as_gen/matplotlib.pyplot.errorbar.html
 
@@ -938,14 +942,14 @@ class IncidenceRateRatio:
         if measure == 'incidence_rate_ratio':
             ax = _plotter(estimate=self.results['IncRateRatio'], lcl=self.results['IRR_LCL'],
                           ucl=self.results['IRR_UCL'], labels=self.results.index,
-                          center=center, **errorbar_kwargs)
+                          center=center, ax=ax, **errorbar_kwargs)
             if scale == 'log':
                 ax.set_xscale('log')
             ax.set_title('Incidence Rate Ratio')
         elif measure == 'incidence_rate':
             ax = _plotter(estimate=self.results['IncRate'], lcl=self.results['IncRate_LCL'],
                           ucl=self.results['IncRate_UCL'], labels=self.results.index,
-                          center=np.nan, **errorbar_kwargs)
+                          center=np.nan, ax=ax, **errorbar_kwargs)
             ax.set_title('Incidence Rate')
             ax.set_xlim([0, 1])
         else:
@@ -1118,7 +1122,7 @@ class IncidenceRateDifference:
         print('Missing T:   ', self._missing_t)
         print('======================================================================')
 
-    def plot(self, measure='incidence_rate_difference', center=0, **errorbar_kwargs):
+    def plot(self, measure='incidence_rate_difference', center=0, ax=None, **errorbar_kwargs):
         """Plot the incidence rate differences or the incidence rates along with their corresponding confidence
         intervals. This option is an alternative to summary(), which displays results in a table format.
 
@@ -1132,6 +1136,8 @@ class IncidenceRateDifference:
         center : str, optional
             Sets a reference line. For the incidence rate difference, the reference line defaults to 0. For incidence
             rates, no reference line is displayed.
+        ax : matplotlib axes, optional
+            Axes to draw on. Default is None, which draws on the current axes of pyplot
         errorbar_kwargs: add additional kwargs to be passed to the plotting function ``matplotlib.errorbar``. See defaults here:
             https://matplotlib.org/api/_as_gen/matplotlib.pyplot.errorbar.html
 
@@ -1142,12 +1148,12 @@ class IncidenceRateDifference:
         if measure == 'incidence_rate_difference':
             ax = _plotter(estimate=self.results['IncRateDiff'], lcl=self.results['IRD_LCL'],
                           ucl=self.results['IRD_UCL'], labels=self.results.index,
-                          center=center, **errorbar_kwargs)
+                          center=center, ax=ax, **errorbar_kwargs)
             ax.set_title('Incidence Rate Difference')
         elif measure == 'incidence_rate':
             ax = _plotter(estimate=self.results['IncRate'], lcl=self.results['IncRate_LCL'],
                           ucl=self.results['IncRate_UCL'], labels=self.results.index,
-                          center=np.nan, **errorbar_kwargs)
+                          center=np.nan, ax=ax, **errorbar_kwargs)
             ax.set_title('Incidence Rate')
             ax.set_xlim([0, 1])
         else:
@@ -1155,7 +1161,7 @@ class IncidenceRateDifference:
         return ax
 
 
-def _plotter(estimate, lcl, ucl, labels, center=0, **errorbar_kwargs):
+def _plotter(estimate, lcl, ucl, labels, center=0, ax=None, **errorbar_kwargs):
     """
     Plot functionality to be used by all the measure classes. Internal functional for all the other plotting
     functionalities.
@@ -1165,7 +1171,9 @@ def _plotter(estimate, lcl, ucl, labels, center=0, **errorbar_kwargs):
     """
     ypoints = np.arange(len(labels))
 
-    ax = plt.gca()
+    if ax is None:
+        import matplotlib.pyplot as plt  # imported when needed, since pyplot is slow to import
+        ax = plt.gca()
 
     errorbar_kwargs.setdefault('fmt', 'o')
     errorbar_kwargs.setdefault('color', 'k')
@@ -1458,7 +1466,8 @@ class Diagnostics:
 #########################################################################################################
 # Interaction contrasts
 #########################################################################################################
-def interaction_contrast(df, exposure, outcome, modifier, adjust=None, decimal=3, print_results=True):
+def interaction_contrast(df, exposure, outcome, modifier, adjust=None, decimal=3, print_results=True, ci='wald',
+                         b_sample=200, alpha=0.05, resample='weights', processes=1, seed=None):
     """Calculate the Interaction Contrast (IC) using a pandas dataframe and statsmodels to fit a linear
     binomial regression. Can ONLY be used for a 0,1 coded exposure and modifier (exposure = {0,1}, modifier = {0,1},
     outcome = {0,1}). Can handle adjustment for other confounders in the regression model. Prints the fit
@@ -1487,6 +1496,27 @@ def interaction_contrast(df, exposure, outcome, modifier, adjust=None, decimal=3
         Example of accepted input is 'C1 + C2 + C3 + Z'
     decimal : integer, optional
         Decimal places to display in result. Default is 3
+    print_results : bool, optional
+        Whether to print the fitted model and the IC. Default is True
+    ci : string, optional
+        Type of confidence interval to return. Default is 'wald', from the standard error of the regression model.
+        'bootstrap' returns percentile bootstrap confidence intervals, see interaction_contrast_ratio() for details
+    b_sample : integer, optional
+        Number of bootstrap replicates. Only used for bootstrap confidence intervals. Default is 200
+    alpha : float, optional
+        Alpha level for confidence interval. Default is 0.05, which returns 95% confidence intervals
+    resample : string, optional
+        How bootstrap replicates are drawn. Default is 'weights', which uses multinomial frequency weights. 'index'
+        resamples the rows
+    processes : integer, optional
+        Number of processes to fit the bootstrap replicates over. Default is 1
+    seed : integer, optional
+        Seed for the bootstrap replicates. Default is None
+
+    Returns
+    -----------------
+    tuple
+        IC, lower confidence limit, and upper confidence limit
 
     Notes
     -----------------
@@ -1524,6 +1554,9 @@ def interaction_contrast(df, exposure, outcome, modifier, adjust=None, decimal=3
         ----------------------------------------------------------------------
 
     """
+    import statsmodels.api as sm
+    import statsmodels.formula.api as smf
+
     df.loc[((df[exposure] == 1) & (df[modifier] == 1)), 'E1M1'] = 1
     df.loc[((df[exposure] != 1) | (df[modifier] != 1)), 'E1M1'] = 0
     df.loc[((df[exposure].isnull()) | (df[modifier].isnull())), 'E1M1'] = np.nan
@@ -1531,24 +1564,35 @@ def interaction_contrast(df, exposure, outcome, modifier, adjust=None, decimal=3
         eq = outcome + ' ~ ' + exposure + ' + ' + modifier + ' + E1M1'
     else:
         eq = outcome + ' ~ ' + exposure + ' + ' + modifier + ' + E1M1 + ' + adjust
-    f = sm.families.family.Binomial(sm.families.links.identity)
+    f = sm.families.family.Binomial(sm.families.links.Identity())
     model = smf.glm(eq, df, family=f).fit()
     ic = model.params['E1M1']
-    lcl = model.conf_int().loc['E1M1'][0]
-    ucl = model.conf_int().loc['E1M1'][1]
+    if ci == 'wald':
+        lcl, ucl = model.conf_int(alpha=alpha).loc['E1M1']
+    elif ci == 'bootstrap':
+        boot = _bootstrap_glm(model, b_sample=b_sample, resample=resample, processes=processes, seed=seed)
+        failed = _bootstrap_failures(boot, b_sample)
+        bic = boot[:, model.model.exog_names.index('E1M1')]
+        lcl, ucl = np.percentile(bic[~np.isnan(bic)], [100 * alpha / 2, 100 * (1 - alpha / 2)])
+    else:
+        raise ValueError('Please specify a supported confidence interval type')
     if print_results:
         print(model.summary())
         print('\n----------------------------------------------------------------------')
         print('Interaction Contrast')
         print('----------------------------------------------------------------------')
         print('\nIC:\t\t' + str(round(ic, decimal)))
-        print('95% CI:\t\t(' + str(round(lcl, decimal)) + ', ' + str(round(ucl, decimal)) + ')')
+        print(str(round(100 * (1 - alpha))) + '% CI:\t\t(' + str(round(lcl, decimal)) + ', ' +
+              str(round(ucl, decimal)) + ')')
+        if ci == 'bootstrap':
+            print('Failed bootstrap replicates:\t' + str(failed) + ' of ' + str(b_sample))
         print('----------------------------------------------------------------------')
     return ic, lcl, ucl
 
 
 def interaction_contrast_ratio(df, exposure, outcome, modifier, adjust=None, regression='logit', ci='delta',
-                               b_sample=200, alpha=0.05, decimal=5, print_results=True):
+                               b_sample=200, alpha=0.05, decimal=5, print_results=True, resample='weights', processes=1,
+                               seed=None):
     """Calculate the Interaction Contrast Ratio (ICR) using a pandas dataframe, and conducts either log binomial
     or logistic regression through statsmodels. Can ONLY be used for a 0,1 coded exposure and modifier (exposure = {0,1},
     modifier = {0,1}, outcome = {0,1}). Can handle missing data and adjustment for other confounders in the regression
@@ -1586,17 +1630,45 @@ def interaction_contrast_ratio(df, exposure, outcome, modifier, adjust=None, reg
         * 'bootstrap':  bootstrap method (Assmann et al. 1996). The delta method is more time efficient than bootstrap
     b_sample : integer, optional
         Number of times to resample to generate bootstrap confidence intervals. Only used if bootstrap confidence
-        intervals are requested. Default is 1000
+        intervals are requested. Default is 200
     alpha : float, optional
         Alpha level for confidence interval. Default is 0.05, which returns 95% confidence intervals
     decimal : integer, optional
         Decimal places to display in result. Default is 3
+    print_results : bool, optional
+        Whether to print the fitted model and the ICR. Default is True
+    resample : string, optional
+        How bootstrap replicates are drawn. Default is 'weights', which gives each observation a multinomial frequency
+        weight, so the data is never copied. 'index' resamples the rows
+    processes : integer, optional
+        Number of processes to fit the bootstrap replicates over. Default is 1
+    seed : integer, optional
+        Seed for the bootstrap replicates. Default is None
+
+    Returns
+    ------------
+    tuple
+        ICR, lower confidence limit, and upper confidence limit
 
     Notes
     ------------
     statsmodels may produce a domain error for log binomial models in some versions
 
+    The design matrix is built once for the bootstrap. Each replicate is fit from the coefficients of the full data,
+    so few iterations are needed. Replicates that fail to converge are excluded, and the number of failed replicates
+    is reported
+
+    Examples
+    ------------
+    >>>from zepid import interaction_contrast_ratio, load_sample_data
+    >>>df = load_sample_data(False)
+    >>>interaction_contrast_ratio(df, exposure='art', outcome='dead', modifier='male', ci='bootstrap', b_sample=2000,
+    >>>                           processes=4, seed=1)
+
     """
+    import statsmodels.api as sm
+    import statsmodels.formula.api as smf
+
     df.loc[((df[exposure] == 1) & (df[modifier] == 0)), 'E1M0'] = 1
     df.loc[((df[exposure] != 1) | (df[modifier] != 0)), 'E1M0'] = 0
     df.loc[((df[exposure].isnull()) | (df[modifier].isnull())), 'E1M0'] = 0
@@ -1611,7 +1683,7 @@ def interaction_contrast_ratio(df, exposure, outcome, modifier, adjust=None, reg
         warnings.warn('Using the Odds Ratio to calculate the ICR is only valid when the OR approximates the RR',
                       UserWarning)
     elif regression == 'log':
-        f = sm.families.family.Binomial(sm.families.links.log)
+        f = sm.families.family.Binomial(sm.families.links.Log())
     if adjust is None:
         eq = outcome + ' ~ E1M0 + E0M1 + E1M1'
     else:
@@ -1622,7 +1694,7 @@ def interaction_contrast_ratio(df, exposure, outcome, modifier, adjust=None, reg
     em11 = math.exp(model.params['E1M1'])
     em_expect = em10 + em01 - 1
     icr = em11 - em_expect
-    zalpha = norm.ppf((1 - alpha / 2), loc=0, scale=1)
+    zalpha = normal_ppf(1 - alpha / 2)
     if ci == 'delta':
         cov_matrix = model.cov_params()
         vb10 = cov_matrix.loc['E1M0']['E1M0']
@@ -1636,27 +1708,12 @@ def interaction_contrast_ratio(df, exposure, outcome, modifier, adjust=None, reg
         icr_lcl = icr - zalpha * math.sqrt(varICR)
         icr_ucl = icr + zalpha * math.sqrt(varICR)
     elif ci == 'bootstrap':
-        print('Running bootstrap... please wait...')
-        with warnings.catch_warnings(record=True) as w:
-            warnings.simplefilter("always")
-            bse_icr = []
-            ul = 1 - alpha / 2
-            ll = 0 + alpha / 2
-            for i in range(b_sample):
-                dfs = df.sample(n=df.shape[0], replace=True)
-                try:
-                    bmodel = smf.glm(eq, dfs, family=f).fit()
-                    em_bexpect = math.exp(bmodel.params['E1M0']) + math.exp(bmodel.params['E0M1']) - 1
-                    bicr = math.exp(bmodel.params['E1M1']) - em_bexpect
-                    sigma = bicr - icr
-                    bse_icr.append(sigma)
-                except:
-                    bse_icr.append(np.nan)
-            bsdf = pd.DataFrame()
-            bsdf['sigma'] = bse_icr
-            lsig, usig = bsdf['sigma'].dropna().quantile(q=[ll, ul])
-            icr_lcl = lsig + icr
-            icr_ucl = usig + icr
+        boot = _bootstrap_glm(model, b_sample=b_sample, resample=resample, processes=processes, seed=seed)
+        failed = _bootstrap_failures(boot, b_sample)
+        names = model.model.exog_names
+        bicr = (np.exp(boot[:, names.index('E1M1')]) - np.exp(boot[:, names.index('E1M0')]) -
+                np.exp(boot[:, names.index('E0M1')]) + 1)
+        icr_lcl, icr_ucl = np.percentile(bicr[~np.isnan(bicr)], [100 * alpha / 2, 100 * (1 - alpha / 2)])
     else:
         raise ValueError('Please specify a supported confidence interval type')
     if print_results:
@@ -1669,10 +1726,76 @@ def interaction_contrast_ratio(df, exposure, outcome, modifier, adjust=None, reg
             print('ICR based on Risk Ratio\t\tAlpha = ' + str(alpha))
         print('\nICR:\t\t' + str(round(icr, decimal)))
         print('CI:\t\t(' + str(round(icr_lcl, decimal)) + ', ' + str(round(icr_ucl, decimal)) + ')')
+        if ci == 'bootstrap':
+            print('Failed bootstrap replicates:\t' + str(failed) + ' of ' + str(b_sample))
         print('----------------------------------------------------------------------')
     return icr, icr_lcl, icr_ucl
 
 
+def _bootstrap_glm(model, b_sample, resample='weights', processes=1, seed=None):
+    """Hidden function that bootstraps a fitted statsmodels GLM. The design matrix of the fitted model is reused for
+    every replicate, and each replicate starts from the coefficients of the fitted model. Replicates are split over
+    processes. Returns the coefficients of each replicate, with a row of NaN for replicates that failed
+    """
+    if resample not in ['weights', 'index']:
+        raise ValueError("resample must be either 'weights' or 'index'")
+    if b_sample < 1 or processes < 1:
+        raise ValueError('b_sample and processes must be at least 1')
+    endog, exog = model.model.endog, model.model.exog
+    if resample == 'weights':
+        # Observations with the same outcome and covariates are interchangeable, so the multinomial weights are drawn
+        # for each unique row instead of each observation. Same replicates, but a much smaller model to fit
+        rows, counts = np.unique(np.column_stack([endog, exog]), axis=0, return_counts=True)
+        endog, exog, probs = rows[:, 0], rows[:, 1:], counts / endog.shape[0]
+    else:
+        probs = None
+    rng = np.random.RandomState(seed)
+    jobs = [(endog, exog, probs, model.model.family, np.asarray(model.params), model.model.endog.shape[0], len(part),
+             rng.randint(2 ** 31 - 1)) for part in np.array_split(np.arange(b_sample), min(processes, b_sample))]
+    if len(jobs) == 1:
+        return _bootstrap_glm_fits(jobs[0])
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+        return np.concatenate(list(pool.map(_bootstrap_glm_fits, jobs)))
+
+
+def _bootstrap_glm_fits(job):
+    """Hidden function that fits a block of bootstrap replicates, in the current or a worker process. With probs, the
+    replicates are multinomial frequency weights of n draws from the rows. Otherwise, n rows are resampled
+    """
+    import statsmodels.api as sm
+
+    endog, exog, probs, family, start_params, n, replicates, seed = job
+    rng = np.random.RandomState(seed)
+    params = np.full((replicates, exog.shape[1]), np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for b in range(replicates):
+            try:
+                if probs is not None:
+                    glm = sm.GLM(endog, exog, family=family, freq_weights=rng.multinomial(n, probs))
+                else:
+                    draw = rng.randint(0, n, size=n)
+                    glm = sm.GLM(endog[draw], exog[draw], family=family)
+                fit = glm.fit(start_params=start_params)
+            except Exception:  # for example, perfect separation or a domain error in a replicate
+                continue
+            if getattr(fit, 'converged', True) and np.all(np.isfinite(fit.params)):
+                params[b] = fit.params
+    return params
+
+
+def _bootstrap_failures(boot, b_sample):
+    """Hidden function that counts and warns about the bootstrap replicates that failed"""
+    failed = int(np.sum(np.isnan(boot[:, 0])))
+    if failed == b_sample:
+        raise ValueError('All bootstrap replicates failed to converge')
+    if failed > 0:
+        warnings.warn(str(failed) + ' of ' + str(b_sample) + ' bootstrap replicates failed to converge, and were '
+                      'excluded from the confidence interval', UserWarning)
+    return failed
+
+
 #########################################################################################################
 # Other
 #########################################################################################################
@@ -1740,56 +1863,202 @@ def spline(df, var, n_knots=3, knots=None, term=1, restricted=False):
     Calculate restricted cubic spline with 5 automatic knots
     >>>spline(df, var='cd40', n_knots=5, term=3, restricted=True)
     """
-    if knots is None:
-        if n_knots == 1:
-            knots = [0.5]
-        elif n_knots == 2:
-            knots = [1 / 3, 2 / 3]
-        elif n_knots == 3:
-            knots = [0.05, 0.5, 0.95]
-        elif n_knots == 4:
-            knots = [0.05, 0.35, 0.65, 0.95]
-        elif n_knots == 5:
-            knots = [0.05, 0.275, 0.50, 0.725, 0.95]
-        elif n_knots == 6:
-            knots = [0.05, 0.23, 0.41, 0.59, 0.77, 0.95]
-        elif n_knots == 7:
-            knots = [0.025, 11 / 60, 26 / 75, 0.50, 79 / 120, 49 / 60, 0.975]
-        else:
-            raise ValueError(
-                'When the knot locations are not pre-specified, the number of specified knots must be'
-                ' an integer between 1 and 7')
-        pts = list(df[var].quantile(q=knots))
-    else:
-        if n_knots != len(knots):
-            raise ValueError('The number of knots and the number of specified knots must match')
-        else:
-            pass
-        pts = knots
-    if sorted(pts) != pts:
-        raise ValueError('Knots must be in ascending order')
-    colnames = []
-    sf = df.copy()
-    for i in range(len(pts)):
-        colnames.append('spline' + str(i))
-        sf['spline' + str(i)] = np.where(sf[var] > pts[i], (sf[var] - pts[i]) ** term, 0)
-        sf['spline' + str(i)] = np.where(sf[var].isnull(), np.nan, sf['spline' + str(i)])
-    if restricted is False:
-        return sf[colnames]
-    elif restricted is True:
-        rsf = sf.copy()
-        colnames = []
-        for i in range(len(pts) - 1):
-            colnames.append('rspline' + str(i))
-            rsf['rspline' + str(i)] = np.where(rsf[var] > pts[i],
-                                               rsf['spline' + str(i)] - rsf['spline' + str(len(pts) - 1)], 0)
-            rsf['rspline' + str(i)] = np.where(rsf[var].isnull(), np.nan, rsf['rspline' + str(i)])
-        return rsf[colnames]
-    else:
+    if restricted not in [True, False]:
         raise ValueError('restricted must be set to either True or False')
+    if knots is not None:
+        knots = {var: knots}
+    basis = SplineBasis(var, n_knots=n_knots, knots=knots, term=term, restricted=restricted).fit(df)
+    prefix = 'rspline' if restricted else 'spline'
+    return pd.DataFrame(basis.transform(df), index=df.index,
+                        columns=[prefix + str(i) for i in range(basis.n_columns)])
+
+
+class SplineBasis:
+    def __init__(self, variables, n_knots=3, knots=None, term=1, restricted=False):
+        """Spline basis for one or more continuous variables, computed with NumPy directly from the columns. The knot
+        locations are stored when fit, so the same basis can be applied to new data, or to a large data set a chunk of
+        rows at a time. The spline variables of all the variables are written into a single matrix, which can be
+        preallocated and of any float type (for example float32 to halve the memory used)
+
+        The spline variables are the same as spline(). For a knot k, the unrestricted spline variable is
+        max(x - k, 0)^term. The restricted spline variables subtract the spline variable of the last knot from
+        those of the other knots
+
+        Parameters
+        --------------
+        variables : str, list
+            Continuous variable, or list of continuous variables, to generate splines for
+        n_knots : integer, optional
+            Number of knots for each variable. If knot locations are not specified, n_knots must be an integer
+            between 1 to 7. Default is 3 knots
+        knots : dict, optional
+            Dictionary of variables and their knot locations, in ascending order. Variables not in the dictionary have
+            their knots placed at the percentiles of the data they are fit to. Default is None
+        term : integer, float, optional
+            High order term for the spline terms. Default is 1, i.e. a linear spline
+        restricted : bool, optional
+            Whether to return restricted splines, which have one less column than the number of knots. Default is
+            False
+
+        Examples
+        --------------
+        >>>from zepid import SplineBasis, load_sample_data
+        >>>df = load_sample_data(False)
+
+        Restricted quadratic splines for two variables, as a float32 matrix
+        >>>sb = SplineBasis(['age0', 'cd40'], n_knots=3, term=2, restricted=True).fit(df)
+        >>>sb.knots
+        >>>X = sb.transform(df, dtype=np.float32)
+        >>>sb.columns
+
+        Writing into part of a preallocated design matrix, a chunk of rows at a time
+        >>>X = np.empty((df.shape[0], 1 + sb.n_columns))
+        >>>X[:, 0] = 1
+        >>>for i in range(0, df.shape[0], 200):
+        >>>    sb.transform(df.iloc[i:i + 200], out=X[i:i + 200, 1:])
+        """
+        if isinstance(variables, str):
+            variables = [variables]
+        self.variables = list(variables)
+        knots = {} if knots is None else knots
+        for v in knots:
+            if v not in self.variables:
+                raise ValueError('Knots were specified for ' + str(v) + ', which is not one of the variables')
+            if n_knots != len(knots[v]):
+                raise ValueError('The number of knots and the number of specified knots must match')
+        if len(knots) < len(self.variables) and n_knots not in _spline_percentiles:
+            raise ValueError('When the knot locations are not pre-specified, the number of specified knots must be an '
+                             'integer between 1 and 7')
+        self.knots = {v: _check_knots(knots[v]) for v in knots}
+        self._fixed = set(knots)
+        self.n_knots = n_knots
+        self.term = term
+        self.restricted = restricted
+
+    @property
+    def n_columns(self):
+        """Number of spline variables for each variable"""
+        return self.n_knots - 1 if self.restricted else self.n_knots
+
+    @property
+    def columns(self):
+        """Labels of the spline variables, in the order of the columns of transform()"""
+        prefix = '_rspline' if self.restricted else '_spline'
+        return [v + prefix + str(i) for v in self.variables for i in range(self.n_columns)]
+
+    def fit(self, df):
+        """Places the knots of variables without specified knots at percentiles of their values. Missing values are
+        ignored. Each column is read as an array, without copying df
+
+        Parameters
+        --------------
+        df : DataFrame, dict
+            Pandas dataframe (or dictionary of arrays) containing the variables. For a single variable, an array of
+            its values can also be given
+
+        Returns
+        --------------
+        SplineBasis
+        """
+        for v in self.variables:
+            if v not in self._fixed:
+                x = _spline_values(df, v, self.variables)
+                self.knots[v] = _check_knots(np.nanquantile(x, _spline_percentiles[self.n_knots]))
+        return self
+
+    def transform(self, df, out=None, dtype=np.float64):
+        """Computes the spline variables. Each column is read as an array, without copying df, and the spline
+        variables are computed a block of rows at a time straight into the output matrix. Missing values have missing
+        spline variables
+
+        Parameters
+        --------------
+        df : DataFrame, dict
+            Pandas dataframe (or dictionary of arrays) containing the variables. For a single variable, an array of
+            its values can also be given
+        out : array, optional
+            Matrix of shape (rows, len(columns)) to write the spline variables into. Can be part of a larger matrix,
+            for example X[:, 1:]. Default is None, which creates a new matrix
+        dtype : numpy dtype, optional
+            Float type of the new matrix, when out is not given. Default is np.float64
 
+        Returns
+        --------------
+        array
+            Spline variables, with the columns labeled by columns
+        """
+        if len(self.knots) < len(self.variables):
+            raise ValueError('The knot locations must be found by fit() before transform()')
+        values = [_spline_values(df, v, self.variables) for v in self.variables]
+        n = values[0].shape[0]
+        if out is None:
+            out = np.empty((n, len(self.columns)), dtype=dtype)
+        elif out.shape != (n, len(self.columns)):
+            raise ValueError('out must have shape ' + str((n, len(self.columns))))
+
+        # Working through blocks of rows, so the intermediate values stay small enough to sit in the CPU cache
+        k = self.n_columns
+        diff = np.empty((min(n, _spline_rows), self.n_knots))
+        power = np.empty(diff.shape)
+        for start in range(0, n, _spline_rows):
+            stop = min(start + _spline_rows, n)
+            for j, (v, x) in enumerate(zip(self.variables, values)):
+                d = np.subtract(x[start:stop, None], self.knots[v][None, :], out=diff[:stop - start])
+                np.maximum(d, 0, out=d)  # missing values stay missing
+                p = _power(d, self.term, power[:stop - start])
+                if self.restricted:
+                    np.subtract(p[:, :k], p[:, -1:], out=out[start:stop, j * k:(j + 1) * k], casting='same_kind')
+                else:
+                    out[start:stop, j * k:(j + 1) * k] = p
+        return out
+
+
+# Rows of each block computed by SplineBasis.transform
+_spline_rows = 16384
+
+# Percentiles the knots are placed at, by the number of knots
+_spline_percentiles = {1: [0.5],
+                       2: [1 / 3, 2 / 3],
+                       3: [0.05, 0.5, 0.95],
+                       4: [0.05, 0.35, 0.65, 0.95],
+                       5: [0.05, 0.275, 0.50, 0.725, 0.95],
+                       6: [0.05, 0.23, 0.41, 0.59, 0.77, 0.95],
+                       7: [0.025, 11 / 60, 26 / 75, 0.50, 79 / 120, 49 / 60, 0.975]}
+
+
+def _check_knots(knots):
+    """Hidden function that checks the knots are in ascending order"""
+    pts = np.asarray(knots, dtype=float)
+    if np.any(np.diff(pts) < 0):
+        raise ValueError('Knots must be in ascending order')
+    return pts
 
-def table1_generator(df, cols, variable_type, continuous_measure='median', strat_by=None, decimal=3):
+
+def _spline_values(df, var, variables):
+    """Hidden function that returns the values of var as a float array, without a copy when they are already floats"""
+    if isinstance(df, np.ndarray) or isinstance(df, pd.Series):
+        if len(variables) > 1:
+            raise ValueError('An array of values can only be given for a single variable')
+        return np.asarray(df, dtype=float)
+    return np.asarray(df[var], dtype=float)
+
+
+def _power(values, term, out):
+    """Hidden function that raises values to the power term. Integer powers are found by multiplication, which is
+    quicker than numpy.power. The result is either values or out
+    """
+    if term == 1:
+        return values
+    if float(term).is_integer() and term > 1:
+        np.multiply(values, values, out=out)
+        for i in range(int(term) - 2):
+            np.multiply(out, values, out=out)
+        return out
+    return np.power(values, term, out=values)
+
+
+def table1_generator(df, cols, variable_type, continuous_measure='median', strat_by=None, decimal=3,
+                     quantile_bins=None):
     """Code to automatically generate a descriptive table of your study population (often referred to as a
     Table 1). Personally, I hate copying SAS/R/Python output from the interpreter to an Excel or other
     spreadsheet software. This code will generate a pandas dataframe object. This object will be a formatted
@@ -1800,9 +2069,12 @@ def table1_generator(df, cols, variable_type, continuous_measure='median', strat
     missing data will be counted (but is not included in the percent). Additionally, a single categorical variable
     can be used to present the results
 
-    Continuous variables either have median/IQR or mean/SE calculated depending on what is requested. Missing are
+    Continuous variables either have median/IQR or mean/SD calculated depending on what is requested. Missing are
     counted as a separate category
 
+    All counts and summaries are found for every stratum at once by grouped counts and sums over the columns, and the
+    table is assembled at the end, so large data sets with many strata are quick to summarize
+
     Parameters
     ---------------
     df : DataFrame
@@ -1817,11 +2089,16 @@ def table1_generator(df, cols, variable_type, continuous_measure='median', strat
     continuous_measure : string, optional
         Whether to use the medians or the means. Default is median. Options are
         * 'median'          returns medians and IQR for continuous variables
-        * 'mean'            returns means and SE for continuous variables
+        * 'mean'            returns means and SD for continuous variables
     strat_by : string, optional
         Categorical variable to stratify by. Default is None (no stratification)
     decimal : integer, optional
         Decimal places to display in the table. Default is 3
+    quantile_bins : integer, optional
+        Number of bins used to approximate the median and IQR of continuous variables. The values of each variable are
+        counted in quantile_bins equal-width bins by stratum, and the percentiles are interpolated within the bins, so
+        they are within (maximum - minimum) / quantile_bins of the exact percentiles. Useful for very large data sets.
+        Default is None, which calculates the exact percentiles
 
     Returns
     ----------
@@ -1857,87 +2134,155 @@ def table1_generator(df, cols, variable_type, continuous_measure='median', strat
         raise ValueError('List of columns must be the same length as the list of variable types')
     if continuous_measure != 'median' and continuous_measure != 'mean':
         raise ValueError("'median' or 'mean' must be requested as the continuous_measure")
+    for t in variable_type:
+        if t not in ['category', 'continuous']:
+            raise ValueError("Variable types must be either 'category' or 'continuous'")
+    if quantile_bins is not None and quantile_bins < 1:
+        raise ValueError('quantile_bins must be at least 1')
+    if continuous_measure == 'median':
+        labels = ['n / Median', '% / IQR']
+    else:
+        labels = ['n / Mean', '% / SD']
 
-    # Unstratified Table 1
+    # Strata as integer codes, with -1 for rows that are in no stratum
     if strat_by is None:
-        rlist = []
-        for i in cols:
-            vn = cols.index(i)
-            if continuous_measure == 'median':
-                if variable_type[vn] == 'continuous':
-                    rf = pd.DataFrame({'n / Median': [np.median(df[i].dropna()), df[i].isnull().sum()],
-                                       '% / IQR': [np.percentile(df[i].dropna(), [25, 75]).round(decimals=decimal),
-                                                   '']}, index=['', 'Missing'])
-                if variable_type[vn] == 'category':
-                    x = df[i].value_counts()
-                    m = df[i].isnull().sum()
-                    rf = pd.DataFrame({'n / Median': x, '% / IQR': x / x.sum()})
-                    rf = rf.append(pd.DataFrame({'n / Median': m, '% / IQR': ''}, index=['Missing']))
-            if continuous_measure == 'mean':
-                if variable_type[vn] == 'continuous':
-                    rf = pd.DataFrame({'n / Mean': [np.mean(df[i].dropna()), df[i].isnull().sum()],
-                                       '% / SE': [np.round(np.std(df[i].dropna()), decimals=decimal), '']},
-                                      index=['', 'Missing'])
-                if variable_type[vn] == 'category':
-                    x = df[i].value_counts(dropna=False)
-                    y = df[i].value_counts(dropna=False)
-                    rf = pd.DataFrame({'n / Mean': x, '% / SE': y / y.sum()})
-            rlist.append(rf)
-        srf = pd.concat(rlist, keys=cols, names=['Variable'])
-        if continuous_measure == 'median':
-            return srf[['n / Median', '% / IQR']]
-        if continuous_measure == 'mean':
-            return srf[['n / Mean', '% / SE']]
-
-    # Stratified Table 1
+        codes = np.zeros(df.shape[0], dtype=np.int64)
+        strata = None
+        n_strata = 1
+    else:
+        codes, strata = pd.factorize(df[strat_by])
+        codes = codes.astype(np.int64)
+        n_strata = len(strata)
+    size = np.bincount(codes[codes >= 0], minlength=n_strata)
+
+    # Ordering the rows by stratum once, so each stratum of a column is a slice for the exact percentiles
+    order = None
+    if continuous_measure == 'median' and quantile_bins is None and 'continuous' in variable_type:
+        small = codes.astype(np.int16) if n_strata < 2 ** 15 else codes  # small integers are sorted by radix sort
+        order = np.argsort(small, kind='stable')[np.sum(codes < 0):]
+
+    # Rows of the table, with the n column and the % column of each stratum
+    index = []
+    n = []
+    pct = []
     if strat_by is not None:
-        v = df[strat_by].dropna().unique()
-        slist = []
-        nlist = []
-        for j in v:
-            sf = df.loc[df[strat_by] == j].copy()
-            rlist = []
-            for i in cols:
-                vn = cols.index(i)
-                if variable_type[vn] == 'category':
-                    x = sf[i].value_counts()
-                    m = sf[i].isnull().sum()
-                    if continuous_measure == 'median':
-                        rf = pd.DataFrame({'n / Median': x, '% / IQR': x / x.sum()})
-                        rf = rf.append(pd.DataFrame({'n / Median': m, '% / IQR': ''}, index=['Missing']))
-                    if continuous_measure == 'mean':
-                        rf = pd.DataFrame({'n / Mean': x, '% / SD': x / x.sum()})
-                        rf = rf.append(pd.DataFrame({'n / Mean': m, '% / SD': ''}, index=['Missing']))
-                if variable_type[vn] == 'continuous':
-                    if continuous_measure == 'median':
-                        rf = pd.DataFrame({'n / Median': [np.median(sf[i].dropna()), sf[i].isnull().sum()],
-                                           '% / IQR': [np.percentile(sf[i].dropna(), [25, 75]).round(decimals=decimal),
-                                                       '']}, index=['', 'Missing'])
-                    if continuous_measure == 'mean':
-                        rf = pd.DataFrame({'n / Mean': [np.mean(sf[i].dropna()), sf[i].isnull().sum()],
-                                          '% / SD': [np.round(np.std(sf[i].dropna()), decimals=decimal), '']},
-                                          index=['', 'Missing'])
-                rlist.append(rf)
-            if continuous_measure == 'median':
-                c = pd.DataFrame({'n / Median': len(sf), '% / IQR': ''}, index=[''])
-            if continuous_measure == 'mean':
-                c = pd.DataFrame({'n / Mean': len(sf), '% / SD': ''}, index=[''])
-            try:  # avoids pandas error
-                rff = pd.concat([c] + rlist, keys=['TOTAL'] + cols, names=['Variable'], axis=0, sort=False)
-            except TypeError:  # gets around pandas <0.22 error
-                rff = pd.concat([c] + rlist, keys=['TOTAL'] + cols, names=['Variable'], axis=0)
-            slist.append(rff)
-            if continuous_measure == 'median':
-                nlist.append((strat_by + '=' + str(j), '% / IQR'))
+        index.append(('TOTAL', ''))
+        n.append(size.astype(float))
+        pct.append([''] * n_strata)
+    for col, vtype in zip(cols, variable_type):
+        if vtype == 'category':
+            levels, counts, missing = _table1_counts(df[col], codes, n_strata)
+            total = counts.sum(axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                share = counts / total[:, None]
+            for k, level in enumerate(levels):
+                index.append((col, level))
+                n.append(counts[:, k].astype(float))
+                pct.append(list(share[:, k]))
+        else:
+            x = np.asarray(df[col], dtype=float)
+            valid = (codes >= 0) & ~np.isnan(x)
+            missing = np.bincount(codes[(codes >= 0) & ~valid], minlength=n_strata)
             if continuous_measure == 'mean':
-                nlist.append((strat_by + '=' + str(j), '% / SD'))
-            nlist.append((strat_by + '=' + str(j), 'n'))
-        index = pd.MultiIndex.from_tuples(nlist, names=['_', '__'])
-        try:  # avoids pandas error
-            srf = pd.concat(slist, keys=cols, names=['Variable'], axis=1, sort=False)
-        except TypeError:
-            srf = pd.concat(slist, keys=cols, names=['Variable'], axis=1)
-        print(srf.columns)
-        print(index)
-        srf.columns = index
-        return srf
+                center, spread = _table1_mean(x[valid], codes[valid], n_strata)
+                spread = list(np.round(spread, decimals=decimal))
+            elif quantile_bins is None:
+                q = _table1_percentiles(x, order, size)
+                center, spread = q[:, 1], [v for v in np.round(q[:, [0, 2]], decimals=decimal)]
+            else:
+                q = _table1_binned_percentiles(x[valid], codes[valid], n_strata, quantile_bins)
+                center, spread = q[:, 1], [v for v in np.round(q[:, [0, 2]], decimals=decimal)]
+            index.append((col, ''))
+            n.append(center)
+            pct.append(spread)
+        index.append((col, 'Missing'))
+        n.append(missing.astype(float))
+        pct.append([''] * n_strata)
+
+    # Assembling the table once from the rows
+    index = pd.MultiIndex.from_tuples(index, names=['Variable', None])
+    n = np.array(n, dtype=float)
+    data = {}
+    for k in range(n_strata):
+        column = np.empty(len(index), dtype=object)
+        for r, row in enumerate(pct):
+            column[r] = row[k]
+        data[2 * k] = n[:, k]
+        data[2 * k + 1] = column
+    table = pd.DataFrame(data, index=index)
+    if strat_by is None:
+        table.columns = labels
+    else:
+        table.columns = pd.MultiIndex.from_tuples([(strat_by + '=' + str(j), c) for j in strata
+                                                   for c in ['n', labels[1]]], names=['_', '__'])
+    return table
+
+
+def _table1_counts(values, codes, n_strata):
+    """Hidden function that counts the categories of a variable in every stratum at once. Returns the categories (in
+    descending order of their total count), the counts by stratum and category, and the missing by stratum
+    """
+    levels, cat = pd.factorize(values, sort=True)
+    n_levels = len(cat)
+    valid = (codes >= 0) & (levels >= 0)
+    counts = np.bincount(codes[valid] * n_levels + levels[valid],
+                         minlength=n_strata * n_levels).reshape(n_strata, n_levels)
+    missing = np.bincount(codes[(codes >= 0) & (levels < 0)], minlength=n_strata)
+    ordered = np.argsort(-counts.sum(axis=0), kind='stable')
+    return list(cat[ordered]), counts[:, ordered], missing
+
+
+def _table1_mean(x, codes, n_strata):
+    """Hidden function for the means and standard deviations of non-missing values by stratum"""
+    count = np.bincount(codes, minlength=n_strata)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(codes, weights=x, minlength=n_strata) / count
+        sd = np.sqrt(np.bincount(codes, weights=(x - mean[codes]) ** 2, minlength=n_strata) / count)
+    return mean, sd
+
+
+def _table1_percentiles(x, order, size):
+    """Hidden function for the exact 25th, 50th, and 75th percentiles by stratum. order sorts the rows by stratum,
+    so each stratum is a slice of x[order]
+    """
+    x = x[order]
+    bounds = np.concatenate([[0], np.cumsum(size)])
+    q = np.full((size.shape[0], 3), np.nan)
+    for k in range(size.shape[0]):
+        values = x[bounds[k]:bounds[k + 1]]
+        values = values[~np.isnan(values)]
+        if values.shape[0] > 0:
+            q[k] = np.percentile(values, [25, 50, 75])
+    return q
+
+
+def _table1_binned_percentiles(x, codes, n_strata, bins):
+    """Hidden function for the approximate 25th, 50th, and 75th percentiles by stratum. The values are counted in
+    equal-width bins by stratum. Each value a percentile depends on is placed within the bin that holds its rank, so
+    it is off by at most the bin width
+    """
+    q = np.full((n_strata, 3), np.nan)
+    if x.shape[0] == 0:
+        return q
+    low, high = np.min(x), np.max(x)
+    width = (high - low) / bins
+    if width == 0:
+        q[np.bincount(codes, minlength=n_strata) > 0] = low
+        return q
+    b = np.minimum(((x - low) / width).astype(np.int64), bins - 1)
+    counts = np.bincount(codes * bins + b, minlength=n_strata * bins).reshape(n_strata, bins)
+    cumulative = np.cumsum(counts, axis=1)
+    for k in range(n_strata):
+        if cumulative[k, -1] == 0:
+            continue
+        # Locating the two values either side of each rank, then interpolating between them like numpy.percentile
+        rank = np.array([0.25, 0.5, 0.75]) * (cumulative[k, -1] - 1)
+        below = np.floor(rank)
+        above = np.minimum(below + 1, cumulative[k, -1] - 1)
+        located = []
+        for r in [below, above]:
+            i = np.searchsorted(cumulative[k], r, side='right')
+            within = (r - (cumulative[k, i] - counts[k, i]) + 0.5) / counts[k, i]
+            located.append(low + (i + within) * width)
+        q[k] = np.clip(located[0] + (rank - below) * (located[1] - located[0]), low, high)
+    return q
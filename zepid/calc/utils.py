@@ -2,7 +2,7 @@ import warnings
 from collections import namedtuple
 
 import numpy as np
-from scipy.stats import norm
+from scipy.special import ndtr, ndtri
 
 
 Results = namedtuple('Results',
@@ -11,7 +11,7 @@ Results = namedtuple('Results',
 
 
 def normal_ppf(z):
-    return norm.ppf(z, loc=0, scale=1)
+    return ndtri(z)
 
 
 def check_positivity_or_throw(*args):
@@ -742,9 +742,9 @@ def counternull_pvalue(estimate, lcl, ucl, sided='two', alpha=0.05, decimal=3):
     zalpha = normal_ppf(1 - alpha / 2)
     se = (ucl - lcl) / (zalpha * 2)
     cnull = 2 * estimate
-    up_cn = norm.cdf(x=cnull, loc=estimate, scale=se)
+    up_cn = ndtr((cnull - estimate) / se)
     lp_cn = 1 - up_cn
-    lowerp = norm.cdf(x=estimate, loc=cnull, scale=se)
+    lowerp = ndtr((estimate - cnull) / se)
     upperp = 1 - lowerp
     twosip = 2 * min([up_cn, lp_cn])
     print('----------------------------------------------------------------------')
@@ -840,7 +840,7 @@ def semibayes(prior_mean, prior_lcl, prior_ucl, mean, lcl, ucl, ln_transform=Fal
 
     # Checking Prior
     check = (mean - prior_mean) / ((var + prior_var) ** (1 / 2))  # ME3 pg340
-    approx_check = norm.sf(abs(check)) * 2
+    approx_check = ndtr(-abs(check)) * 2
     if approx_check < 0.05:
         warnings.warn('The approximate homogeneity check between the prior and the data indicates the prior may be  '
                       'incompatible with the data. Therefore, it may be misleading to summarize the results via a '
@@ -928,7 +928,7 @@ def sensitivity(detected, cases, alpha=0.05, confint='wald'):
         raise ValueError('Detected true cases must be less than or equal to the total number of cases')
 
     sens = detected / cases
-    zalpha = norm.ppf(1 - alpha / 2, loc=0, scale=1)
+    zalpha = normal_ppf(1 - alpha / 2)
     if confint == 'wald':
         sd = np.sqrt((sens * (1-sens)) / cases)
         # follows SAS9.4: http://support.sas.com/documentation/cdl/en/procstat/67528/HTML/default/viewer.htm#procstat_
@@ -984,7 +984,7 @@ def specificity(detected, noncases, alpha=0.05, confint='wald'):
     if detected > noncases:
         raise ValueError('Detected true cases must be less than or equal to the total number of cases')
     spec = 1 - (detected / noncases)
-    zalpha = norm.ppf(1 - alpha / 2, loc=0, scale=1)
+    zalpha = normal_ppf(1 - alpha / 2)
     if confint == 'wald':
         sd = np.sqrt((spec * (1-spec)) / noncases)
         # follows SAS9.4: http://support.sas.com/documentation/cdl/en/procstat/67528/HTML/default/viewer.htm#procstat_
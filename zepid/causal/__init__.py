@@ -0,0 +1,3 @@
+from zepid._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(__name__, submodules=['gformula', 'ipw', 'doublyrobust'])
@@ -161,9 +161,9 @@ class TimeFixedGFormula:
             m = smf.glm(self.outcome+' ~ '+model, self.gf, family=linkdist)
             self._outcome_model = m.fit()
         else:
-            m = smf.gee(self.outcome+' ~ '+model, self.gf.index, self.gf, family=linkdist,
-                        weights=self.gf[self._weights])
-            self._outcome_model = m.fit()
+            # Each observation is its own cluster, so a weighted GLM with a robust variance is the same as GEE
+            m = smf.glm(self.outcome+' ~ '+model, self.gf, family=linkdist, var_weights=self.gf[self._weights])
+            self._outcome_model = m.fit(cov_type='HC0')
 
         # Printing results of the model and if any observations were dropped
         if print_results:
@@ -1,13 +1,17 @@
+import os
+import time
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
+import patsy
 import statsmodels.api as sm
-import statsmodels.formula.api as smf
 from statsmodels.genmod.families import links
 
 
 class TimeVaryGFormula:
-    def __init__(self, df, idvar, exposure, outcome, time_out, time_in=None, method='MonteCarlo', weights=None):
+    def __init__(self, df, idvar, exposure, outcome, time_out, time_in=None, method='MonteCarlo', weights=None,
+                 defer_models=False):
         """Time-varying implementation of the g-formula, also referred to as the g-computation algorithm formula. The
         time-varying parametric g-formula uses either the Monte Carlo or the sequential regression (iterative
         expectations) estimators. The Monte Carlo estimator is useful for survival data and the sequential regression
@@ -43,6 +47,10 @@ class TimeVaryGFormula:
             'SequentialRegression'
         weights : str, optional
             Column label for weights. Default is None, which assumes every observations has the same weight (i.e. 1)
+        defer_models : bool, optional
+            Whether to wait to fit the exposure, outcome, and covariate models until fit_models() (or fit()) is called,
+            rather than fitting each model when it is specified. Deferring allows the models to share design matrices
+            and to be fit concurrently. Default is False
 
         Notes
         -----
@@ -188,7 +196,13 @@ class TimeVaryGFormula:
         self._covariate_type = []
         self._covariate_recode = []
         self._weights = weights
+        self._defer_models = defer_models
+        self._pending_models = []
+        self._designs = {}
         self.predicted_outcomes = None
+        self.mc_standard_error = None
+        self.mc_sample_size = None
+        self.plan_summary = None
 
         # Different Estimator Approaches
         if method == 'MonteCarlo':
@@ -220,19 +234,7 @@ class TimeVaryGFormula:
         print_results : bool, optional
             Whether to print the logistic regression model results to the terminal. Default is True
         """
-        g = self.gf.copy()
-        if restriction is not None:
-            g = g.loc[eval(restriction)].copy()
-        linkdist = sm.families.family.Binomial()
-
-        if self._weights is None:  # Unweighted g-formula
-            self.exp_model = smf.glm(self.exposure + ' ~ ' + model, g, family=linkdist).fit()
-        else:  # Weighted g-formula
-            self.exp_model = smf.gee(self.exposure + ' ~ ' + model, self.idvar, g, weights=g[self._weights],
-                                     family=linkdist).fit()
-
-        if print_results:
-            print(self.exp_model.summary())
+        self._add_model('exposure', self.exposure, model, restriction, 'binary', print_results)
         self._exposure_model_fit = True
 
     def outcome_model(self, model, restriction=None, print_results=True):
@@ -252,19 +254,7 @@ class TimeVaryGFormula:
             Whether to print the logistic regression model results to the terminal. Default is True
         """
         if self._mc:
-            g = self.gf.copy()
-            if restriction is not None:
-                g = g.loc[eval(restriction)].copy()
-            linkdist = sm.families.family.Binomial()
-
-            if self._weights is None:  # Unweighted g-formula
-                self.out_model = smf.glm(self.outcome + ' ~ ' + model, g, family=linkdist).fit()
-            else:  # Weighted g-formula
-                self.out_model = smf.gee(self.outcome + ' ~ ' + model, self.idvar, g, weights=g[self._weights],
-                                         family=linkdist).fit()
-
-            if print_results:
-                print(self.out_model.summary())
+            self._add_model('outcome', self.outcome, model, restriction, 'binary', print_results)
         else:
             self._modelform = model
             self._printseqregresults = print_results
@@ -310,37 +300,12 @@ class TimeVaryGFormula:
         """
         if type(label) is not int:
             raise ValueError('Label must be an integer')
-
-        # Building predictive model
-        g = self.gf.copy()
-        if restriction is not None:
-            g = g.loc[eval(restriction)].copy()
-
-        if self._weights is None:  # Unweighted g-formula
-            if var_type == 'binary':
-                linkdist = sm.families.family.Binomial()
-                m = smf.glm(covariate + ' ~ ' + model, g, family=linkdist)
-            elif var_type == 'continuous':
-                linkdist = sm.families.family.Gaussian(sm.families.links.identity)
-                m = smf.gls(covariate + ' ~ ' + model, g)
-            else:
-                raise ValueError('Only binary or continuous covariates are currently supported')
-        else:  # Weighted g-formula
-            if var_type == 'binary':
-                linkdist = sm.families.family.Binomial()
-                m = smf.gee(covariate + ' ~ ' + model, self.idvar, g, weights=g[self._weights], family=linkdist)
-            elif var_type == 'continuous':
-                linkdist = sm.families.family.Gaussian(sm.families.links.identity)
-                m = smf.gee(covariate + ' ~ ' + model, self.idvar, g, weights=g[self._weights], family=linkdist)
-            else:
-                raise ValueError('Only binary or continuous covariates are currently supported')
-
-        f = m.fit()
-        if print_results:
-            print(f.summary())
+        if var_type not in ['binary', 'continuous']:
+            raise ValueError('Only binary or continuous covariates are currently supported')
 
         # Adding to lists, it is used to predict variables later on for the time-varying...
-        self._covariate_models.append(f)
+        self._covariate_models.append(None)
+        self._add_model(len(self._covariate_models) - 1, covariate, model, restriction, var_type, print_results)
         self._covariate_model_index.append(label)
         self._covariate.append(covariate)
         self._covariate_type.append(var_type)
@@ -349,7 +314,75 @@ class TimeVaryGFormula:
         else:
             self._covariate_recode.append(recode)
 
-    def fit(self, treatment, lags=None, sample=10000, t_max=None, in_recode=None, out_recode=None):
+    def fit_models(self, n_jobs=1):
+        """Fit all exposure, outcome, and covariate models that have been specified but not yet fit. This is only
+        needed when TimeVaryGFormula is initialized with defer_models=True, since otherwise each model is fit when it
+        is specified. If any models are still waiting to be fit, fit() and fit_plans() call this function first.
+
+        The design matrix for each distinct right-hand side of the model formulas is built once from the full data and
+        shared by all models using it. Each model is fit to its restricted rows of that design, after dropping columns
+        that are all zero in those rows (like categories that do not occur under the restriction)
+
+        Parameters
+        ----------
+        n_jobs : int, optional
+            Number of processes to fit the models in. Since the models are independent of each other, they can be fit
+            concurrently. Default is 1, which fits the models one after another. On Windows, calls with n_jobs above 1
+            must be protected by `if __name__ == '__main__':`
+        """
+        if type(n_jobs) is not int or n_jobs < 1:
+            raise ValueError('n_jobs must be a positive integer')
+        specs, self._pending_models = self._pending_models, []
+        if len(specs) == 0:
+            return
+
+        # Building the design matrix once for all models with the same formula
+        designs = {}
+        tasks = []
+        for spec in specs:
+            if spec['model'] not in designs:
+                info = patsy.incr_dbuilder(spec['model'], lambda: iter([self.gf]), eval_env=0)
+                x = patsy.build_design_matrices([info], self.gf, return_type='dataframe')[0].reindex(self.gf.index)
+                designs[spec['model']] = (info, x, np.asarray(x.notnull().all(axis=1)))
+            info, x, rows = designs[spec['model']]
+
+            # selecting the rows of the design the model is fit to
+            g = self.gf
+            rows = rows & np.asarray(g[spec['variable']].notnull())
+            if spec['restriction'] is not None:
+                rows = rows & np.asarray(eval(spec['restriction']))
+            exog = x.loc[rows]
+            keep = np.asarray((exog != 0).any(axis=0))
+            exog = exog.loc[:, keep]
+            task = {'var_type': spec['var_type'], 'endog': g.loc[rows, spec['variable']], 'exog': exog,
+                    'groups': None, 'weights': None}
+            if self._weights is not None:
+                task['groups'] = g.loc[rows, self.idvar]
+                task['weights'] = g.loc[rows, self._weights]
+            tasks.append(task)
+            spec['design_info'] = (info, keep)
+
+        # Fitting the independent models, concurrently if requested
+        if n_jobs == 1:
+            fits = [_fit_nuisance_model(t) for t in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                fits = list(executor.map(_fit_nuisance_model, tasks))
+
+        for spec, f in zip(specs, fits):
+            # the design is kept, so the simulated data can be coded the same way when predicting
+            self._designs[spec['target']] = spec['design_info']
+            if spec['print_results']:
+                print(f.summary())
+            if spec['target'] == 'exposure':
+                self.exp_model = f
+            elif spec['target'] == 'outcome':
+                self.out_model = f
+            else:
+                self._covariate_models[spec['target']] = f
+
+    def fit(self, treatment, lags=None, sample=10000, t_max=None, in_recode=None, out_recode=None, output='full',
+            sink=None, tolerance=None, time_budget=None, all_times=False, checkpoint=None, max_batches=100):
         """Estimate the counterfactual outcomes under the specified treatment plan using the previously specified
         regression models. For the Monte Carlo g-formula, both the exposure and outcome models need to be specified
         before fit can be called. For sequential regression, only the outcome model needs to be specified.
@@ -383,239 +416,618 @@ class TimeVaryGFormula:
             On the fly recoding of variables done at the end of the Monte Carlo loop. Needed for operations like
             counting the number of days with a treatment. This is executed at each end of the Monte Carlo g-formula
             time steps
+        output : str, optional
+            Format of predicted_outcomes for the Monte Carlo g-formula. Options include
+            * full : every simulated person-time row, sorted by simulated individual and time. Default
+            * compact : every simulated person-time row stored with compact data types (int8 exposure, outcome, and
+                binary covariates, int16 times, float32 continuous covariates). Rows are kept in time-step order
+            * summary : only the number at risk, number of events, and cumulative risk at each time step are kept. No
+                person-time rows are stored
+        sink : str, optional
+            Directory to stream the simulated person-time rows to. Each time step is written to its own Parquet file
+            as it is simulated (requires pyarrow or fastparquet) and predicted_outcomes is set to None. The files
+            can be read back together with pandas.read_parquet(sink). Only available with output 'full' or 'compact'
+        tolerance : float, optional
+            Monte Carlo standard error of the cumulative risk at t_max to stop at. When tolerance (or time_budget) is
+            specified, the population is simulated in batches of 'sample' individuals until the Monte Carlo standard
+            error is at or below the tolerance. Default is None, which simulates a single batch
+        time_budget : float, optional
+            Number of seconds after which no further batches are simulated. Can be combined with tolerance, where the
+            first criteria met stops the simulation. Default is None
+        all_times : bool, optional
+            Whether the tolerance must be met by the cumulative risk at every time, rather than only at t_max. Default
+            is False
+        checkpoint : str, optional
+            Directory to save the state of the Monte Carlo g-formula to after every time step (the current at-risk
+            population, the random number generator state, and the results so far). If the directory holds a
+            checkpoint from an interrupted call to fit with the same arguments, the simulation resumes from the last
+            completed time step and gives the same results as an uninterrupted run. The checkpoint files are removed
+            once the simulation finishes. Default is None, which does not save checkpoints
+        max_batches : int, optional
+            Maximum number of batches to simulate when tolerance (or time_budget) is specified, so an unreachable
+            tolerance does not simulate forever. Default is 100
+
+        Notes
+        -----
+        For the Monte Carlo g-formula, the achieved precision is stored in mc_standard_error (the Monte Carlo standard
+        error of the cumulative risk at t_max, or the largest across all times with all_times=True) and the total
+        number of simulated individuals in mc_sample_size.
+
+        Resuming from a checkpoint restores the state of numpy's global random number generator, so any random draws
+        made between the interrupted run and the resumed call to fit do not affect the results
         """
         if self._outcome_model_fit is False:
             raise ValueError('Before the g-formula can be calculated, the outcome model must be specified')
         if (type(treatment) != str) and (type(treatment) != list):
             raise ValueError('Specified treatment must be a string object')
+        self.fit_models()
 
         # Monte Carlo Estimation
         if self._mc:
             if self._exposure_model_fit is False:
                 raise ValueError('Before the g-formula can be calculated, the exposure model must be specified for '
                                  'Monte Carlo estimation')
-            # Getting data all set
-            if self._weights is None:
-                gs = self.gf.loc[(self.gf.groupby(self.idvar).cumcount() == 0) == True].sample(n=sample, replace=True)
-            else:
-                gs = self.gf.loc[(self.gf.groupby(self.idvar).cumcount() == 0) == True].sample(n=sample,
-                                                                                               weights=self._weights,
-                                                                                               replace=True)
-            gs['uid_g_zepid'] = [v for v in range(sample)]
-
-            # Background preparations
-            gs[self.outcome] = 0
+            if output not in ['full', 'compact', 'summary']:
+                raise ValueError('output must be one of "full", "compact", or "summary"')
+            if sink is not None and output == 'summary':
+                raise ValueError('sink is only available for "full" or "compact" output')
+            if tolerance is not None and tolerance <= 0:
+                raise ValueError('tolerance must be a positive number')
+            if type(max_batches) is not int or max_batches < 1:
+                raise ValueError('max_batches must be a positive integer')
+            adaptive = (tolerance is not None) or (time_budget is not None)
 
             # getting maximum time steps to run g-formula
             if t_max is None:
                 t_max = np.max(self.gf[self.time_out])
 
-            # Estimating via MC process
-            self.predicted_outcomes = self._monte_carlo(gs, treatment, t_max, in_recode, out_recode, lags)
+            # Picking up from a previous checkpoint, if there is one
+            start = time.time()
+            simulated, summaries = [], []
+            resume, save = None, None
+            if checkpoint is not None:
+                settings = {'treatment': treatment, 'lags': lags, 'sample': sample, 't_max': t_max,
+                            'in_recode': in_recode, 'out_recode': out_recode, 'output': output, 'sink': sink,
+                            'tolerance': tolerance, 'time_budget': time_budget, 'all_times': all_times,
+                            'max_batches': max_batches}
+                resume = self._load_checkpoint(checkpoint, settings)
+                if resume is not None:
+                    start -= resume['elapsed']
+                    summaries = resume['summaries']
+                    for b in range(len(summaries)):
+                        if output == 'summary' or sink is not None:
+                            simulated.append(None)
+                        else:
+                            simulated.append(pd.read_pickle(os.path.join(checkpoint, 'gformula_batch_' + str(b + 1) +
+                                                                         '.pkl')))
+                    np.random.set_state(resume['rng_state'])
+                    if resume['step'] is None:  # interrupted between batches
+                        resume = None
+                    else:
+                        resume['frames'] = [pd.read_pickle(f) for f in resume['blocks']]
+
+            # Estimating via MC process, in batches if adaptive stopping is requested
+            while True:
+                batch = len(summaries) + 1
+                if resume is None:
+                    gs = self._resample(sample, uid_start=sample * len(summaries))
+                else:
+                    gs = pd.read_pickle(resume['gs'])
+                if sink is not None and adaptive:
+                    batch_sink = os.path.join(sink, 'batch_' + str(batch))
+                else:
+                    batch_sink = sink
+                if checkpoint is not None:
+                    save = self._checkpointer(checkpoint, settings, summaries, start, batch, gs,
+                                              blocks=None if resume is None else resume['blocks'])
+                data, summary = self._monte_carlo(gs, treatment, t_max, in_recode, out_recode, lags,
+                                                  output=output, sink=batch_sink, checkpoint=save, resume=resume)
+                resume = None
+                simulated.append(data)
+                summaries.append(summary)
+                if checkpoint is not None:  # completed batches are kept whole, rather than by time step
+                    if data is not None:
+                        pd.to_pickle(data, os.path.join(checkpoint, 'gformula_batch_' + str(batch) + '.pkl'))
+                    self._save_checkpoint(checkpoint, {'settings': settings, 'summaries': summaries,
+                                                       'elapsed': time.time() - start, 'step': None,
+                                                       'rng_state': np.random.get_state()})
+                    self._clear_checkpoint(checkpoint, steps_only=True)
+
+                # Monte Carlo standard error of the cumulative risk
+                n = sample * len(summaries)
+                risk = np.cumsum(np.sum([sf['events'] for sf in summaries], axis=0)) / n
+                mc_se = np.sqrt(risk * (1 - risk) / n)
+                precision = np.max(mc_se) if all_times else mc_se[-1]
+                if not adaptive:
+                    break
+                if tolerance is not None and precision <= tolerance:
+                    break
+                if time_budget is not None and (time.time() - start) >= time_budget:
+                    if tolerance is not None:
+                        warnings.warn('The time budget was reached before the tolerance. The achieved Monte Carlo '
+                                      'standard error is ' + str(round(precision, 6)), UserWarning)
+                    break
+                if len(summaries) >= max_batches:
+                    if tolerance is not None:
+                        warnings.warn('max_batches was reached before the tolerance. The achieved Monte Carlo '
+                                      'standard error is ' + str(round(precision, 6)), UserWarning)
+                    break
+
+            if checkpoint is not None:
+                self._clear_checkpoint(checkpoint)
+            self.mc_standard_error = precision
+            self.mc_sample_size = n
+            if output == 'summary':
+                self.predicted_outcomes = pd.DataFrame({self.time_out: summaries[0][self.time_out],
+                                                        'at_risk': np.sum([sf['at_risk'] for sf in summaries],
+                                                                          axis=0),
+                                                        'events': np.sum([sf['events'] for sf in summaries], axis=0),
+                                                        'risk': risk})
+            elif sink is not None:
+                self.predicted_outcomes = None
+            elif len(simulated) == 1:
+                self.predicted_outcomes = simulated[0]
+            else:  # batches have increasing uid, so the stacked full output remains sorted
+                self.predicted_outcomes = pd.concat(simulated, ignore_index=True)
 
         # Sequential Regression Estimation
         else:
             if self._exposure_model_fit or len(self._covariate_models) > 0:
                 raise ValueError('Only the outcome model needs be specified for the sequential regression estimator')
-            self.predicted_outcomes = self._sequential_regression(treatment=treatment, tmax=t_max)
+            self.predicted_outcomes = self._sequential_regression(treatments=[treatment], tmax=t_max)[0]
 
-    def _monte_carlo(self, gs, treatment, t_max, in_recode, out_recode, lags):
-        """Hidden function that executes the Monte Carlo estimation process for the g-formula
+    def fit_plans(self, treatments, lags=None, sample=10000, t_max=None, in_recode=None, out_recode=None,
+                  output='summary', n_jobs=1):
+        """Estimate the counterfactual outcomes under several treatment plans at once. For the Monte Carlo
+        g-formula, every plan is simulated from the same resampled population and shares the same per-person, per-time
+        step random numbers (common random numbers). Differences between plans then have far less Monte Carlo error
+        than differences between separate calls to fit(), so fewer simulated individuals are needed for the same
+        precision
+
+        For sequential regression, the data is reshaped once and the backwards regressions for all plans are run
+        together. At each time point the design matrix is shared by the plans, and the model for the last time point
+        (which only uses the observed outcomes) is fit once
+
+        Parameters
+        ----------
+        treatments : list
+            List of treatment strategies to compare. Each follows the options of the treatment argument in fit(). The
+            first plan in the list is used as the reference for the risk differences
+        lags : dict, optional
+            Dictionary of variable names and the corresponding lagged variable name. See fit()
+        sample : int, optional
+            Number of individuals to sample from the original data with replacement. The default is 10000
+        t_max : int, optional
+            Maximum time to run Monte Carlo g-formula until. Default is None, which uses the maximum time of the input
+            dataframe.
+        in_recode : str, optional
+            On the fly recoding of variables done at each start of the Monte Carlo g-formula time steps. See fit()
+        out_recode : str, optional
+            On the fly recoding of variables done at each end of the Monte Carlo g-formula time steps. See fit()
+        output : str, optional
+            Format of the predicted outcomes for each plan. Options are 'full', 'compact', or 'summary' (default). See
+            fit()
+        n_jobs : int, optional
+            Number of processes to fit the regression models of the different plans in at each time point. Only used
+            by sequential regression. Default is 1
+
+        Returns
+        -------
+        predicted_outcomes
+            Dictionary of the predicted outcomes for each treatment plan
+        plan_summary
+            DataFrame with the cumulative risk at t_max and the risk difference compared to the first plan for each
+            plan. For the Monte Carlo g-formula, the corresponding Monte Carlo standard errors are also included
+        """
+        if self._outcome_model_fit is False:
+            raise ValueError('Before the g-formula can be calculated, the outcome model must be specified')
+        if type(treatments) != list or len(treatments) == 0:
+            raise ValueError('treatments must be a list of treatment plans')
+        if not all(type(t) == str for t in treatments):
+            raise ValueError('Specified treatments must be string objects')
+        if len(set(treatments)) != len(treatments):
+            raise ValueError('Each treatment plan can only be specified once')
+        if type(n_jobs) is not int or n_jobs < 1:
+            raise ValueError('n_jobs must be a positive integer')
+
+        # Sequential Regression Estimation
+        if not self._mc:
+            if self._exposure_model_fit or len(self._covariate_models) > 0:
+                raise ValueError('Only the outcome model needs be specified for the sequential regression estimator')
+            estimates = self._sequential_regression(treatments=treatments, tmax=t_max, n_jobs=n_jobs)
+            self.predicted_outcomes = dict(zip(treatments, estimates))
+            self.plan_summary = pd.DataFrame({'risk': estimates,
+                                              'risk_difference': estimates - estimates[0]},
+                                             index=pd.Index(treatments, name='treatment'))
+            return
+
+        # Monte Carlo Estimation
+        if self._exposure_model_fit is False:
+            raise ValueError('Before the g-formula can be calculated, the exposure model must be specified for '
+                             'Monte Carlo estimation')
+        if output not in ['full', 'compact', 'summary']:
+            raise ValueError('output must be one of "full", "compact", or "summary"')
+        if t_max is None:
+            t_max = np.max(self.gf[self.time_out])
+        self.fit_models()
+
+        # One shared resampling and setup for all plans
+        gs = self._resample(sample)
+        if self._weights is None:
+            keep = ['uid_g_zepid', self.exposure, self.outcome, self.time_in, self.time_out] + self._covariate
+        else:
+            keep = ['uid_g_zepid', self.exposure, self.outcome, self._weights, self.time_in,
+                    self.time_out] + self._covariate
+        plans = [gs.copy() for t in treatments]
+        simulated = [[] for t in treatments]
+        events = [[] for t in treatments]
+        at_risk = [[] for t in treatments]
+        had_event = np.zeros((len(treatments), sample))
+
+        # Simulating all plans in lockstep, so each time step draws one set of random numbers for everyone
+        for i in range(int(t_max)):
+            draws = {'covariates': [np.random.uniform(size=sample) if v == 'binary' else
+                                    np.random.standard_normal(size=sample) for v in self._covariate_type],
+                     'exposure': np.random.uniform(size=sample),
+                     'outcome': np.random.uniform(size=sample)}
+            for p, treatment in enumerate(treatments):
+                g = plans[p]
+                g = g.loc[g[self.outcome] == 0].reset_index(drop=True).copy()
+                g = self._mc_step(g, i, treatment, in_recode, out_recode, lags, draws=draws)
+                plans[p] = g
+
+                at_risk[p].append(g.shape[0])
+                events[p].append(int(np.sum(g[self.outcome])))
+                had_event[p, np.asarray(g.loc[g[self.outcome] == 1, 'uid_g_zepid'])] = 1
+                if output != 'summary':
+                    block = g[keep]
+                    if output == 'compact':
+                        block = self._compact_block(block, t_max=t_max)
+                    simulated[p].append(block)
+
+        # Gathering the results for each plan
+        self.predicted_outcomes = {}
+        for p, treatment in enumerate(treatments):
+            if output == 'summary':
+                self.predicted_outcomes[treatment] = pd.DataFrame({self.time_out: np.arange(1, int(t_max) + 1),
+                                                                   'at_risk': at_risk[p],
+                                                                   'events': events[p],
+                                                                   'risk': np.cumsum(events[p]) / sample})
+            else:
+                res = pd.concat(simulated[p], ignore_index=True)
+                if output == 'full':
+                    res = res.sort_values(by=['uid_g_zepid', self.time_in]).reset_index(drop=True)
+                self.predicted_outcomes[treatment] = res
+
+        # Risk differences are paired by simulated individual, so common random numbers reduce their error
+        differences = had_event - had_event[0]
+        self.plan_summary = pd.DataFrame({'risk': np.mean(had_event, axis=1),
+                                          'mc_standard_error': np.std(had_event, axis=1) / np.sqrt(sample),
+                                          'risk_difference': np.mean(differences, axis=1),
+                                          'rd_mc_standard_error': np.std(differences, axis=1) / np.sqrt(sample)},
+                                         index=pd.Index(treatments, name='treatment'))
+        self.mc_sample_size = sample
+
+    def _monte_carlo(self, gs, treatment, t_max, in_recode, out_recode, lags, output='full', sink=None,
+                     checkpoint=None, resume=None):
+        """Hidden function that executes the Monte Carlo estimation process for the g-formula. checkpoint is called
+        after each time step with the current state, and resume is a previously saved state to continue from
         """
         # setting up some parts outside of Monte Carlo loop to speed things up
         mc_simulated_data = []
-        g = gs.copy()
-        if len(self._covariate_models) != 0:
-            cov_model_order = (sorted(range(len(self._covariate_model_index)),
-                                      key=self._covariate_model_index.__getitem__))
-            run_cov = True
+        at_risk, events = [], []
+        if self._weights is None:
+            keep = ['uid_g_zepid', self.exposure, self.outcome, self.time_in, self.time_out] + self._covariate
         else:
-            run_cov = False
+            keep = ['uid_g_zepid', self.exposure, self.outcome, self._weights, self.time_in,
+                    self.time_out] + self._covariate
+        if sink is not None:
+            os.makedirs(sink, exist_ok=True)
+        if resume is None:
+            g = gs.copy()
+            first = 0
+        else:
+            g = resume['g']
+            at_risk, events = list(resume['at_risk']), list(resume['events'])
+            mc_simulated_data = list(resume['frames'])
+            first = resume['step'] + 1
 
         # Monte Carlo for loop
-        for i in range(int(t_max)):
+        for i in range(first, int(t_max)):
             g = g.loc[g[self.outcome] == 0].reset_index(drop=True).copy()
-            g[self.time_in] = i
-            if in_recode is not None:
-                exec(in_recode)
-
-            # predict time-varying covariates
-            if run_cov:
-                for j in cov_model_order:
-                    g[self._covariate[j]] = self._predict(df=g, model=self._covariate_models[j],
-                                                          variable=self._covariate_type[j])
-                    exec(self._covariate_recode[j])
-
-            # predict exposure when customized treatments
-            if treatment == 'all':
-                g[self.exposure] = 1
-            elif treatment == 'none':
-                g[self.exposure] = 0
-            elif treatment == 'natural':
-                g[self.exposure] = self._predict(df=g, model=self.exp_model, variable='binary')
-            else:  # custom exposure pattern
-                g[self.exposure] = self._predict(df=g, model=self.exp_model, variable='binary')
-                g[self.exposure] = np.where(eval(treatment), 1, 0)
-
-            # predict outcome
-            g[self.outcome] = self._predict(df=g, model=self.out_model, variable='binary')
-            g[self.time_out] = i + 1
-
-            # executing any code before appending
-            if out_recode is not None:
-                exec(out_recode)
-
-            # updating lagged variables
-            if lags is not None:
-                for k, v in lags.items():
-                    g[v] = g[k]
-
-            # stacking simulated data in a list
-            mc_simulated_data.append(g)
+            g = self._mc_step(g, i, treatment, in_recode, out_recode, lags)
+
+            # tracking the risk set and events on the fly
+            at_risk.append(g.shape[0])
+            events.append(int(np.sum(g[self.outcome])))
+
+            # stacking (or streaming) the simulated data
+            if output != 'summary':
+                block = g[keep]
+                if output == 'compact':
+                    block = self._compact_block(block, t_max=t_max)
+                if sink is None:
+                    mc_simulated_data.append(block)
+                else:
+                    block.to_parquet(os.path.join(sink, 'step_' + str(i + 1).zfill(len(str(int(t_max)))) +
+                                                  '.parquet'), index=False)
+
+            if checkpoint is not None:
+                checkpoint(i, g, at_risk, events, block if (output != 'summary' and sink is None) else None)
+
+        summary = pd.DataFrame({self.time_out: np.arange(1, int(t_max) + 1),
+                                'at_risk': at_risk,
+                                'events': events,
+                                'risk': np.cumsum(events) / gs.shape[0]})
+        if output == 'summary' or sink is not None:
+            return None, summary
 
         try:
             gs = pd.concat(mc_simulated_data, ignore_index=True, sort=False)
         except TypeError:  # gets around pandas <0.22 error
             gs = pd.concat(mc_simulated_data, ignore_index=True)
+        if output == 'compact':  # sorting is skipped, since rows are already grouped by time step
+            return gs, summary
+        return gs.sort_values(by=['uid_g_zepid', self.time_in]).reset_index(drop=True), summary
+
+    def _add_model(self, target, variable, model, restriction, var_type, print_results):
+        """Hidden function that records a model specification, and fits it unless the models are deferred
+        """
+        if target == 'exposure' or target == 'outcome':  # replacing an earlier specification that is still pending
+            self._pending_models = [m for m in self._pending_models if m['target'] != target]
+        self._pending_models.append({'target': target, 'variable': variable, 'model': model,
+                                     'restriction': restriction, 'var_type': var_type,
+                                     'print_results': print_results})
+        if not self._defer_models:
+            self.fit_models()
+
+    def _checkpointer(self, path, settings, summaries, start, batch, gs, blocks=None):
+        """Hidden function that creates the callback used by _monte_carlo to save a checkpoint after each time step.
+        The resampled population of the batch is written once, when a new batch starts (blocks is None), and each
+        checkpoint refers to that file
+        """
+        os.makedirs(path, exist_ok=True)
+        population = os.path.join(path, 'gformula_batch_' + str(batch) + '_population.pkl')
+        if blocks is None:
+            pd.to_pickle(gs, population)
+        blocks = [] if blocks is None else list(blocks)
+
+        def save(step, g, at_risk, events, block):
+            if block is not None:
+                blocks.append(os.path.join(path, 'gformula_batch_' + str(batch) + '_step_' + str(step + 1) + '.pkl'))
+                pd.to_pickle(block, blocks[-1])
+            self._save_checkpoint(path, {'settings': settings, 'summaries': summaries,
+                                         'elapsed': time.time() - start, 'gs': population, 'step': step, 'g': g,
+                                         'at_risk': at_risk, 'events': events, 'blocks': list(blocks),
+                                         'rng_state': np.random.get_state()})
+
+        return save
+
+    @staticmethod
+    def _save_checkpoint(path, state):
+        """Hidden function that writes the checkpoint state. The file is replaced in a single step, so an interruption
+        while writing leaves the previous checkpoint intact
+        """
+        pd.to_pickle(state, os.path.join(path, 'gformula_state.pkl.tmp'))
+        os.replace(os.path.join(path, 'gformula_state.pkl.tmp'), os.path.join(path, 'gformula_state.pkl'))
+
+    @staticmethod
+    def _load_checkpoint(path, settings):
+        """Hidden function that reads the checkpoint state, if there is one
+        """
+        f = os.path.join(path, 'gformula_state.pkl')
+        if not os.path.isfile(f):
+            return None
+        state = pd.read_pickle(f)
+        if state['settings'] != settings:
+            raise ValueError('The checkpoint in ' + str(path) + ' was created by a call to fit() with different '
+                             'arguments. Use the same arguments to resume, or a different checkpoint directory')
+        return state
+
+    @staticmethod
+    def _clear_checkpoint(path, steps_only=False):
+        """Hidden function that removes the checkpoint files
+        """
+        for f in os.listdir(path):
+            if f.startswith('gformula_') and ('_step_' in f or f.endswith('_population.pkl') or not steps_only):
+                os.remove(os.path.join(path, f))
+
+    def _mc_step(self, g, i, treatment, in_recode, out_recode, lags, draws=None):
+        """Hidden function that simulates a single time step of the Monte Carlo g-formula for those still at risk. If
+        draws are provided, they are the shared random numbers (indexed by uid_g_zepid) to use in place of new draws
+        """
+        if draws is None:
+            draws = {'covariates': [None] * len(self._covariate), 'exposure': None, 'outcome': None}
+            rows = None
+        else:
+            rows = np.asarray(g['uid_g_zepid'])
+
+        def shared(d):
+            return None if d is None else d[rows]
+
+        g[self.time_in] = i
+        if in_recode is not None:
+            exec(in_recode)
+
+        # predict time-varying covariates
+        for j in sorted(range(len(self._covariate_model_index)), key=self._covariate_model_index.__getitem__):
+            g[self._covariate[j]] = self._predict(df=g, model=self._covariate_models[j], design=self._designs[j],
+                                                  variable=self._covariate_type[j],
+                                                  draws=shared(draws['covariates'][j]))
+            exec(self._covariate_recode[j])
+
+        # predict exposure when customized treatments
+        if treatment == 'all':
+            g[self.exposure] = 1
+        elif treatment == 'none':
+            g[self.exposure] = 0
+        elif treatment == 'natural':
+            g[self.exposure] = self._predict(df=g, model=self.exp_model, design=self._designs['exposure'],
+                                             variable='binary', draws=shared(draws['exposure']))
+        else:  # custom exposure pattern
+            g[self.exposure] = self._predict(df=g, model=self.exp_model, design=self._designs['exposure'],
+                                             variable='binary', draws=shared(draws['exposure']))
+            g[self.exposure] = np.where(eval(treatment), 1, 0)
+
+        # predict outcome
+        g[self.outcome] = self._predict(df=g, model=self.out_model, design=self._designs['outcome'], variable='binary',
+                                        draws=shared(draws['outcome']))
+        g[self.time_out] = i + 1
+
+        # executing any code before appending
+        if out_recode is not None:
+            exec(out_recode)
+
+        # updating lagged variables
+        if lags is not None:
+            for k, v in lags.items():
+                g[v] = g[k]
+        return g
+
+    def _resample(self, sample, uid_start=0):
+        """Hidden function that resamples the baseline observations to start the Monte Carlo g-formula from
+        """
         if self._weights is None:
-            return gs[['uid_g_zepid', self.exposure, self.outcome, self.time_in, self.time_out] +
-                      self._covariate].sort_values(by=['uid_g_zepid',
-                                                       self.time_in]).reset_index(drop=True)
+            gs = self.gf.loc[(self.gf.groupby(self.idvar).cumcount() == 0) == True].sample(n=sample, replace=True)
         else:
-            return gs[['uid_g_zepid', self.exposure, self.outcome, self._weights, self.time_in,
-                       self.time_out] + self._covariate].sort_values(by=['uid_g_zepid',
-                                                                         self.time_in]).reset_index(drop=True)
+            gs = self.gf.loc[(self.gf.groupby(self.idvar).cumcount() == 0) == True].sample(n=sample,
+                                                                                           weights=self._weights,
+                                                                                           replace=True)
+        gs['uid_g_zepid'] = np.arange(uid_start, uid_start + sample)
+
+        # Background preparations
+        gs[self.outcome] = 0
+        return gs
 
-    def _sequential_regression(self, treatment, tmax):
-        """Hidden function that executes the sequential regression estimation for g-formula
+    def _compact_block(self, block, t_max):
+        """Hidden function to downcast a block of simulated person-time rows to compact data types
+        """
+        time_type = np.int16 if t_max < np.iinfo(np.int16).max else np.int32
+        types = {'uid_g_zepid': np.int32,
+                 self.exposure: np.int8,
+                 self.outcome: np.int8,
+                 self.time_in: time_type,
+                 self.time_out: time_type}
+        for c, v in zip(self._covariate, self._covariate_type):
+            types[c] = np.int8 if v == 'binary' else np.float32
+        return block.astype(types)
+
+    def _sequential_regression(self, treatments, tmax, n_jobs=1):
+        """Hidden function that executes the sequential regression estimation for g-formula. All treatments are
+        estimated together in one backwards pass through time, and an array of the estimates is returned
         """
         # TODO allow option to include different estimation models for each time point or the same model
-        if treatment == 'natural':
+        if 'natural' in treatments:
             # Thoughts: MC estimator needs natural course as a check. This should not apply to SR estimator
             raise ValueError('Natural course estimation is not clear to me with Sequential Regression Estimator. '
                              'Therefore, "natural" is not implemented')
 
-        # If custom treatment, it gets evaluated here
-        g = self.gf
-        if treatment not in ['all', 'none']:
-            g['__indicator'] = np.where(eval(treatment), 1, 0)
-
         # Restricting based on tmax argument
+        g = self.gf
         if tmax is None:
             pass
         elif tmax in list(self.gf[self.time_out].unique()):
-            g = g.loc[g[self.time_out] <= tmax].copy()
+            g = g.loc[g[self.time_out] <= tmax]
         else:
             warnings.warn("The t_max argument specifies a time that is not observed in the data. All times less than"
                           "the specified t_max argument included in the estimation procedure", UserWarning)
-            g = g.loc[g[self.time_out] <= tmax].copy()
+            g = g.loc[g[self.time_out] <= tmax]
 
-        # Converting dataframe from long-to-wide for easier estimation
-        column_labels = list(g.columns)  # Getting all column labels (important to match with formula)
-        df = self._long_to_wide(df=g, id=self.idvar, t=self.time_out)
-        linkdist = sm.families.family.Binomial()
-        rt_points = sorted(list(g[self.time_out].unique()), reverse=True)  # Getting all t's to backward loop
-        t_points = sorted(list(g[self.time_out].unique()), reverse=False)  # Getting all t's to forward loop
+        # Converting dataframe from long to a (person x time x variable) panel with a single reshape
+        cube, ids, t_points, columns, others = self._long_to_panel(df=g, id=self.idvar, t=self.time_out)
+        v_outcome = columns.index(self.outcome)
 
         # Checking for recurrent outcomes. Recurrent are not currently supported
-        if pd.Series(df[[self.outcome + '_' + str(t) for t in sorted(t_points, reverse=False)
-                         ]].sum(axis=1, skipna=True) > 1).any():
+        if (np.nansum(cube[:, :, v_outcome], axis=1) > 1).any():
             raise ValueError('Looks like your data has multiple outcomes. Recurrent outcomes are not currently '
                              'supported')
 
-        # Step 1: Creating indicator for individuals who followed counterfactual outcome
-        treat_t_points = []
-        for t in t_points:
-            # Following treatment strategy
-            # alternative: if treat all, can do simple multiplication. if treat none, can do (1-A) simple multiplication
-            if treatment == 'all':
-                df['__indicator_' + str(t)] = np.where(df[self.exposure + '_' + str(t)] == 0, 0, np.nan)
-                df['__indicator_' + str(t)] = np.where(df[self.exposure + '_' + str(t)] == 1, 1,
-                                                       df['__indicator_' + str(t)])
-            elif treatment == 'none':
-                df['__indicator_' + str(t)] = np.where(df[self.exposure + '_' + str(t)] == 0, 1, np.nan)
-                df['__indicator_' + str(t)] = np.where(df[self.exposure + '_' + str(t)] == 1, 0,
-                                                       df['__indicator_' + str(t)])
-            else:  # custom exposure pattern
-                pass
-
-            treat_t_points.append('__indicator_' + str(t))
-            df['__check_' + str(t)] = df[treat_t_points + [self.outcome + '_' + str(t)]].prod(axis=1, skipna=True)
-
-            # This following check carries forward the outcome under the counterfactual treatment
-            if t_points.index(t) == 0:
-                pass
-            else:
-                df['__check_' + str(t)] = np.where(df['__check_' + str(t_points[t_points.index(t) - 1])] == 1,
-                                                   1, df['__check_' + str(t)])
-
-        # Step 2: Sequential Regression Estimation
-        for t in rt_points:
-            # 2.1) Relabel everything to match with the specified model (selecting out that timepoint is within)
-            d_labels = {}
-            for c in column_labels:
-                d_labels[c + '_' + str(t)] = c
-            g = df.filter(regex='_' + str(t)).rename(mapper=d_labels, axis=1).reset_index().copy()
-            g[self.time_out] = t
-
-            # 2.2) Fit the model to the observed data
-            if rt_points.index(t) == 0:
-                if self._weights is None:
-                    m = smf.glm(self.outcome + ' ~ ' + self._modelform, g, family=linkdist).fit()  # GLM
-                else:
-                    m = smf.gee(self.outcome + ' ~ ' + self._modelform, self.idvar, g,
-                                weights=df[self._weights + '_' + str(t)], family=linkdist).fit()  # Weighted, so GEE
-                if self._printseqregresults:
-                    print(m.summary())
-            else:
-                # Uses previous predicted values to estimate
-                g[self.outcome] = np.where(df['__pred_'+self.outcome+'_'+str(t_points[t_points.index(t)+1])].isna(),
-                                           g[self.outcome],
-                                           df['__pred_' + self.outcome + '_' + str(t_points[t_points.index(t)+1])])
+        # The design is set up once from all person-time, and used to code each time slice. Rows with missing values
+        # are dropped by patsy (so missing strings are not coded as a category). A category that is absent at a time
+        # point gives a column that is collinear with the others there, which the GLM fit handles by its pseudoinverse
+        info = patsy.incr_dbuilder(self._modelform, lambda: iter([g]), eval_env=0)
 
-                if self._weights is None:
-                    m = smf.glm(self.outcome + ' ~ ' + self._modelform, g, family=linkdist).fit()  # GLM
+        # Sequential Regression Estimation (backwards through time). The worker processes, if any, are started once
+        # and used for every time point
+        executor = ProcessPoolExecutor(max_workers=n_jobs) if n_jobs > 1 else None
+        preds = [None] * len(treatments)
+        try:
+            for k in reversed(range(len(t_points))):
+                t = t_points[k]
+                # 1) Selecting out the time slice. The slice is a view of the panel, so no copy of the data is made
+                g = pd.DataFrame(cube[:, k, :], columns=columns)
+                for c, v in others.items():
+                    g[c] = v[:, k]
+                g[self.idvar] = ids
+                g[self.time_out] = t
+                missing = pd.isnull(g[self.outcome]).values
+                # reindexing puts the dropped rows back as rows of NaN, keeping the design aligned with the time slice
+                x = patsy.build_design_matrices([info], g, return_type='dataframe')[0].reindex(g.index)
+                complete = np.asarray(x.notnull().all(axis=1))
+
+                # 2) Fit the model to the observed data, using previous predicted values after the last time point
+                tasks = []
+                for pred in preds:
+                    y = g[self.outcome]
+                    if pred is not None:
+                        y = pd.Series(np.where(np.isnan(pred), y, pred), name=self.outcome)
+                    rows = complete & np.asarray(y.notnull())
+                    tasks.append({'endog': y[rows], 'exog': x[rows],
+                                  'weights': None if self._weights is None else g.loc[rows, self._weights]})
+                if preds[0] is None:  # only observed outcomes at the last time point, so every plan has the same model
+                    fits = [_fit_sequential_model(tasks[0])] * len(treatments)
+                elif executor is None:
+                    fits = [_fit_sequential_model(task) for task in tasks]
                 else:
-                    m = smf.gee(self.outcome + ' ~ ' + self._modelform, self.idvar, g,
-                                weights=df[self._weights + '_' + str(t)], family=linkdist).fit()  # Weighted, so GEE
+                    fits = list(executor.map(_fit_sequential_model, tasks))
                 if self._printseqregresults:
-                    print(m.summary())
-
-            # 2.3) Getting Counterfactual Treatment Values
-            if treatment == 'all':
-                g[self.exposure] = 1
-            elif treatment == 'none':
-                g[self.exposure] = 0
-            else:
-                g[self.exposure] = np.where(eval(treatment), 1, 0)
-
-            # Predicted values based on counterfactual treatment strategy from predicted model
-            df['__pred_' + self.outcome + '_' + str(t)] = np.where(df[self.outcome + '_' + str(t)].isna(),
-                                                                   np.nan,
-                                                                   m.predict(g))
-            # If followed counterfactual treatment & had outcome, then always considered to have outcome past that t
-            df['__cf_' + self.outcome + '_' + str(t)] = np.where((df['__check_' + str(t)] == 1),
-                                                                 1,
-                                                                 df['__pred_' + self.outcome + '_' + str(t)])
-
-        # Step 3) Returning estimated results
+                    for m in (fits[:1] if preds[0] is None else fits):
+                        print(m.summary())
+
+                # 3) Getting Counterfactual Treatment Values
+                for p, treatment in enumerate(treatments):
+                    if treatment == 'all':
+                        a = 1
+                    elif treatment == 'none':
+                        a = 0
+                    else:
+                        a = np.where(eval(treatment), 1, 0)
+                    gc = g.assign(**{self.exposure: a})
+                    xc = patsy.build_design_matrices([info], gc, return_type='dataframe')[0].reindex(g.index)
+
+                    # Predicted values based on counterfactual treatment strategy from predicted model
+                    preds[p] = np.where(missing, np.nan, fits[p].predict(np.asarray(xc)))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        # Returning estimated results
         if self._weights is None:
-            return np.mean(df['__pred_' + self.outcome + '_' + str(t_points[0])])
+            return np.array([np.nanmean(pred) for pred in preds])
         else:
-            return np.average(df['__pred_' + self.outcome + '_' + str(t_points[0])],
-                              weights=df[self._weights + '_' + str(t_points[0])])
+            w = cube[:, 0, columns.index(self._weights)]
+            return np.array([np.average(pred, weights=w) for pred in preds])
 
     @staticmethod
-    def _predict(df, model, variable):
-        """Hidden predict method to shorten the Monte Carlo estimation code
+    def _predict(df, model, design, variable, draws=None):
+        """Hidden predict method to shorten the Monte Carlo estimation code. design is the patsy design information
+        of the model and the design columns kept in its fit, used to build the design matrix of df. draws are optional
+        pre-generated uniform (binary) or standard normal (continuous) random numbers, used for common random numbers
         """
-        # pp = data.mul(model.params).sum(axis=1) # Alternative to statsmodels.predict(), but too much too implement
-        pp = model.predict(df)
+        info, keep = design
+        x = patsy.build_design_matrices([info], df, NA_action=patsy.NAAction(NA_types=[]))[0]
+        pp = model.predict(np.asarray(x)[:, keep])
         if variable == 'binary':
             # pp = odds_to_probability(np.exp(pp))  # assumes a logit model. For non-statsmodel.predict() option
-            pred = np.random.binomial(1, pp, size=len(pp))
+            if draws is None:
+                pred = np.random.binomial(1, pp, size=len(pp))
+            else:
+                pred = np.where(draws < np.asarray(pp), 1, 0)
         elif variable == 'continuous':
-            pred = np.random.normal(loc=pp, scale=np.std(model.resid), size=len(pp))
+            if draws is None:
+                pred = np.random.normal(loc=pp, scale=np.std(model.resid), size=len(pp))
+            else:
+                pred = np.asarray(pp) + np.std(model.resid) * draws
         else:
             raise ValueError('That option is not supported')
         return pred
@@ -624,13 +1036,67 @@ class TimeVaryGFormula:
     def _long_to_wide(df, id, t):
         """Hidden function for sequential regression that converts from long to wide data set
         """
-        reshaped = []
+        columns = [c for c in df.columns if c != id and c != t]
+        wide = df.set_index([id, t])[columns].unstack(t)
+        wide.columns = [str(c) + '_' + str(v) for c, v in wide.columns]
+        return wide
+
+    @staticmethod
+    def _long_to_panel(df, id, t):
+        """Hidden function for sequential regression that converts a long data set into a (person x time x variable)
+        NumPy array in a single reshape. Each time slice, panel[:, k, :], is a view that can be handed to the model
+        fit at that time point without copying. Only numeric (and boolean) columns are in the float panel. Other
+        columns, like strings, keep their own (person x time) object arrays, so they do not change the panel type
+
+        Returns
+        -------
+        tuple
+            Panel array, unique ids (rows), sorted unique times (axis 1), column labels (axis 2), and a dictionary of
+            the (person x time) arrays of the non-numeric columns
+        """
+        id_codes, ids = pd.factorize(df[id], sort=True)
+        t_codes, times = pd.factorize(df[t], sort=True)
+        if np.unique(id_codes * len(times) + t_codes).shape[0] != df.shape[0]:
+            raise ValueError('Multiple observations per ' + str(id) + ' at the same ' + str(t) + ' were detected')
+
+        columns, others = [], {}
         for c in df.columns:
             if c == id or c == t:
-                pass
+                continue
+            if pd.api.types.is_numeric_dtype(df[c]) or pd.api.types.is_bool_dtype(df[c]):
+                columns.append(c)
             else:
-                df['v'] = c + '_' + df[t].astype(str)
-                reshaped.append(df.pivot(index='id', columns='v', values=c))
+                others[c] = np.full((len(ids), len(times)), np.nan, dtype=object)
+                others[c][id_codes, t_codes] = df[c].values
 
-        return pd.concat(reshaped, axis=1)
+        panel = np.full((len(ids), len(times), len(columns)), np.nan)
+        panel[id_codes, t_codes, :] = df[columns].values.astype(float)
+        return panel, np.asarray(ids), list(times), columns, others
 
+
+def _fit_nuisance_model(task):
+    """Hidden function that fits a single exposure, outcome, or covariate model from its design matrix. It is defined
+    at the module level so it can be sent to the worker processes in TimeVaryGFormula.fit_models()
+    """
+    if task['var_type'] == 'binary':
+        linkdist = sm.families.family.Binomial()
+    else:
+        linkdist = sm.families.family.Gaussian()
+
+    if task['weights'] is None:  # Unweighted g-formula
+        if task['var_type'] == 'binary':
+            return sm.GLM(task['endog'], task['exog'], family=linkdist).fit()
+        return sm.GLS(task['endog'], task['exog']).fit()
+    # Weighted g-formula
+    return sm.GEE(task['endog'], task['exog'], groups=task['groups'], weights=task['weights'],
+                  family=linkdist).fit()
+
+
+def _fit_sequential_model(task):
+    """Hidden function that fits a sequential regression outcome model from its design matrix. Weighted models have one
+    row per person, so a weighted GLM with a robust variance is used rather than GEE
+    """
+    linkdist = sm.families.family.Binomial()
+    if task['weights'] is None:
+        return sm.GLM(task['endog'], task['exog'], family=linkdist).fit()
+    return sm.GLM(task['endog'], task['exog'], family=linkdist, var_weights=task['weights']).fit(cov_type='HC0')
@@ -3,12 +3,12 @@ import math
 import patsy
 import numpy as np
 import pandas as pd
-from scipy.stats.kde import gaussian_kde
 from statsmodels.stats.weightstats import DescrStatsW
 import matplotlib.pyplot as plt
 from .utils import propensity_score
 
 from zepid.calc import probability_to_odds
+from zepid.graphics import binned_kde
 
 
 class IPTW:
@@ -226,10 +226,10 @@ class IPTW:
         self.ProbabilityNumerator = self.df['__numer__']
         self.df['iptw'] = self.df['__numer__'] / self.df['__denom__']
 
-    def plot_kde(self, measure='probability', bw_method='scott', fill=True, color_e='b', color_u='r'):
+    def plot_kde(self, measure='probability', bw_method='scott', fill=True, color_e='b', color_u='r', ax=None):
         """Generates a density plot that can be used to check whether positivity may be violated qualitatively. The
-        kernel density used is SciPy's Gaussian kernel. Either Scott's Rule or Silverman's Rule can be implemented.
-        Alternative option to the boxplot of probabilities
+        Gaussian kernel density is estimated by binned_kde(), with the same bandwidths as SciPy's gaussian_kde. Either
+        Scott's Rule or Silverman's Rule can be implemented. Alternative option to the boxplot of probabilities
 
         Parameters
         ------------
@@ -244,34 +244,34 @@ class IPTW:
             Color of the line/area for the treated group. Default is Blue
         color_u : str, optional
             Color of the line/area for the treated group. Default is Red
+        ax : matplotlib axes, optional
+            Axes to draw on. Default is None, which draws on the current axes of pyplot
 
         Returns
         ---------------
         matplotlib axes
         """
+        t = self.df.loc[self.df[self.ex] == 1]['__denom__'].dropna()
+        u = self.df.loc[self.df[self.ex] == 0]['__denom__'].dropna()
         if measure == 'probability':
             x = np.linspace(0, 1, 10000)
-            density_t = gaussian_kde(self.df.loc[self.df[self.ex] == 1]['__denom__'].dropna(),
-                                     bw_method=bw_method)
-            density_u = gaussian_kde(self.df.loc[self.df[self.ex] == 0]['__denom__'].dropna(),
-                                     bw_method=bw_method)
         elif measure == 'logit':
-            t = np.log(probability_to_odds(self.df.loc[self.df[self.ex] == 1]['__denom__'].dropna()))
-            density_t = gaussian_kde(t, bw_method=bw_method)
-
-            u = np.log(probability_to_odds(self.df.loc[self.df[self.ex] == 0]['__denom__'].dropna()))
-            density_u = gaussian_kde(u, bw_method=bw_method)
+            t = np.log(probability_to_odds(t))
+            u = np.log(probability_to_odds(u))
             x = np.linspace(np.min((np.min(t), np.min(u))) - 1, np.max((np.max(t), np.max(u))) + 1, 10000)
         else:
             raise ValueError("Only plots of probabilities or log-odds are supported. Please specify either "
                              "'probability' or 'logit")
+        density_t = binned_kde(values=t, bw_method=bw_method, x=x)[1]
+        density_u = binned_kde(values=u, bw_method=bw_method, x=x)[1]
 
-        ax = plt.gca()
+        if ax is None:
+            ax = plt.gca()
         if fill:
-            ax.fill_between(x, density_t(x), color=color_e, alpha=0.2, label=None)
-            ax.fill_between(x, density_u(x), color=color_u, alpha=0.2, label=None)
-        ax.plot(x, density_t(x), color=color_e, label='Treat = 1')
-        ax.plot(x, density_u(x), color=color_u, label='Treat = 0')
+            ax.fill_between(x, density_t, color=color_e, alpha=0.2, label=None)
+            ax.fill_between(x, density_u, color=color_u, alpha=0.2, label=None)
+        ax.plot(x, density_t, color=color_e, label='Treat = 1')
+        ax.plot(x, density_u, color=color_u, label='Treat = 0')
         if measure == 'probability':
             ax.set_xlabel('Probability')
         else:
@@ -280,7 +280,7 @@ class IPTW:
         ax.legend()
         return ax
 
-    def plot_boxplot(self, measure='probability'):
+    def plot_boxplot(self, measure='probability', ax=None):
         """Generates a stratified boxplot that can be used to visually check whether positivity may be violated,
         qualitatively. Alternative option to the kernel density plot.
 
@@ -289,6 +289,8 @@ class IPTW:
         measure : str, optional
             Measure to plot. Options include either the probabilities or log-odds stratified by treatment received.
             Default is probabilities (measure='probability'). Log-odds can be requested via measure='logit'
+        ax : matplotlib axes, optional
+            Axes to draw on. Default is None, which draws on the current axes of pyplot
 
         Returns
         -------------
@@ -307,7 +309,8 @@ class IPTW:
 
         labs = ['Treat = 1', 'Treat = 0']
         meanpointprops = dict(marker='D', markeredgecolor='black', markerfacecolor='black')
-        ax = plt.gca()
+        if ax is None:
+            ax = plt.gca()
         ax.boxplot(boxes, labels=labs, meanprops=meanpointprops, showmeans=True)
         if measure == 'probability':
             ax.set_ylabel('Probability')
@@ -351,7 +354,8 @@ class IPTW:
         print('Maximum weight:\t\t\t', round(self._pos_max, decimal))
         print('----------------------------------------------------------------------')
 
-    def plot_love(self, color_unweighted='r', color_weighted='b', shape_unweighted='o', shape_weighted='o'):
+    def plot_love(self, color_unweighted='r', color_weighted='b', shape_unweighted='o', shape_weighted='o',
+                  ax=None):
         """Generates a Love-plot to detail covariate balance based on the IPTW weights. Further details on the usage of
         this plot are available in Austin PC & Stuart EA 2015 https://onlinelibrary.wiley.com/doi/full/10.1002/sim.6607
 
@@ -359,6 +363,19 @@ class IPTW:
         that weighted SMD are below this level. Variables above this level may be unbalanced despite the weighting
         procedure. Different functional forms (or approaches like machine learning) can be considered
 
+        Parameters
+        ----------
+        color_unweighted : str, optional
+            Color of the unweighted standardized mean differences. Default is red
+        color_weighted : str, optional
+            Color of the weighted standardized mean differences. Default is blue
+        shape_unweighted : str, optional
+            Marker of the unweighted standardized mean differences. Default is a circle
+        shape_weighted : str, optional
+            Marker of the weighted standardized mean differences. Default is a circle
+        ax : matplotlib axes, optional
+            Axes to draw on. Default is None, which draws on the current axes of pyplot
+
         Returns
         -------
         axes
@@ -370,7 +387,8 @@ class IPTW:
         to_plot = to_plot.sort_values(by='smd_u', ascending=True).reset_index(drop=True)
 
         # Generate plot
-        ax = plt.gca()
+        if ax is None:
+            ax = plt.gca()
         ax.plot(to_plot.smd_u, to_plot.index, shape_unweighted, c=color_unweighted)
         ax.plot(to_plot.smd_w, to_plot.index, shape_weighted, c=color_weighted)
         ax.set_xlim([0, np.max([np.max(to_plot['smd_w']), np.max(to_plot['smd_u'])]) + 0.5])
@@ -0,0 +1,312 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+class TimeFixedCohort:
+    def __init__(self, effect=-0.5, confounding=1.):
+        """Synthetic cohort with a time-fixed treatment, binary outcome, and known true causal effects. Cohorts of any
+        size can be generated in chunks, so estimators can be benchmarked on far larger data than the included data
+        sets without holding everything in memory.
+
+        The data is generated from the structural model
+
+        .. math::
+
+            W1 \\sim N(0, 1)
+
+            W2 \\sim Bernoulli(0.4)
+
+            A \\sim Bernoulli(logit^{-1}(-0.5 + c (0.6 W1 + 0.5 W2)))
+
+            Y \\sim Bernoulli(logit^{-1}(-1 + e A + 0.5 W1 - 0.4 W2))
+
+        where c is confounding and e is effect. The true risks under treatment and no treatment are calculated by
+        numerical integration over W1, and are stored in risk_1 and risk_0, along with the true risk_difference,
+        risk_ratio, and odds_ratio
+
+        Parameters
+        ------------
+        effect : float, optional
+            Conditional log odds ratio of the treatment on the outcome. Default is -0.5
+        confounding : float, optional
+            Multiplier of the coefficients of W1 and W2 in the treatment model. Zero gives a randomized trial. Default
+            is 1
+
+        Examples
+        ------------
+        >>>from zepid.datasets import TimeFixedCohort
+        >>>cohort = TimeFixedCohort(effect=-0.5)
+        >>>df = cohort.sample(n=100000, seed=2019)
+        >>>cohort.risk_difference
+
+        Generating a larger cohort in chunks
+        >>>for df in cohort.chunks(n=100000000, chunk_size=1000000, seed=2019):
+        >>>    ...
+
+        Writing a cohort to Parquet files
+        >>>cohort.to_parquet('cohort', n=100000000, chunk_size=1000000, seed=2019)
+        >>>pd.read_parquet('cohort')
+        """
+        from scipy.special import expit
+
+        self.effect = effect
+        self.confounding = confounding
+
+        # True risks by Gauss-Hermite integration over the standard normal W1, and summing over W2
+        nodes, weights = np.polynomial.hermite_e.hermegauss(80)
+        weights = weights / np.sum(weights)
+        risks = []
+        for a in [1, 0]:
+            risk = 0
+            for w2, pw2 in [(1, 0.4), (0, 0.6)]:
+                risk += pw2 * np.sum(weights * expit(-1 + effect*a + 0.5*nodes - 0.4*w2))
+            risks.append(risk)
+        self.risk_1, self.risk_0 = risks
+        self.risk_difference = self.risk_1 - self.risk_0
+        self.risk_ratio = self.risk_1 / self.risk_0
+        self.odds_ratio = (self.risk_1 / (1 - self.risk_1)) / (self.risk_0 / (1 - self.risk_0))
+
+    def sample(self, n, seed=None):
+        """Generate a cohort as a single DataFrame
+
+        Parameters
+        ------------
+        n : int
+            Number of individuals
+        seed : None, int, numpy.random.Generator, optional
+            Seed or random number generator
+
+        Returns
+        ------------
+        DataFrame
+            With the columns id, W1, W2, A, and Y
+        """
+        return pd.concat(list(self.chunks(n=n, chunk_size=n, seed=seed)))
+
+    def chunks(self, n, chunk_size=1000000, seed=None):
+        """Generate a cohort in chunks. Each chunk is a DataFrame of at most chunk_size individuals, with ids that
+        continue from the previous chunk. A seed gives the same cohort for the same chunk_size
+
+        Parameters
+        ------------
+        n : int
+            Number of individuals
+        chunk_size : int, optional
+            Number of individuals in each chunk. Default is 1000000
+        seed : None, int, numpy.random.Generator, optional
+            Seed or random number generator
+
+        Returns
+        ------------
+        generator
+            Yields DataFrames with the columns id, W1, W2, A, and Y
+        """
+        from scipy.special import expit
+
+        rng = _check_generator(seed)
+        for start, m in _chunk_sizes(n, chunk_size):
+            df = pd.DataFrame()
+            df['id'] = np.arange(start, start + m)
+            df['W1'] = rng.standard_normal(m)
+            df['W2'] = (rng.random(m) < 0.4).astype(np.int8)
+            pr_a = expit(-0.5 + self.confounding * (0.6*df['W1'] + 0.5*df['W2']))
+            df['A'] = (rng.random(m) < pr_a).astype(np.int8)
+            pr_y = expit(-1 + self.effect*df['A'] + 0.5*df['W1'] - 0.4*df['W2'])
+            df['Y'] = (rng.random(m) < pr_y).astype(np.int8)
+            yield df
+
+    def to_parquet(self, path, n, chunk_size=1000000, seed=None):
+        """Generate a cohort in chunks and write each chunk to a Parquet file (requires pyarrow or fastparquet) in the
+        directory path. The files can be read back together with pandas.read_parquet(path)
+
+        Parameters
+        ------------
+        path : str
+            Directory to write the files to. It is created if it does not exist
+        n : int
+            Number of individuals
+        chunk_size : int, optional
+            Number of individuals in each file. Default is 1000000
+        seed : None, int, numpy.random.Generator, optional
+            Seed or random number generator
+        """
+        _write_parquet(self.chunks(n=n, chunk_size=chunk_size, seed=seed), path, n, chunk_size)
+
+
+class TimeVaryCohort:
+    def __init__(self, time_points=10, effect=-0.5):
+        """Synthetic cohort with a time-varying treatment and confounder in long format, with known true causal effects
+        of always and never being treated. Cohorts of any size can be generated in chunks, so estimators can be
+        benchmarked on far larger data than the included data sets without holding everything in memory.
+
+        The data is generated from the structural model, for each time point t until the outcome occurs
+
+        .. math::
+
+            W \\sim Bernoulli(0.5)
+
+            L_0 \\sim Bernoulli(logit^{-1}(-0.5 + 0.5 W))
+
+            L_t \\sim Bernoulli(logit^{-1}(-1 + 2 L_{t-1} - A_{t-1} + 0.5 W))
+
+            A_t \\sim Bernoulli(logit^{-1}(-1 + 1.5 L_t + 2 A_{t-1} + 0.5 W))
+
+            Y_t \\sim Bernoulli(logit^{-1}(-3 + e A_t + L_t + 0.3 W))
+
+        where e is effect and A_{-1} is 0. L is affected by prior treatment, so it is a time-varying confounder that is
+        also a mediator. The true cumulative risks under always (risk_1) and never (risk_0) being treated are
+        calculated exactly by propagating the joint distribution of W and L among those without the outcome, and are
+        stored along with the true risk_difference and risk_ratio. The cumulative risk at each time point is stored
+        in risk_curve
+
+        Parameters
+        ------------
+        time_points : int, optional
+            Number of time points of follow-up. Default is 10
+        effect : float, optional
+            Conditional log odds ratio of current treatment on the outcome. Default is -0.5
+
+        Examples
+        ------------
+        >>>from zepid.datasets import TimeVaryCohort
+        >>>cohort = TimeVaryCohort(time_points=10, effect=-0.5)
+        >>>df = cohort.sample(n=100000, seed=2019)
+        >>>cohort.risk_difference
+        """
+        from scipy.special import expit
+
+        if time_points < 1:
+            raise ValueError('time_points must be at least 1')
+        self.time_points = int(time_points)
+        self.effect = effect
+
+        curves = []
+        for a in [1, 0]:
+            # Joint probability of (W, L_t) and being free of the outcome at the start of t
+            pr_l = expit(-0.5 + 0.5*np.array([0, 1]))
+            state = 0.5 * np.array([[1 - pr_l[0], pr_l[0]], [1 - pr_l[1], pr_l[1]]])
+            w = np.array([[0, 0], [1, 1]])
+            l = np.array([[0, 1], [0, 1]])
+            risk, curve = 0., []
+            for t in range(self.time_points):
+                hazard = expit(-3 + effect*a + l + 0.3*w)
+                risk += np.sum(state * hazard)
+                curve.append(risk)
+                survived = state * (1 - hazard)
+                pr_l = expit(-1 + 2*l - a + 0.5*w)
+                state = np.stack([np.sum(survived * (1 - pr_l), axis=1), np.sum(survived * pr_l, axis=1)], axis=1)
+            curves.append(curve)
+        self.risk_curve = pd.DataFrame({'t': np.arange(1, self.time_points + 1), 'risk_1': curves[0],
+                                        'risk_0': curves[1]})
+        self.risk_1 = curves[0][-1]
+        self.risk_0 = curves[1][-1]
+        self.risk_difference = self.risk_1 - self.risk_0
+        self.risk_ratio = self.risk_1 / self.risk_0
+
+    def sample(self, n, seed=None):
+        """Generate a cohort as a single long DataFrame
+
+        Parameters
+        ------------
+        n : int
+            Number of individuals
+        seed : None, int, numpy.random.Generator, optional
+            Seed or random number generator
+
+        Returns
+        ------------
+        DataFrame
+            With one row per individual and time point, and the columns id, t0, t, W, L, A, lag_L, lag_A, and Y
+        """
+        return pd.concat(list(self.chunks(n=n, chunk_size=n, seed=seed)))
+
+    def chunks(self, n, chunk_size=100000, seed=None):
+        """Generate a cohort in chunks. Each chunk is a long DataFrame holding all rows of at most chunk_size
+        individuals, with ids that continue from the previous chunk. A seed gives the same cohort for the same
+        chunk_size
+
+        Parameters
+        ------------
+        n : int
+            Number of individuals
+        chunk_size : int, optional
+            Number of individuals in each chunk. Default is 100000
+        seed : None, int, numpy.random.Generator, optional
+            Seed or random number generator
+
+        Returns
+        ------------
+        generator
+            Yields DataFrames with the columns id, t0, t, W, L, A, lag_L, lag_A, and Y
+        """
+        from scipy.special import expit
+
+        rng = _check_generator(seed)
+        for start, m in _chunk_sizes(n, chunk_size):
+            ids = np.arange(start, start + m)
+            w = (rng.random(m) < 0.5).astype(np.int8)
+            l = (rng.random(m) < expit(-0.5 + 0.5*w)).astype(np.int8)
+            a = np.zeros(m, dtype=np.int8)
+            blocks = []
+            for t in range(self.time_points):
+                if t > 0:
+                    lag_l, lag_a = l, a
+                    l = (rng.random(ids.shape[0]) < expit(-1 + 2*lag_l - lag_a + 0.5*w)).astype(np.int8)
+                else:
+                    lag_l, lag_a = np.zeros(m, dtype=np.int8), a
+                a = (rng.random(ids.shape[0]) < expit(-1 + 1.5*l + 2*lag_a + 0.5*w)).astype(np.int8)
+                y = (rng.random(ids.shape[0]) < expit(-3 + self.effect*a + l + 0.3*w)).astype(np.int8)
+                blocks.append(pd.DataFrame({'id': ids, 't0': t, 't': t + 1, 'W': w, 'L': l, 'A': a,
+                                            'lag_L': lag_l, 'lag_A': lag_a, 'Y': y},
+                                           columns=['id', 't0', 't', 'W', 'L', 'A', 'lag_L', 'lag_A', 'Y']))
+                # Only those without the outcome continue to the next time point
+                alive = y == 0
+                ids, w, l, a = ids[alive], w[alive], l[alive], a[alive]
+            df = pd.concat(blocks)
+            df = df.iloc[np.lexsort((df['t'].values, df['id'].values))]
+            df.reset_index(drop=True, inplace=True)
+            yield df
+
+    def to_parquet(self, path, n, chunk_size=100000, seed=None):
+        """Generate a cohort in chunks and write each chunk to a Parquet file (requires pyarrow or fastparquet) in the
+        directory path. The files can be read back together with pandas.read_parquet(path)
+
+        Parameters
+        ------------
+        path : str
+            Directory to write the files to. It is created if it does not exist
+        n : int
+            Number of individuals
+        chunk_size : int, optional
+            Number of individuals in each file. Default is 100000
+        seed : None, int, numpy.random.Generator, optional
+            Seed or random number generator
+        """
+        _write_parquet(self.chunks(n=n, chunk_size=chunk_size, seed=seed), path, n, chunk_size)
+
+
+def _check_generator(seed):
+    """Hidden function that returns a numpy.random.Generator from a seed
+    """
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(seed)
+
+
+def _chunk_sizes(n, chunk_size):
+    """Hidden function that splits n individuals into chunks. Returns the first id and size of each chunk
+    """
+    if n < 1 or chunk_size < 1:
+        raise ValueError('n and chunk_size must be at least 1')
+    return [(start, min(chunk_size, n - start)) for start in range(0, int(n), int(chunk_size))]
+
+
+def _write_parquet(chunks, path, n, chunk_size):
+    """Hidden function that writes each chunk to its own Parquet file
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    width = len(str(len(_chunk_sizes(n, chunk_size))))
+    for i, df in enumerate(chunks):
+        df.to_parquet(os.path.join(path, 'part_' + str(i).zfill(width) + '.parquet'), index=False)
@@ -1,7 +1,109 @@
+import os
 import numpy as np
 import pandas as pd
-from scipy.stats import logistic
-from pkg_resources import resource_filename
+
+from zepid.version import __version__
+from .Synthetic import TimeFixedCohort, TimeVaryCohort
+
+# Parsed data sets, so each file is only read and recoded once per session
+_loaded = {}
+
+
+def _cache_dir():
+    """Directory the parsed data sets are cached in. Set the environment variable ZEPID_CACHE_DIR to change it, or
+    set it to an empty string to turn off caching to disk
+    """
+    path = os.environ.get('ZEPID_CACHE_DIR')
+    if path is None:
+        path = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+                            'zepid')
+    return path
+
+
+def _load_cached(name, source, parse):
+    """Hidden function that returns a copy of a parsed data set. Parsed data sets are kept in memory, and are cached
+    as compressed NumPy .npz files so later sessions skip parsing and recoding the .dat file. The cached file is
+    named after the zepid version and the size and modification time of the .dat file, so it is rebuilt whenever
+    either changes
+
+    Parameters
+    ------------
+    name : str
+        Name of the data set
+    source : str
+        File name of the .dat file the data set is parsed from
+    parse : function
+        Function that reads and recodes the .dat file into a DataFrame
+    """
+    if name not in _loaded:
+        filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), source)
+        stat = os.stat(filename)
+        path = _cache_dir()
+        if path:
+            path = os.path.join(path, '%s-%s-%d-%d.npz' % (name, __version__, stat.st_size, int(stat.st_mtime)))
+        df = _read_npz(path) if path else None
+        if df is None:
+            df = parse(filename)
+            if path:
+                _write_npz(df, path)
+        _loaded[name] = df
+    return _loaded[name].copy()
+
+
+def _read_npz(path):
+    """Hidden function that reads a cached data set. Returns None if there is no usable cached file
+    """
+    try:
+        with np.load(path, allow_pickle=False) as f:
+            columns = [str(c) for c in f['columns']]
+            dtypes = [str(d) for d in f['dtypes']]
+            index = f['index']
+            df = pd.DataFrame({c: f['column_%d' % i].astype(dtypes[i]) for i, c in enumerate(columns)},
+                              columns=columns)
+    except (OSError, IOError, KeyError, ValueError):
+        return None
+    if not np.array_equal(index, np.arange(df.shape[0])):
+        df.index = index
+    return df
+
+
+def _write_npz(df, path):
+    """Hidden function that caches a data set. Each column is stored as its own array, alongside the column names,
+    their data types, and the index. Integer columns, and float columns that only hold whole numbers, are stored in the
+    smallest integer type that holds them, and the file is compressed. Data sets that cannot be stored without pickling, or a cache directory that cannot be written to,
+    are silently skipped
+    """
+    arrays = {'column_%d' % i: df[c].values for i, c in enumerate(df.columns)}
+    if any(a.dtype.hasobject for a in arrays.values()):
+        return
+    arrays = {k: _downcast(a) for k, a in arrays.items()}
+    arrays['columns'] = np.array([str(c) for c in df.columns])
+    arrays['dtypes'] = np.array([str(d) for d in df.dtypes])
+    arrays['index'] = df.index.values
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp, path)
+    except (OSError, IOError):
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _downcast(values):
+    """Hidden function that returns the values in the smallest integer type that holds them exactly, or unchanged if
+    they are not whole numbers
+    """
+    if values.size == 0 or values.dtype.kind not in 'iuf':
+        return values
+    if values.dtype.kind == 'f' and not (np.isfinite(values).all() and (values == np.round(values)).all()):
+        return values
+    low, high = values.min(), values.max()
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+    return values
 
 
 def load_sample_data(timevary):
@@ -53,21 +155,29 @@ def load_sample_data(timevary):
     Load the time-varying exposure data set
     >>>load_sample_data(timevary=True)
     """
-    cols = ['id', 'enter', 'out', 'male', 'age0', 'cd40', 'dvl0', 'cd4', 'dvl', 'art', 'drop', 'dead']
-    df = pd.read_csv(resource_filename('zepid', 'datasets/data.dat'),
-                     delim_whitespace=True, header=None, names=cols, index_col=False)
-    df.sort_values(by=['id', 'enter'], inplace=True)
     if timevary is True:
-        return df
+        return _load_cached('sample_timevary', 'data.dat', _parse_sample_data)
     else:
-        dfi = df.loc[df.groupby('id').cumcount() == 0][['id', 'male', 'age0', 'cd40', 'dvl0', 'art']].copy()
-        dfo = df.loc[df.id != df.id.shift(-1)][['id', 'dead', 'drop', 'out']].copy()
-        dfo.loc[(dfo['drop'] == 1) & (dfo['out'] <= 45), 'dead'] = np.nan
-        dfo['dead'] = np.where((dfo['dead'] == 1) & (dfo['out'] > 45), 0, dfo['dead'])
-        dff = pd.merge(dfi, dfo, left_on='id', right_on='id')
-        dff.rename(columns={'out': 't'}, inplace=True)
-        dff.drop('drop', axis=1, inplace=True)
-        return dff
+        return _load_cached('sample_timefixed', 'data.dat', _parse_sample_data_timefixed)
+
+
+def _parse_sample_data(filename):
+    cols = ['id', 'enter', 'out', 'male', 'age0', 'cd40', 'dvl0', 'cd4', 'dvl', 'art', 'drop', 'dead']
+    df = pd.read_csv(filename, delim_whitespace=True, header=None, names=cols, index_col=False)
+    df.sort_values(by=['id', 'enter'], inplace=True)
+    return df
+
+
+def _parse_sample_data_timefixed(filename):
+    df = _load_cached('sample_timevary', 'data.dat', _parse_sample_data)
+    dfi = df.loc[df.groupby('id').cumcount() == 0][['id', 'male', 'age0', 'cd40', 'dvl0', 'art']].copy()
+    dfo = df.loc[df.id != df.id.shift(-1)][['id', 'dead', 'drop', 'out']].copy()
+    dfo.loc[(dfo['drop'] == 1) & (dfo['out'] <= 45), 'dead'] = np.nan
+    dfo['dead'] = np.where((dfo['dead'] == 1) & (dfo['out'] > 45), 0, dfo['dead'])
+    dff = pd.merge(dfi, dfo, left_on='id', right_on='id')
+    dff.rename(columns={'out': 't'}, inplace=True)
+    dff.drop('drop', axis=1, inplace=True)
+    return dff
 
 
 def load_ewing_sarcoma_data():
@@ -91,7 +201,7 @@ def load_ewing_sarcoma_data():
     DataFrame
         Returns pandas DataFrame
     """
-    return pd.read_csv(resource_filename('zepid', 'datasets/ewing.dat'), index_col=False)
+    return _load_cached('ewing', 'ewing.dat', lambda f: pd.read_csv(f, index_col=False))
 
 
 def load_gvhd_data():
@@ -138,7 +248,11 @@ def load_gvhd_data():
     DataFrame
         Returns pandas DataFrame
     """
-    df = pd.read_csv(resource_filename('zepid', 'datasets/gvhd.dat'), delim_whitespace=True, index_col=False)
+    return _load_cached('gvhd', 'gvhd.dat', _parse_gvhd_data)
+
+
+def _parse_gvhd_data(filename):
+    df = pd.read_csv(filename, delim_whitespace=True, index_col=False)
 
     # Coding variables to match Keil et al. exactly
     df['wait'] = df['waitdays'] / 30.5
@@ -229,11 +343,14 @@ def load_sciatica_data():
     DataFrame
         Returns pandas DataFrame
     """
-    df = pd.read_csv(resource_filename('zepid', 'datasets/sciatica.dat'), delim_whitespace=True, index_col=False,
-                     header=None, names=['id', 'tpoints', 'time', 'age_b', 'age_t', 'vas1_t', 'vas2_t', 'roland_t',
-                                         'likert_t', 'vas1_b', 'vas2_b', 'roland_b', 'likert_b', 'male', 'weight',
-                                         'height', 'surgery'])
-    return df
+    return _load_cached('sciatica', 'sciatica.dat', _parse_sciatica_data)
+
+
+def _parse_sciatica_data(filename):
+    return pd.read_csv(filename, delim_whitespace=True, index_col=False,
+                       header=None, names=['id', 'tpoints', 'time', 'age_b', 'age_t', 'vas1_t', 'vas2_t', 'roland_t',
+                                           'likert_t', 'vas1_b', 'vas2_b', 'roland_b', 'likert_b', 'male', 'weight',
+                                           'height', 'surgery'])
 
 
 def load_leukemia_data():
@@ -254,8 +371,8 @@ def load_leukemia_data():
     DataFrame
         Returns pandas DataFrame
     """
-    df = pd.read_csv(resource_filename('zepid', 'datasets/leukemia.dat'), delim_whitespace=True, index_col=False)
-    return df
+    return _load_cached('leukemia', 'leukemia.dat',
+                        lambda f: pd.read_csv(f, delim_whitespace=True, index_col=False))
 
 
 def load_binge_drinking_data():
@@ -289,8 +406,7 @@ def load_binge_drinking_data():
     DataFrame
         Returns pandas DataFrame
     """
-    df = pd.read_csv(resource_filename('zepid', 'datasets/binge.dat'), index_col=False)
-    return df
+    return _load_cached('binge', 'binge.dat', lambda f: pd.read_csv(f, index_col=False))
 
 
 def load_longitudinal_data():
@@ -313,24 +429,26 @@ def load_longitudinal_data():
     DataFrame
         Returns pandas DataFrame
     """
+    from scipy.special import expit
+
     df = pd.DataFrame()
     np.random.seed(555)
     n = 1000
     df['W'] = np.random.normal(size=n)
     df['L1'] = np.random.normal(size=n) + df['W']
-    df['A1'] = np.random.binomial(1, size=n, p=logistic.cdf(df['L1']))
-    df['Y1'] = np.random.binomial(1, size=n, p=logistic.cdf(-1 + 0.7 * df['L1'] - 0.3 * df['A1']))
+    df['A1'] = np.random.binomial(1, size=n, p=expit(df['L1']))
+    df['Y1'] = np.random.binomial(1, size=n, p=expit(-1 + 0.7 * df['L1'] - 0.3 * df['A1']))
 
     df['L2'] = 0.5 * df['L1'] - 0.9 * df['A1'] + np.random.normal(size=n)
-    df['A2'] = np.random.binomial(1, size=n, p=logistic.cdf(1.5 * df['A1'] + 0.8 * df['L2']))
+    df['A2'] = np.random.binomial(1, size=n, p=expit(1.5 * df['A1'] + 0.8 * df['L2']))
     df['A2'] = np.where(df['A1'] == 1, 1, df['A2'])
-    df['Y2'] = np.random.binomial(1, size=n, p=logistic.cdf(-1 + 0.7 * df['L2'] - 0.3 * df['A2']))
+    df['Y2'] = np.random.binomial(1, size=n, p=expit(-1 + 0.7 * df['L2'] - 0.3 * df['A2']))
     df['Y2'] = np.where(df['Y1'] == 1, np.nan, df['Y2'])
 
     df['L3'] = 0.5 * df['L2'] - 0.9 * df['A2'] + np.random.normal(size=n)
-    df['A3'] = np.random.binomial(1, size=n, p=logistic.cdf(1.5 * df['A2'] + 0.8 * df['L3']))
+    df['A3'] = np.random.binomial(1, size=n, p=expit(1.5 * df['A2'] + 0.8 * df['L3']))
     df['A2'] = np.where(df['A1'] == 1, 1, df['A2'])
-    df['Y3'] = np.random.binomial(1, size=n, p=logistic.cdf(-1 + 0.7 * df['L3'] - 0.3 * df['A3']))
+    df['Y3'] = np.random.binomial(1, size=n, p=expit(-1 + 0.7 * df['L3'] - 0.3 * df['A3']))
     df['Y3'] = np.where((df['Y2'] == 1) | (df['Y1'] == 1), np.nan, df['Y3'])
 
     df['id'] = df.index
@@ -371,5 +489,5 @@ def load_case_control_data():
     DataFrame
         Returns pandas DataFrame
     """
-    df = pd.read_csv(resource_filename('zepid', 'datasets/case_control.dat'), delim_whitespace=True, index_col=False)
-    return df
+    return _load_cached('case_control', 'case_control.dat',
+                        lambda f: pd.read_csv(f, delim_whitespace=True, index_col=False))
@@ -1 +1,7 @@
-from .graphics import functional_form_plot, EffectMeasurePlot, pvalue_plot, spaghetti_plot, roc, dynamic_risk_plot
+from zepid._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    attributes={'graphics': ['functional_form_plot', 'EffectMeasurePlot', 'pvalue_plot', 'spaghetti_plot', 'roc',
+                             'roc_curve', 'roc_auc', 'dynamic_risk_plot', 'binned_loess', 'binned_kde'],
+                'export': ['export_figures']})
@@ -0,0 +1,76 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+def export_figures(specs, processes=None, dpi=100):
+    """Renders figure specifications to image files over a pool of processes. Each figure is drawn by the Agg
+    backend on its own matplotlib Figure, without pyplot, so figures do not share any state and can be rendered at
+    the same time. The file format is set by the extension of the path (for example .png or .pdf)
+
+    Each specification is a dictionary with the following keys
+
+    * 'plot'    : function that draws the figure. It is called with the keyword ax, the axes to draw on. For
+      example functional_form_plot, roc, EffectMeasurePlot.plot, or IPTW.plot_love
+    * 'path'    : file the figure is saved to
+    * 'args'    : optional, tuple of positional arguments for plot
+    * 'kwargs'  : optional, dictionary of keyword arguments for plot
+    * 'figsize' : optional, size of the figure. Default is (6, 4)
+
+    The plot function and its arguments are sent to the processes by pickle, so they must be picklable (functions
+    defined at the top of a module, and bound methods of objects that can be pickled)
+
+    Parameters
+    -------------
+    specs : list
+        List of figure specifications
+    processes : int, optional
+        Number of processes to render the figures over. Default is None, which uses one process per CPU. With
+        processes=1 the figures are rendered in the current process
+    dpi : int, optional
+        Resolution of raster files (for example .png). Default is 100
+
+    Returns
+    -------------
+    list
+        Paths of the saved figures, in the order of specs
+
+    Examples
+    -------------
+    >>>from zepid.graphics import roc, functional_form_plot, export_figures
+    >>>specs = [{'plot': roc, 'args': (df.dropna(), 'd', 'predictor'), 'path': 'roc.png'},
+    >>>         {'plot': functional_form_plot, 'kwargs': {'df': df, 'outcome': 'dead', 'var': 'age0',
+    >>>                                                  'model_results': False}, 'path': 'age.pdf'}]
+    >>>export_figures(specs, processes=4)
+    """
+    specs = list(specs)
+    for spec in specs:
+        if 'plot' not in spec or 'path' not in spec:
+            raise ValueError("Every figure specification must include 'plot' and 'path'")
+        if not callable(spec['plot']):
+            raise ValueError("'plot' must be a function that draws on the axes given by the ax keyword")
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes < 1:
+        raise ValueError('processes must be at least 1')
+
+    jobs = [(spec, dpi) for spec in specs]
+    if processes == 1 or len(jobs) < 2:
+        return [_render(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=min(processes, len(jobs))) as pool:
+        # Sending several figures to a process at a time, since most figures take a fraction of a second
+        return list(pool.map(_render, jobs, chunksize=max(1, len(jobs) // (4 * processes))))
+
+
+def _render(job):
+    """Hidden function that draws and saves a single figure specification
+    """
+    spec, dpi = job
+    fig = Figure(figsize=spec.get('figsize', (6, 4)))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+    spec['plot'](*spec.get('args', ()), ax=ax, **spec.get('kwargs', {}))
+    fig.savefig(spec['path'], dpi=dpi)
+    return spec['path']
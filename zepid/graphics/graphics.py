@@ -8,22 +8,28 @@ Functional form assessment- func_form_plot()
 Forest plot/ effect measure plot- EffectMeasurePlot()
 P-value distribution plot- pvalue_plot()
 Spaghetti plot- spaghetti_plot()
-Receiver-Operator Curve- roc()
+Receiver-Operator Curve- roc(), roc_curve(), roc_auc()
 Dynamic risk plot- dynamic_risk_plot()
+Binned LOESS smoother- binned_loess()
+Binned kernel density- binned_kde()
 """
 
 import warnings
 import numpy as np
 import pandas as pd
-from scipy.stats import norm
+from scipy.stats import norm, rankdata
 import statsmodels.api as sm
 import statsmodels.formula.api as smf
 from statsmodels.genmod.families import links
-from statsmodels.nonparametric.smoothers_lowess import lowess
 import matplotlib
 import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
 import matplotlib.ticker as mticker
+from matplotlib.collections import LineCollection
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.font_manager import FontProperties
+import matplotlib.transforms as transforms
 
 
 class EffectMeasurePlot:
@@ -150,7 +156,50 @@ class EffectMeasurePlot:
         if 'pointcolor' in kwargs:
             self.pc = kwargs['pointcolor']
 
-    def plot(self, figsize=(3, 3), t_adjuster=0.01, decimal=3, size=3, max_value=None, min_value=None):
+    @classmethod
+    def from_results(cls, results, measure, lcl=None, ucl=None):
+        """Initializes EffectMeasurePlot from a results DataFrame, like the results of RiskRatio, RiskDifference,
+        OddsRatio, IncidenceRateRatio, or IncidenceRateDifference. The index is used as the labels
+
+        Parameters
+        --------------
+        results : DataFrame
+            Results with a column of point estimates and columns of the confidence limits
+        measure : str
+            Column of the point estimates. The effect measure label is also set to this
+        lcl : str, optional
+            Column of the lower confidence limits. Default is None, which uses the column zEpid names the lower
+            confidence limit of measure (for example, RR_LCL for RiskRatio)
+        ucl : str, optional
+            Column of the upper confidence limits. Default is None, which uses the column zEpid names the upper
+            confidence limit of measure
+
+        Returns
+        --------------
+        EffectMeasurePlot
+
+        Examples
+        --------------
+        >>>from zepid import RiskRatio
+        >>>from zepid.graphics import EffectMeasurePlot
+        >>>rr = RiskRatio()
+        >>>rr.fit(df, exposure='art', outcome='dead')
+        >>>p = EffectMeasurePlot.from_results(rr.results, measure='RiskRatio')
+        >>>p.plot()
+        """
+        if lcl is None or ucl is None:
+            prefix = _result_limits.get(measure, measure)
+            lcl = prefix + '_LCL' if lcl is None else lcl
+            ucl = prefix + '_UCL' if ucl is None else ucl
+        for c in [measure, lcl, ucl]:
+            if c not in results.columns:
+                raise ValueError(str(c) + ' is not a column of results')
+        p = cls(label=[str(i) for i in results.index], effect_measure=list(results[measure].astype(float)),
+                lcl=list(results[lcl].astype(float)), ucl=list(results[ucl].astype(float)))
+        p.labels(effectmeasure=measure)
+        return p
+
+    def plot(self, figsize=(3, 3), t_adjuster=0.01, decimal=3, size=3, max_value=None, min_value=None, ax=None):
         """Generates the matplotlib effect measure plot with the default or specified attributes.
         The following variables can be used to further fine-tune the effect measure plot
 
@@ -159,8 +208,7 @@ class EffectMeasurePlot:
         figsize : tuple, optional
             Adjust the size of the figure. Syntax is same as matplotlib `figsize`
         t_adjuster : float, optional
-            Used to refine alignment of the table with the line graphs. When generate plots, trial and error for this
-            value are usually necessary. I haven't come up with an algorithm to determine this yet...
+            No longer used, since the table is aligned with the lines automatically. Kept so existing code still runs
         decimal : integer, optional
             Number of decimal places to display in the table
         size : integer,
@@ -169,84 +217,157 @@ class EffectMeasurePlot:
             Maximum value of x-axis scale. Default is None, which automatically determines max value
         min_value : float, optional
             Minimum value of x-axis scale. Default is None, which automatically determines min value
+        ax : matplotlib axes, optional
+            Axes the plot and table are drawn in place of. Default is None, which draws on a new pyplot figure of size
+            figsize
 
         Returns
         ---------
         matplotlib axes
         """
-        tval = []
-        ytick = []
-        for i in range(len(self.df)):
-            if not np.isnan(self.df['OR2'][i]):
-                if ((isinstance(self.df['OR'][i], float)) & (isinstance(self.df['LCL'][i], float)) &
-                        (isinstance(self.df['UCL'][i], float))):
-                    tval.append([round(self.df['OR2'][i], decimal), (
-                                '(' + str(round(self.df['LCL'][i], decimal)) + ', ' +
-                                str(round(self.df['UCL'][i], decimal)) + ')')])
-                else:
-                    tval.append(
-                        [self.df['OR'][i], ('(' + str(self.df['LCL'][i]) + ', ' + str(self.df['UCL'][i]) + ')')])
-                ytick.append(i)
-            else:
-                tval.append([' ', ' '])
-                ytick.append(i)
+        mini, maxi = self._limits(max_value, min_value)
+        if ax is None:
+            ax = plt.figure(figsize=figsize).add_subplot(1, 1, 1)  # blank figure
+        return self._draw(self.df, mini, maxi, decimal=decimal, size=size, ax=ax)
+
+    def to_pdf(self, path, rows_per_page=40, figsize=(6, 8), decimal=3, size=3, max_value=None, min_value=None):
+        """Saves the effect measure plot to a PDF, split over pages of rows_per_page rows. Every page uses the same
+        x-axis, so estimates can be compared across pages. Pages are drawn and saved one at a time without displaying
+        them, so plots of hundreds of estimates can be made without a display
+
+        Parameters
+        -----------------
+        path : str
+            File to save the PDF to
+        rows_per_page : int, optional
+            Number of rows on each page. Default is 40
+        figsize : tuple, optional
+            Size of each page. Default is (6, 8)
+        decimal : integer, optional
+            Number of decimal places to display in the table
+        size : integer,
+            Option to adjust the size of the lines and points in the plot
+        max_value : float, optional
+            Maximum value of x-axis scale. Default is None, which automatically determines max value
+        min_value : float, optional
+            Minimum value of x-axis scale. Default is None, which automatically determines min value
+
+        Examples
+        -----------------
+        >>>p = EffectMeasurePlot.from_results(rr.results, measure='RiskRatio')
+        >>>p.to_pdf('forest.pdf', rows_per_page=50)
+        """
+        if rows_per_page < 1:
+            raise ValueError('rows_per_page must be at least 1')
+        mini, maxi = self._limits(max_value, min_value)
+        with PdfPages(path) as pdf:
+            for start in range(0, self.df.shape[0], rows_per_page):
+                fig = Figure(figsize=figsize)
+                FigureCanvasAgg(fig)
+                self._draw(self.df.iloc[start:start + rows_per_page].reset_index(drop=True), mini, maxi,
+                           decimal=decimal, size=size, ax=fig.add_subplot(1, 1, 1))
+                pdf.savefig(fig)
+
+    def _limits(self, max_value, min_value):
+        """Hidden function that determines the x-axis limits from all rows
+        """
+        ucl = pd.to_numeric(self.df['UCL']).max()
+        lcl = pd.to_numeric(self.df['LCL']).min()
         if max_value is None:
-            if pd.to_numeric(self.df['UCL']).max() < 1:
-                maxi = round(((pd.to_numeric(self.df['UCL'])).max() + 0.05),
-                             2)  # setting x-axis maximum for UCL less than 1
-            if (pd.to_numeric(self.df['UCL']).max() < 9) and (pd.to_numeric(self.df['UCL']).max() >= 1):
-                maxi = round(((pd.to_numeric(self.df['UCL'])).max() + 1),
-                             0)  # setting x-axis maximum for UCL less than 10
-            if pd.to_numeric(self.df['UCL']).max() > 9:
-                maxi = round(((pd.to_numeric(self.df['UCL'])).max() + 10),
-                             0)  # setting x-axis maximum for UCL less than 100
+            if ucl < 1:
+                maxi = round(ucl + 0.05, 2)  # setting x-axis maximum for UCL less than 1
+            if (ucl < 9) and (ucl >= 1):
+                maxi = round(ucl + 1, 0)  # setting x-axis maximum for UCL less than 10
+            if ucl > 9:
+                maxi = round(ucl + 10, 0)  # setting x-axis maximum for UCL less than 100
         else:
             maxi = max_value
         if min_value is None:
-            if pd.to_numeric(self.df['LCL']).min() > 0:
-                mini = round(((pd.to_numeric(self.df['LCL'])).min() - 0.1), 1)  # setting x-axis minimum
-            if pd.to_numeric(self.df['LCL']).min() < 0:
-                mini = round(((pd.to_numeric(self.df['LCL'])).min() - 0.05), 2)  # setting x-axis minimum
+            if lcl > 0:
+                mini = round(lcl - 0.1, 1)  # setting x-axis minimum
+            if lcl < 0:
+                mini = round(lcl - 0.05, 2)  # setting x-axis minimum
         else:
             mini = min_value
-        plt.figure(figsize=figsize)  # blank figure
-        gspec = gridspec.GridSpec(1, 6)  # sets up grid
-        plot = plt.subplot(gspec[0, 0:4])  # plot of data
-        tabl = plt.subplot(gspec[0, 4:])  # table of OR & CI
-        plot.set_ylim(-1, (len(self.df)))  # spacing out y-axis properly
+        return mini, maxi
+
+    def _table_text(self, df, decimal):
+        """Hidden function that formats the estimates and confidence intervals of all rows at once. Rows with floats
+        are rounded, other rows (for example, strings with trailing zeroes) are displayed as given
+        """
+        numeric = (df['OR'].map(lambda v: isinstance(v, float)) & df['LCL'].map(lambda v: isinstance(v, float)) &
+                   df['UCL'].map(lambda v: isinstance(v, float)))
+        lcl = pd.to_numeric(df['LCL'])
+        ucl = pd.to_numeric(df['UCL'])
+        est = np.where(numeric, df['OR2'].round(decimal).astype(str), df['OR'].astype(str))
+        ci = np.where(numeric, '(' + lcl.round(decimal).astype(str) + ', ' + ucl.round(decimal).astype(str) + ')',
+                      '(' + df['LCL'].astype(str) + ', ' + df['UCL'].astype(str) + ')')
+        blank = np.isnan(df['OR2'])
+        return np.where(blank, '', est), np.where(blank, '', ci)
+
+    def _draw(self, df, mini, maxi, decimal, size, ax):
+        """Hidden function that draws the rows of df in place of ax. The estimates and confidence intervals are each
+        drawn as a single block of text, with the line spacing matched to the rows of the plot
+        """
+        fig = ax.figure
+        spec = ax.get_subplotspec()
+        if spec is None:
+            raise ValueError('ax must be a subplot, for example made by Figure.add_subplot()')
+        ax.remove()
+        gspec = spec.subgridspec(1, 6)  # sets up grid
+        plot = fig.add_subplot(gspec[0, 0:4])  # plot of data
+        tabl = fig.add_subplot(gspec[0, 4:], sharey=plot)  # table of OR & CI
+        plot.set_ylim(-1, (len(df)))  # spacing out y-axis properly
         if self.scale == 'log':
             try:
                 plot.set_xscale('log')
             except:
                 raise ValueError('For the log scale, all values must be positive')
         plot.axvline(self.center, color=self.linec, zorder=1)
-        plot.errorbar(self.df.OR2, self.df.index, xerr=[self.df.LCL_dif, self.df.UCL_dif], marker='None', zorder=2,
+        plot.errorbar(df.OR2, df.index, xerr=[df.LCL_dif, df.UCL_dif], marker='None', zorder=2,
                       ecolor=self.errc, elinewidth=(size / size), linewidth=0)
-        plot.scatter(self.df.OR2, self.df.index, c=self.pc, s=(size * 25), marker=self.shape, zorder=3,
+        plot.scatter(df.OR2, df.index, c=self.pc, s=(size * 25), marker=self.shape, zorder=3,
                      edgecolors='None')
         plot.xaxis.set_ticks_position('bottom')
         plot.yaxis.set_ticks_position('left')
         plot.get_xaxis().set_major_formatter(matplotlib.ticker.ScalarFormatter())
         plot.get_xaxis().set_minor_formatter(matplotlib.ticker.NullFormatter())
-        plot.set_yticks(ytick)
+        plot.set_yticks(np.arange(len(df)))
         plot.set_xlim([mini, maxi])
         plot.set_xticks([mini, self.center, maxi])
         plot.set_xticklabels([mini, self.center, maxi])
-        plot.set_yticklabels(self.df.study)
+        plot.set_yticklabels(df.study)
         plot.yaxis.set_ticks_position('none')
         plot.invert_yaxis()  # invert y-axis to align values properly with table
-        tb = tabl.table(cellText=tval, cellLoc='center', loc='right', colLabels=[self.em, self.ci],
-                        bbox=[0, t_adjuster, 1, 1])
         tabl.axis('off')
-        tb.auto_set_font_size(False)
-        tb.set_fontsize(12)
-        for key, cell in tb.get_celld().items():
-            cell.set_linewidth(0)
+
+        # Font size and line spacing so that each line of text sits on a row of the plot
+        row = abs(plot.transData.transform((0, 1))[1] - plot.transData.transform((0, 0))[1])
+        fontsize = min(12., row * 72. / fig.dpi / 1.2)
+        # matplotlib moves each line down by the ascent of 'lp' times the line spacing, plus the descent of 'lp'
+        if not hasattr(fig.canvas, 'get_renderer'):  # figures made without pyplot have no renderer until drawn
+            FigureCanvasAgg(fig)
+        w, h, d = fig.canvas.get_renderer().get_text_width_height_descent('lp', FontProperties(size=fontsize),
+                                                                           ismath=False)
+        spacing = (row - d) / (h - d)
+        plot.tick_params(axis='y', labelsize=fontsize)
+        est, ci = self._table_text(df, decimal)
+        position = transforms.blended_transform_factory(tabl.transAxes, tabl.transData)
+        for x, label, column in [(0.25, self.em, est), (0.75, self.ci, ci)]:
+            tabl.text(x, -1, label, transform=position, ha='center', va='center', fontsize=fontsize)
+            tabl.text(x, (len(df) - 1) / 2., '\n'.join(column), transform=position, ha='center', va='center',
+                      fontsize=fontsize, linespacing=spacing)
         return plot
 
 
+# Prefix of the confidence limit columns for each measure in the results of the zepid.base estimators
+_result_limits = {'Risk': 'Risk', 'RiskRatio': 'RR', 'RiskDifference': 'RD', 'NNT': 'NNT', 'OddsRatio': 'OR',
+                  'IncRate': 'IncRate', 'IncRateRatio': 'IRR', 'IncRateDiff': 'IRD'}
+
+
 def functional_form_plot(df, outcome, var, f_form=None, outcome_type='binary', discrete=False, link_dist=None,
-                         loess=True, loess_value=0.4, legend=True, model_results=True, points=False):
+                         loess=True, loess_value=0.4, legend=True, model_results=True, points=False, bins=200,
+                         ax=None, loess_iterations=3):
     """Creates a functional form plot to aid in functional form assessment for continuous/discrete variables. Plots can
     be created for binary and continuous outcomes. Default options are set to create a functional form plot for a
     binary outcome. To convert to a continuous outcome, outcome_type needs to be changed, in addition to the link_dist
@@ -276,14 +397,22 @@ def functional_form_plot(df, outcome, var, f_form=None, outcome_type='binary', d
     model_results : bool, optional
         Whether to produce the model results. Default is True, which provides model results
     loess : bool, optional
-        Whether to plot the LOESS curve along with the functional form. Default is True
+        Whether to plot the LOESS curve along with the functional form. Default is True. The LOESS curve is fit by
+        binned_loess(). For binary outcomes, the LOESS curve smooths the predicted probabilities of a model with a
+        category for each bin (or each value, if discrete) of var
     points : bool, optional
         Whether to plot the data points, where size is relative to the number of observations. Default is False
     discrete : bool, optional
         If your data is truly continuous, leave setting to bin the dat. Will automatically bin observations into
-        categories for generation of the LOESS curve. If you data is discrete, you can set this to True to use your
+        categories for generation of the points. If you data is discrete, you can set this to True to use your
         actual values. If you get a perfect SeparationError from statsmodels, it means you might have to reshift your
         categories.
+    bins : int, optional
+        Maximum number of bins of var the LOESS curve is fit to. Default is 200
+    ax : matplotlib axes, optional
+        Axes to draw on. Default is None, which draws on the current axes of pyplot
+    loess_iterations : int, optional
+        Number of robustness iterations of the LOESS curve. Default is 3, as in statsmodels lowess
 
     Returns
     -----------
@@ -345,14 +474,15 @@ def functional_form_plot(df, outcome, var, f_form=None, outcome_type='binary', d
             pass
     elif outcome_type == 'continuous':
         if link_dist is None:
-            link_dist = sm.families.family.Gaussian(sm.families.links.identity)
+            link_dist = sm.families.family.Gaussian()
         else:
             pass
     else:
         raise ValueError('Only binary or continuous outcomes are currently supported')
 
     # Generating LOESS or points if requested
-    ax = plt.gca()
+    if ax is None:
+        ax = plt.gca()
     if loess or points:
         if outcome_type == 'binary':
             if discrete is False:
@@ -366,27 +496,21 @@ def functional_form_plot(df, outcome, var, f_form=None, outcome_type='binary', d
                 djm = smf.glm(outcome + '~ C(vbin)', rf, family=link_dist).fit()
             else:
                 djm = smf.glm(outcome + '~ C(' + var + ')', rf, family=link_dist).fit()
-            djf = djm.get_prediction(rf).summary_frame()
-            dj = pd.concat([rf, djf], axis=1)
-            dj.sort_values(var, inplace=True)
+            dj = pd.DataFrame({var: rf[var], 'mean': djm.fittedvalues})
             if points:
-                pf = dj.groupby(by=[var, 'mean']).count().reset_index()
+                pf = dj.groupby(by=[var, 'mean']).size().reset_index()
                 ax.scatter(pf[var], pf['mean'], s=[100 * (n / np.max(pf[var])) for n in pf[var]],
                            color='gray', label='Data point')
             if loess:
-                yl = lowess(list(dj['mean']), list(dj[var]), frac=loess_value)
-                lowess_x = list(zip(*yl))[0]
-                lowess_y = list(zip(*yl))[1]
-                ax.plot(lowess_x, lowess_y, '--', color='red', linewidth=1, label='LOESS')
+                yl = binned_loess(dj[var], dj['mean'], frac=loess_value, bins=bins, it=loess_iterations)
+                ax.plot(yl['x'], yl['smoothed'], '--', color='red', linewidth=1, label='LOESS')
         if outcome_type == 'continuous':
             if points:
-                pf = rf.groupby(by=[var, outcome]).count().reset_index()
+                pf = rf.groupby(by=[var, outcome]).size().reset_index()
                 ax.scatter(pf[var], pf[outcome], color='gray', label='Data point')
             if loess:
-                yl = lowess(list(rf[outcome]), list(rf[var]), frac=loess_value)
-                lowess_x = list(zip(*yl))[0]
-                lowess_y = list(zip(*yl))[1]
-                ax.plot(lowess_x, lowess_y, '--', color='red', linewidth=1, label='LOESS')
+                yl = binned_loess(rf[var], rf[outcome], frac=loess_value, bins=bins, it=loess_iterations)
+                ax.plot(yl['x'], yl['smoothed'], '--', color='red', linewidth=1, label='LOESS')
 
     # Functional form model fitting
     ffm = smf.glm(outcome + ' ~ ' + f_form, rf, family=link_dist).fit()
@@ -394,9 +518,13 @@ def functional_form_plot(df, outcome, var, f_form=None, outcome_type='binary', d
         print(ffm.summary())
         print('AIC: ', ffm.aic)
         print('BIC: ', ffm.bic)
-    fff = ffm.get_prediction(rf).summary_frame()
-    ff = pd.concat([rf, fff], axis=1)
-    ff.sort_values(var, inplace=True)
+
+    # Predicting at most 1000 distinct values of var, rather than every observation
+    ff = rf.drop_duplicates(subset=[var])
+    if ff.shape[0] > 1000:
+        ff = ff.iloc[np.unique(np.linspace(0, ff.shape[0] - 1, 1000).astype(int))]
+    ff = pd.concat([ff[[var]].reset_index(drop=True),
+                    ffm.get_prediction(ff).summary_frame().reset_index(drop=True)], axis=1)
 
     # Generating plot for functional form
     ax.fill_between(ff[var], ff['mean_ci_upper'], ff['mean_ci_lower'], alpha=0.1, color='blue', label='95% CI')
@@ -408,7 +536,239 @@ def functional_form_plot(df, outcome, var, f_form=None, outcome_type='binary', d
     return ax
 
 
-def pvalue_plot(point, sd, color='b', fill=True, null=0, alpha=None):
+def binned_loess(x, y, frac=0.4, bins=200, alpha=0.05, it=0):
+    """Locally weighted linear regression (LOESS) on binned data. Observations are first aggregated onto at most bins
+    bins of x, and the local regressions are fit to the bin means weighted by the bin counts. The time to smooth after
+    binning does not depend on the number of observations. When x has no more distinct values than bins, each
+    distinct value is its own bin and the result matches LOESS on the observations (statsmodels lowess with the same
+    number of robustness iterations).
+
+    Robustness iterations downweight observations with large residuals from the previous fit by the bisquare function,
+    as in statsmodels lowess. Confidence intervals use the variance of the linear smoother (given the robustness
+    weights), with the residuals of each bin allowed to have their own variance (for example, binary outcomes)
+
+    Parameters
+    ------------
+    x : array
+        Values of the x variable
+    y : array
+        Values of the y variable
+    frac : float, optional
+        Fraction of observations used for each local regression. Default is 0.4
+    bins : int, optional
+        Maximum number of bins. Default is 200
+    alpha : float, optional
+        Alpha for the confidence intervals. Default is 0.05
+    it : int, optional
+        Number of robustness iterations. Default is 0, which fits the local regressions once
+
+    Returns
+    -----------
+    DataFrame
+        With one row per non-empty bin, and the columns x (mean of x in the bin), n (observations in the bin),
+        smoothed, lower, and upper
+
+    Examples
+    ------------
+    >>>from zepid.graphics import binned_loess
+    >>>curve = binned_loess(df['age0'], df['dead'], frac=0.4)
+    >>>plt.plot(curve['x'], curve['smoothed'])
+    >>>plt.fill_between(curve['x'], curve['lower'], curve['upper'], alpha=0.2)
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if x.shape != y.shape:
+        raise ValueError('x and y must be the same length')
+    if not 0 < frac <= 1:
+        raise ValueError('frac must be between 0 and 1')
+    if type(it) is not int or it < 0:
+        raise ValueError('it must be a non-negative integer')
+    if np.isnan(x).any() or np.isnan(y).any():
+        raise ValueError('binned_loess cannot handle missing data')
+
+    # Aggregating onto the bins
+    values, idx = np.unique(x, return_inverse=True)
+    if values.shape[0] > bins:
+        idx = np.clip(((x - values[0]) / (values[-1] - values[0]) * bins).astype(np.int64), 0, bins - 1)
+    n = np.bincount(idx).astype(float)
+    keep = n > 0
+    idx = (np.cumsum(keep) - 1)[idx]  # bin of each observation, among the non-empty bins
+    n = n[keep]
+    xs = np.bincount(idx, weights=x) / n
+
+    # Bandwidth of each local regression is the distance to the nearest frac of observations
+    dx = xs[None, :] - xs[:, None]
+    dist = np.abs(dx)
+    order = np.argsort(dist, axis=1, kind='mergesort')
+    reach = np.cumsum(n[order], axis=1) >= max(int(frac * x.shape[0] + 1e-10), 1)
+    h = np.take_along_axis(dist, order, axis=1)[np.arange(xs.shape[0]), np.argmax(reach, axis=1)]
+    h = np.where(h > 0, h * 1.000001, 1.)
+    tricube = (1 - np.clip(dist / h[:, None], 0, 1)**3)**3
+
+    robust = np.ones(x.shape[0])
+    for i in range(it + 1):
+        if i > 0:  # bisquare robustness weights from the residuals of the previous fit
+            resid = y - smoothed[idx]
+            scale = 6 * np.median(np.abs(resid))
+            if scale == 0:
+                break
+            robust = np.clip(1 - (resid / scale)**2, 0, 1)**2
+        nw = np.bincount(idx, weights=robust)
+        ys = np.divide(np.bincount(idx, weights=robust * y), nw, out=np.zeros(nw.shape[0]), where=nw > 0)
+        w = nw[None, :] * tricube
+
+        # Local linear fits, written as a linear smoother of the bin means
+        s0 = np.sum(w, axis=1)
+        s1 = np.sum(w * dx, axis=1)
+        s2 = np.sum(w * dx**2, axis=1)
+        denom = s0 * s2 - s1**2
+        local_linear = denom > 1e-12 * s0 * np.maximum(s2, 1e-300)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            smoother = np.where(local_linear[:, None], w * (s2[:, None] - s1[:, None] * dx) / denom[:, None],
+                                w / s0[:, None])
+        smoothed = smoother.dot(ys)
+
+    # Weighted residual sum of squares within each bin around its smoothed value
+    rss = np.bincount(idx, weights=(robust * (y - smoothed[idx]))**2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coef = np.where(nw[None, :] > 0, smoother / nw[None, :], 0)
+    se = np.sqrt(np.sum(coef**2 * rss[None, :], axis=1))
+    zalpha = norm.ppf(1 - alpha / 2, loc=0, scale=1)
+    return pd.DataFrame({'x': xs, 'n': n.astype(np.int64), 'smoothed': smoothed, 'lower': smoothed - zalpha * se,
+                         'upper': smoothed + zalpha * se}, columns=['x', 'n', 'smoothed', 'lower', 'upper'])
+
+
+def binned_kde(values=None, weights=None, counts=None, edges=None, bw_method='scott', x=None, gridsize=4096):
+    """Gaussian kernel density estimate by linear binning and FFT convolution. The values are spread onto an evenly
+    spaced grid and convolved with the Gaussian kernel, so the time taken barely depends on the number of values. The
+    density can also be estimated from a precomputed histogram, for example from StreamingSummary.histogram(), without
+    the underlying values. The bandwidth follows SciPy's gaussian_kde
+
+    Parameters
+    ------------
+    values : array, optional
+        Values to estimate the density of. Either values, or counts and edges, must be given
+    weights : array, optional
+        Weights of the values. Default is None, which weights all values equally
+    counts : array, optional
+        Counts of a histogram to estimate the density from
+    edges : array, optional
+        Edges of the histogram bins, with one more element than counts
+    bw_method : str, float, optional
+        Method used to estimate the bandwidth. Following SciPy, either 'scott' or 'silverman' are valid options, or a
+        number is used as the bandwidth factor (the bandwidth is the factor times the standard deviation)
+    x : array, optional
+        Points to evaluate the density at. Default is None, which evaluates the density at gridsize points covering
+        the values and the tails of the kernel
+    gridsize : int, optional
+        Number of grid points the values are binned onto. Default is 4096
+
+    Returns
+    -----------
+    tuple
+        Points and the estimated density at those points
+
+    Examples
+    ------------
+    >>>from zepid.graphics import binned_kde
+    >>>x, density = binned_kde(values=np.random.normal(size=10000000))
+    >>>plt.plot(x, density)
+    """
+    if values is not None:
+        frequency = False
+        values = np.asarray(values, dtype=float).ravel()
+        if weights is not None:
+            weights = np.asarray(weights, dtype=float).ravel()
+            if values.shape != weights.shape:
+                raise ValueError('values and weights must be the same length')
+    elif counts is not None and edges is not None:
+        # Histogram counts are frequency weights, so every counted value adds to the effective sample size
+        edges = np.asarray(edges, dtype=float)
+        counts = np.asarray(counts, dtype=float)
+        if edges.shape[0] != counts.shape[0] + 1:
+            raise ValueError('edges must have one more element than counts')
+        values = ((edges[1:] + edges[:-1]) / 2)[counts > 0]
+        weights = counts[counts > 0]
+        frequency = True
+    else:
+        raise ValueError('Either values, or counts and edges, must be given')
+
+    # Weighted moments, in blocks so large arrays are not copied as a whole
+    blocks = [slice(i, i + 10000000) for i in range(0, values.shape[0], 10000000)]
+    total, squares, first, low, high = 0., 0., 0., np.inf, -np.inf
+    for b in blocks:
+        if weights is None:
+            total += values[b].shape[0]
+            squares += values[b].shape[0]
+            first += np.sum(values[b])
+        else:
+            total += np.sum(weights[b])
+            squares += np.sum(weights[b]**2)
+            first += np.sum(weights[b] * values[b])
+        low, high = min(low, np.min(values[b])), max(high, np.max(values[b]))
+    mean = first / total
+    variance = 0.
+    for b in blocks:
+        w = 1. if weights is None else weights[b]
+        variance += np.sum(w * (values[b] - mean)**2)
+    if values.shape[0] < 2 or total <= 0:
+        raise ValueError('At least two values are needed to estimate the density')
+    if frequency:
+        n_eff = total
+        variance = variance / (total - 1)
+    else:
+        n_eff = total**2 / squares
+        variance = variance / total / (1 - squares / total**2)
+
+    # Bandwidth following gaussian_kde: factor times the weighted standard deviation
+    if bw_method == 'scott':
+        factor = n_eff ** (-1. / 5)
+    elif bw_method == 'silverman':
+        factor = (n_eff * 3 / 4.) ** (-1. / 5)
+    elif np.isscalar(bw_method) and not isinstance(bw_method, str):
+        factor = float(bw_method)
+    else:
+        raise ValueError("bw_method must be 'scott', 'silverman', or a number")
+    bw = factor * np.sqrt(variance)
+    if not bw > 0:
+        raise ValueError('The bandwidth is zero, since all values are the same')
+
+    # Linear binning onto a grid covering the values, the requested points, and the kernel tails
+    low, high = low - 4 * bw, high + 4 * bw
+    if x is not None:
+        x = np.asarray(x, dtype=float)
+        low, high = min(low, np.min(x)), max(high, np.max(x))
+    grid = np.linspace(low, high, gridsize)
+    delta = grid[1] - grid[0]
+    binned = np.zeros(gridsize)
+    for b in blocks:
+        position = values[b] - low
+        position /= delta
+        left = np.minimum(position.astype(np.int64), gridsize - 2)  # positions are not negative, so this is floor
+        position -= left
+        if weights is None:
+            upper = np.bincount(left, weights=position, minlength=gridsize)
+            binned += np.bincount(left, minlength=gridsize) - upper
+        else:
+            position *= weights[b]
+            upper = np.bincount(left, weights=position, minlength=gridsize)
+            binned += np.bincount(left, weights=weights[b], minlength=gridsize) - upper
+        binned[1:] += upper[:-1]
+
+    # Convolution with the Gaussian kernel, zero-padded so the ends do not wrap around
+    size = int(2 ** np.ceil(np.log2(2 * gridsize)))
+    lags = np.arange(size)
+    lags = np.where(lags < size // 2, lags, lags - size) * delta
+    kernel = norm.pdf(lags, scale=bw)
+    density = np.fft.irfft(np.fft.rfft(binned, size) * np.fft.rfft(kernel), size)[:gridsize] / total
+    density = np.maximum(density, 0)
+
+    if x is None:
+        return grid, density
+    return x, np.interp(x, grid, density)
+
+
+def pvalue_plot(point, sd, color='b', fill=True, null=0, alpha=None, ax=None):
     """Creates a plot of the p-value distribution based on a point estimate and standard deviation.
     I find this plot to be useful to explain p-values and how much evidence weight you have in a
     specific value. I think it is useful to explain what exactly a p-value tells you. Note that this
@@ -431,6 +791,8 @@ def pvalue_plot(point, sd, color='b', fill=True, null=0, alpha=None):
     alpha : float, optional
         Whether to draw a line designating significance level area. Default is None, which does not draw this line.
         Generally, would be set to 0.05 to correspond to the widely used alpha of 0.05
+    ax : matplotlib axes, optional
+        Axes to draw on. Default is None, which draws on the current axes of pyplot
 
     Returns
     -----------
@@ -466,7 +828,8 @@ def pvalue_plot(point, sd, color='b', fill=True, null=0, alpha=None):
             lower = null - 3 * sd
         else:
             lower = point - 3 * sd
-    ax = plt.gca()
+    if ax is None:
+        ax = plt.gca()
     x1 = np.linspace(lower, point, 100)
     x2 = np.linspace(point, upper, 100)
     ax.plot(x2, 2 * (1 - norm.cdf(x2, loc=point, scale=sd)), c=color)
@@ -483,9 +846,10 @@ def pvalue_plot(point, sd, color='b', fill=True, null=0, alpha=None):
     return ax
 
 
-def spaghetti_plot(df, idvar, variable, time):
+def spaghetti_plot(df, idvar, variable, time, sample=None, alpha=1, random_state=None, ax=None):
     """Create a spaghetti plot by an ID variable. A spaghetti plot can be useful for visualizing
-    trends or looking at longitudinal data patterns for individuals all at once.
+    trends or looking at longitudinal data patterns for individuals all at once. All lines are drawn as a single
+    matplotlib LineCollection, so panels with many individuals are quick to draw
 
     Parameters
     ------------
@@ -497,6 +861,15 @@ def spaghetti_plot(df, idvar, variable, time):
         Variable of interest to see how it varies over time
     time : str
         Time or other variable in which the variable variation occurs
+    sample : int, optional
+        Number of IDs to randomly sample and plot. Default is None, which plots every ID
+    alpha : float, str, optional
+        Transparency of the lines. 'auto' lowers the transparency as the number of plotted IDs increases, so dense
+        panels show where most lines are. Default is 1
+    random_state : None, int, optional
+        Seed for sampling IDs
+    ax : matplotlib axes, optional
+        Axes to draw on. Default is None, which draws on the current axes of pyplot
 
     Returns
     -----------
@@ -512,18 +885,173 @@ def spaghetti_plot(df, idvar, variable, time):
     Generating spaghetti plot for changing CD4 count
     >>>spaghetti_plot(df, idvar='id', variable='cd4', time='enter')
     >>>plt.show()
+
+    Generating spaghetti plot for 100 randomly sampled individuals
+    >>>spaghetti_plot(df, idvar='id', variable='cd4', time='enter', sample=100, alpha='auto', random_state=1)
+    >>>plt.show()
     """
-    ax = plt.gca()
-    for i in df[idvar].unique():
-        s = df.loc[df[idvar] == i].copy()
-        s.sort_values(time, ascending=False)
-        ax.plot(s[time], s[variable])
+    ids, codes = np.unique(np.asarray(df[idvar]), return_inverse=True)
+    if sample is not None and sample < ids.shape[0]:
+        keep = np.random.RandomState(random_state).choice(ids.shape[0], size=sample, replace=False)
+        selected = np.isin(codes, keep)
+        codes = codes[selected]
+    else:
+        selected = slice(None)
+    x = np.asarray(df[time], dtype=float)[selected]
+    y = np.asarray(df[variable], dtype=float)[selected]
+
+    # Sorting by ID then time, and splitting the points into one line per ID
+    order = np.lexsort((x, codes))
+    codes = codes[order]
+    points = np.stack([x[order], y[order]], axis=1)
+    lines = np.split(points, np.flatnonzero(codes[1:] != codes[:-1]) + 1)
+
+    if alpha == 'auto':
+        alpha = min(1., 100. / len(lines))
+    cycle = matplotlib.rcParams['axes.prop_cycle'].by_key()['color']
+    colors = [cycle[i % len(cycle)] for i in range(len(lines))]
+
+    if ax is None:
+        ax = plt.gca()
+    ax.add_collection(LineCollection(lines, colors=colors, alpha=alpha))
+    ax.update_datalim(points)
+    ax.autoscale_view()
     ax.set_xlabel(time)
     ax.set_ylabel(variable)
     return ax
 
 
-def roc(df, true, threshold, youden_index=True):
+def roc_curve(df, true, threshold, points=None):
+    """Calculate the Receiver Operator Curve from true values and predicted probabilities. Every cutpoint is found
+    in a single pass over the sorted predicted probabilities, so large data sets with continuous predictions are quick
+    to process. Sensitivity and 1 - specificity are calculated for predicting the outcome when the predicted
+    probability is greater than or equal to each cutpoint
+
+    Parameters
+    ------------
+    df : DataFrame
+        Pandas dataframe containing variables of interest
+    true : str
+        True designation of the outcome (1, 0)
+    threshold : str
+        Predicted probabilities for the outcome
+    points : int, optional
+        Maximum number of points to return. The curve is downsampled to points spread evenly along the curve, always
+        keeping the first and last. Default is None, which returns all cutpoints
+
+    Returns
+    -----------
+    DataFrame
+        With the columns threshold, sensitivity, specificity, and fpr (1 - specificity), ordered from the highest to
+        the lowest cutpoint. The first and last cutpoints are just above and below the largest and smallest predicted
+        probability
+
+    Examples
+    ------------
+    >>>from zepid.graphics import roc_curve
+    >>>curve = roc_curve(df, true='dead', threshold='predicted', points=500)
+    >>>plt.plot(curve['fpr'], curve['sensitivity'])
+    """
+    y, p = _roc_values(df, true, threshold)
+    order = np.argsort(-p, kind='mergesort')
+    p = p[order]
+    tp = np.cumsum(y[order])
+    fp = np.arange(1, y.shape[0] + 1) - tp
+
+    # Last observation of each distinct predicted probability holds the counts at that cutpoint
+    last = np.append(np.flatnonzero(p[1:] != p[:-1]), p.shape[0] - 1)
+    thresh = np.concatenate([[p[0] + 0.001], p[last], [p[-1] - 0.001]])
+    sens = np.concatenate([[0.], tp[last], [tp[-1]]]) / tp[-1]
+    fpr = np.concatenate([[0.], fp[last], [fp[-1]]]) / fp[-1]
+
+    if points is not None and points < thresh.shape[0]:
+        if points < 2:
+            raise ValueError('points must be at least 2')
+        # The curve only moves up or right, so sensitivity + fpr measures progress along it
+        progress = sens + fpr
+        keep = np.searchsorted(progress, np.linspace(0, 2, points), side='left')
+        keep = np.unique(np.clip(keep, 0, thresh.shape[0] - 1))
+        keep[-1] = thresh.shape[0] - 1
+        thresh, sens, fpr = thresh[keep], sens[keep], fpr[keep]
+
+    return pd.DataFrame({'threshold': thresh, 'sensitivity': sens, 'specificity': 1 - fpr, 'fpr': fpr},
+                        columns=['threshold', 'sensitivity', 'specificity', 'fpr'])
+
+
+def roc_auc(df, true, threshold, alpha=0.05):
+    """Calculate the area under the Receiver Operator Curve (AUC), with confidence intervals from DeLong's variance,
+    and Youden's index. Youden's index is calculated as
+
+    .. math::
+
+        P_{Yi} = max(Se_i + Sp_i - 1)
+
+    Parameters
+    ------------
+    df : DataFrame
+        Pandas dataframe containing variables of interest
+    true : str
+        True designation of the outcome (1, 0)
+    threshold : str
+        Predicted probabilities for the outcome
+    alpha : float, optional
+        Alpha for the confidence intervals. Default is 0.05
+
+    Returns
+    -----------
+    Series
+        With the AUC, its standard error and confidence interval, and the cutpoint, sensitivity, and specificity of
+        Youden's index
+
+    Examples
+    ------------
+    >>>from zepid.graphics import roc_auc
+    >>>roc_auc(df, true='dead', threshold='predicted')
+
+    References
+    ------------
+    DeLong ER, DeLong DM, Clarke-Pearson DL. (1988). Comparing the areas under two or more correlated receiver
+    operating characteristic curves: a nonparametric approach. Biometrics, 44(3), 837-845.
+
+    Sun X, Xu W. (2014). Fast implementation of DeLong's algorithm for comparing the areas under correlated receiver
+    operating characteristic curves. IEEE Signal Processing Letters, 21(11), 1389-1393.
+    """
+    y, p = _roc_values(df, true, threshold)
+    cases = p[y == 1]
+    controls = p[y == 0]
+    n1 = cases.shape[0]
+    n0 = controls.shape[0]
+
+    # DeLong's placement values from midranks, with ties counted as one half
+    ranks = rankdata(p)
+    v10 = (ranks[y == 1] - rankdata(cases)) / n0
+    v01 = 1 - (ranks[y == 0] - rankdata(controls)) / n1
+    auc = np.mean(v10)
+    se = np.sqrt(np.var(v10, ddof=1) / n1 + np.var(v01, ddof=1) / n0)
+    zalpha = norm.ppf(1 - alpha / 2, loc=0, scale=1)
+
+    curve = roc_curve(df, true, threshold)
+    ind = np.argmax(curve['sensitivity'] + curve['specificity'] - 1)
+    return pd.Series([auc, se, max(auc - zalpha*se, 0), min(auc + zalpha*se, 1), curve['threshold'][ind],
+                      curve['sensitivity'][ind], curve['specificity'][ind]],
+                     index=['auc', 'se', 'lower', 'upper', 'youden_index', 'sensitivity', 'specificity'])
+
+
+def _roc_values(df, true, threshold):
+    """Hidden function that extracts and checks the true values and predicted probabilities
+    """
+    tf = df[[threshold, true]]
+    if tf.isnull().values.sum() != 0:
+        raise ValueError('ROC curve cannot handle missing data for probability or true values')
+    y = np.asarray(tf[true], dtype=float)
+    if not np.isin(y, [0, 1]).all():
+        raise ValueError('The true values must be 1 or 0')
+    if y.sum() == 0 or y.sum() == y.shape[0]:
+        raise ValueError('Both true values (1 and 0) must be present')
+    return y.astype(np.int64), np.asarray(tf[threshold], dtype=float)
+
+
+def roc(df, true, threshold, youden_index=True, points=None, ax=None):
     """Generate a Receiver Operator Curve from true values and predicted probabilities. Youden's Index can also be
     calculated. Youden's index is calculated as
 
@@ -531,6 +1059,8 @@ def roc(df, true, threshold, youden_index=True):
 
         P_{Yi} = max(Se_i + Sp_i - 1)
 
+    The points of the curve are calculated by roc_curve()
+
     Parameters
     ------------
     df : DataFrame
@@ -542,50 +1072,39 @@ def roc(df, true, threshold, youden_index=True):
     youden_index : bool, optional
         Whether to calculate Youden's index. Youden's index maximizes both sensitivity and specificity. The formula
         finds the maximum of (sensitivity + specificity - 1)
+    points : int, optional
+        Maximum number of points to draw. Youden's index is still calculated from every cutpoint. Default is None,
+        which draws every cutpoint
+    ax : matplotlib axes, optional
+        Axes to draw on. Default is None, which draws on the current axes of pyplot
 
     Returns
     -----------
     matplotlib axes
     """
-    sens = []
-    fpr = []
-    thresh = []
-    tf = df[[threshold, true]].copy()
-    if tf.isnull().values.sum() != 0:
-        raise ValueError('ROC curve cannot handle missing data for probability or true values')
-
-    # Getting all possible cutpoints
-    values = (list(np.unique(tf[threshold])))
-    values = [float(np.min(tf[threshold]) - 0.001)] + values + [float(np.max(tf[threshold]) + 0.001)]
-    # Going through all the cutpoints and calculating Sensitivity and 1-Specificity
-    for v in list(reversed(values)):
-        thresh.append(v)
-        prediction = np.where(tf[threshold] >= v, 1, 0)
-        se = prediction[tf[true] == 1].mean()
-        sens.append(se)
-        sp = prediction[tf[true] == 0].mean()
-        fpr.append(sp)
+    curve = roc_curve(df, true, threshold)
 
     # If requested, calculate Youden's Index
     if youden_index is True:
-        spec = [1 - i for i in fpr]
-        youdens = []
-        for i, j in zip(sens, spec):
-            youdens.append(i + j - 1)
-        ind = np.argmax(youdens)
+        ind = np.argmax(curve['sensitivity'] + curve['specificity'] - 1)
+        youden = curve['threshold'][ind]
         print('----------------------------------------------------------------------')
-        print("Youden's Index: ", thresh[ind])
+        print("Youden's Index: ", youden)
         print("Predictive values at Youden's Index")
-        print("\tSensitivity: ", sens[ind])
-        print("\tSpecificity: ", spec[ind])
+        print("\tSensitivity: ", curve['sensitivity'][ind])
+        print("\tSpecificity: ", curve['specificity'][ind])
         print('----------------------------------------------------------------------')
 
+    if points is not None:
+        curve = roc_curve(df, true, threshold, points=points)
+
     # Creating ROC plot
-    ax = plt.gca()
-    ax.plot(fpr, sens, color='blue')
+    if ax is None:
+        ax = plt.gca()
+    ax.plot(curve['fpr'], curve['sensitivity'], color='blue')
     ax.plot([0, 1], [0, 1], color='gray', linestyle='--')
     if youden_index is True:
-        ax.text(0.65, 0.35, "Youden's Index:\n      " + str(round(thresh[ind], 5)))
+        ax.text(0.65, 0.35, "Youden's Index:\n      " + str(round(youden, 5)))
     ax.set_xlim([-0.01, 1.01])
     ax.set_ylim([-0.01, 1.01])
     ax.set_ylabel('Sensitivity')
@@ -594,7 +1113,7 @@ def roc(df, true, threshold, youden_index=True):
 
 
 def dynamic_risk_plot(risk_exposed, risk_unexposed, measure='RD', loess=True, loess_value=0.25, point_color='darkblue',
-                      line_color='b', scale='linear'):
+                      line_color='b', scale='linear', ax=None, loess_iterations=3):
     """Creates a plot of risk measures over time. See Cole et al. "Estimation of standardized risk difference and ratio
     in a competing risks framework: application to injection drug use and progression to AIDS after initiation of
     antiretroviral therapy." Am J Epidemiol. 2015 for an example of this plot
@@ -613,7 +1132,7 @@ def dynamic_risk_plot(risk_exposed, risk_unexposed, measure='RD', loess=True, lo
     loess : bool, optional
         Whether to generate LOESS curve fit to the calculated points. Default is True
     loess_value : float, optional
-        Fraction of values to fit LOESS curve to. Default is 0.25
+        Fraction of values to fit LOESS curve to. Default is 0.25. The LOESS curve is fit by binned_loess()
     point_color : str, optional
         Color of the points
     line_color : str, optional
@@ -621,6 +1140,10 @@ def dynamic_risk_plot(risk_exposed, risk_unexposed, measure='RD', loess=True, lo
     scale : str, optional
         Change the y-axis scale. Options are 'linear' (default), 'log', 'log-transform'. 'log' and 'log-transform' is
         only a valid option for Risk Ratio plots
+    ax : matplotlib axes, optional
+        Axes to draw on. Default is None, which draws on the current axes of pyplot
+    loess_iterations : int, optional
+        Number of robustness iterations of the LOESS curve. Default is 3, as in statsmodels lowess
 
     Returns
     -----------
@@ -647,13 +1170,12 @@ def dynamic_risk_plot(risk_exposed, risk_unexposed, measure='RD', loess=True, lo
         raise ValueError('Only "RD" and "RR" are currently supported')
 
     # Generating the plot
-    ax = plt.gca()
+    if ax is None:
+        ax = plt.gca()
     ax.plot(r['timeline'], r['m'], 'o', c=point_color)
     if loess is True:
-        l = lowess(list(r['m']), list(r['timeline']), frac=loess_value)
-        lowess_x = list(zip(*l))[0]
-        lowess_y = list(zip(*l))[1]
-        ax.plot(lowess_x, lowess_y, '-', c=line_color, linewidth=4)
+        l = binned_loess(r['timeline'], r['m'], frac=loess_value, it=loess_iterations)
+        ax.plot(l['x'], l['smoothed'], '-', c=line_color, linewidth=4)
     if measure == 'RD':
         ax.hlines(0, 0, np.max(r['timeline'] + 0.5), linewidth=1.5)
         ax.set_ylabel('Risk Difference')
@@ -0,0 +1,351 @@
+import numpy as np
+import pandas as pd
+
+from .distributions import QuasiRandom, _check_random_state, _spawn_seed
+from .Streaming import StreamingSummary
+from .grid import _bias_factor
+
+
+class MultipleBiasAnalysis:
+    def __init__(self, a, b, c, d):
+        """Probabilistic bias analysis of the risk ratio from a 2x2 table for multiple sources of bias. Exposure or
+        outcome misclassification, selection bias, an unmeasured binary confounder, and random error can be corrected
+        for. Following Lash & Fox, the corrections are applied in the reverse order of how the biases occur
+        (misclassification, then selection bias, then confounding, then random error).
+
+        Bias parameters are drawn in chunks and only a binned summary of the corrected risk ratios is kept (see
+        StreamingSummary), so the number of draws is not limited by memory
+
+        Parameters
+        ------------
+        a : float
+            Number of exposed cases
+        b : float
+            Number of exposed non-cases
+        c : float
+            Number of unexposed cases
+        d : float
+            Number of unexposed non-cases
+
+        Notes
+        -----
+        Each bias parameter is either a fixed number or a function that takes the arguments size and random_state
+        and returns an array of draws, like the distributions in zepid.sensitivity_analysis. Parameters of those
+        distributions can be set with functools.partial
+
+        Draws where a correction leads to an impossible (zero or negative) cell count are discarded. The number of
+        discarded draws is stored in n_discarded
+
+        Examples
+        -------------
+        >>>from functools import partial
+        >>>from zepid.sensitivity_analysis import MultipleBiasAnalysis, trapezoidal
+        >>>mba = MultipleBiasAnalysis(a=40, b=60, c=20, d=80)
+        >>>mba.exposure_misclassification(sensitivity_cases=partial(trapezoidal, 0.75, 0.85, 0.95, 1.0),
+        >>>                               specificity_cases=partial(trapezoidal, 0.7, 0.8, 0.9, 0.95))
+        >>>mba.unmeasured_confounder(rr_confounder=partial(trapezoidal, 0.9, 1.1, 1.7, 1.8),
+        >>>                          prop_exposed=partial(trapezoidal, 0.25, 0.28, 0.32, 0.35),
+        >>>                          prop_unexposed=partial(trapezoidal, 0.55, 0.58, 0.62, 0.65))
+        >>>mba.fit(draws=10000000)
+        >>>mba.summary()
+
+        References
+        ----------
+        Lash TL, Fox MP, Fink AK. (2009). Applying Quantitative Bias Analysis to Epidemiologic Data. Springer.
+        """
+        if np.min([a, b, c, d]) <= 0:
+            raise ValueError('All cells of the 2x2 table must be greater than zero')
+        self.a = a
+        self.b = b
+        self.c = c
+        self.d = d
+
+        self._exposure_mis = None
+        self._outcome_mis = None
+        self._selection = None
+        self._confounder = None
+        self.quantiles = None
+        self.mc_error = None
+        self.systematic_summary = None
+        self.total_summary = None
+        self.n_draws = None
+        self.n_discarded = None
+
+    def exposure_misclassification(self, sensitivity_cases, specificity_cases, sensitivity_noncases=None,
+                                   specificity_noncases=None):
+        """Sensitivity and specificity of the exposure classification. If the sensitivity and specificity among the
+        non-cases are not specified, the misclassification is assumed to be non-differential
+
+        Parameters
+        ------------
+        sensitivity_cases : float, function
+            Sensitivity of the exposure classification among cases
+        specificity_cases : float, function
+            Specificity of the exposure classification among cases
+        sensitivity_noncases : float, function, optional
+            Sensitivity of the exposure classification among non-cases. Default is None, which uses the sensitivity
+            among cases
+        specificity_noncases : float, function, optional
+            Specificity of the exposure classification among non-cases. Default is None, which uses the specificity
+            among cases
+        """
+        self._exposure_mis = [sensitivity_cases, specificity_cases, sensitivity_noncases, specificity_noncases]
+
+    def outcome_misclassification(self, sensitivity_exposed, specificity_exposed, sensitivity_unexposed=None,
+                                  specificity_unexposed=None):
+        """Sensitivity and specificity of the outcome classification. If the sensitivity and specificity among the
+        unexposed are not specified, the misclassification is assumed to be non-differential
+
+        Parameters
+        ------------
+        sensitivity_exposed : float, function
+            Sensitivity of the outcome classification among the exposed
+        specificity_exposed : float, function
+            Specificity of the outcome classification among the exposed
+        sensitivity_unexposed : float, function, optional
+            Sensitivity of the outcome classification among the unexposed. Default is None, which uses the sensitivity
+            among the exposed
+        specificity_unexposed : float, function, optional
+            Specificity of the outcome classification among the unexposed. Default is None, which uses the specificity
+            among the exposed
+        """
+        self._outcome_mis = [sensitivity_exposed, specificity_exposed, sensitivity_unexposed, specificity_unexposed]
+
+    def selection_bias(self, exposed_cases, exposed_noncases, unexposed_cases, unexposed_noncases):
+        """Probabilities of being selected into the study for each cell of the 2x2 table
+
+        Parameters
+        ------------
+        exposed_cases : float, function
+            Probability of selection for exposed cases
+        exposed_noncases : float, function
+            Probability of selection for exposed non-cases
+        unexposed_cases : float, function
+            Probability of selection for unexposed cases
+        unexposed_noncases : float, function
+            Probability of selection for unexposed non-cases
+        """
+        self._selection = [exposed_cases, exposed_noncases, unexposed_cases, unexposed_noncases]
+
+    def unmeasured_confounder(self, rr_confounder, prop_exposed, prop_unexposed):
+        """Bias parameters for an unmeasured binary confounder. See MonteCarloRR for details of the correction
+
+        Parameters
+        ------------
+        rr_confounder : float, function
+            Risk ratio between the unmeasured confounder and the outcome
+        prop_exposed : float, function
+            Proportion of the exposed with the unmeasured confounder
+        prop_unexposed : float, function
+            Proportion of the unexposed with the unmeasured confounder
+        """
+        self._confounder = [rr_confounder, prop_exposed, prop_unexposed]
+
+    def fit(self, draws=100000, chunk_size=1000000, random_error=True, method='random', replicates=10,
+            random_state=None):
+        """Run the probabilistic bias analysis. The corrected risk ratios are summarized by quantiles, which are
+        stored in the quantiles attribute for the systematic error only and (if requested) for the total error. The
+        underlying summaries are stored in systematic_summary and total_summary (see StreamingSummary), which can be
+        merged with the summaries of runs in other processes.
+
+        The draws are split into at least replicates independent chunks. The Monte Carlo standard errors of the
+        quantiles, estimated from the spread of the quantiles between chunks, are stored in mc_error
+
+        Parameters
+        ------------
+        draws : int, optional
+            Number of draws of the bias parameters. Default is 100000
+        chunk_size : int, optional
+            Maximum number of draws processed at once. This bounds the memory used. Default is 1000000
+        random_error : bool, optional
+            Whether to also include random error, by drawing from the normal approximation of the log risk ratio of
+            the bias-corrected 2x2 table. Default is True
+        method : str, optional
+            How the bias parameters and random error are drawn. Options are 'random' (default) for pseudo-random
+            draws, or 'sobol' or 'halton' for scrambled quasi-random draws (see QuasiRandom). Quasi-random draws
+            require the bias parameter functions to be distributions from zepid.sensitivity_analysis, and give more
+            precise quantiles for the same number of draws. Each chunk is an independently scrambled sequence
+        replicates : int, optional
+            Minimum number of chunks to split the draws into, which are used to estimate the Monte Carlo error.
+            Default is 10
+        random_state : None, int, numpy.random.Generator, numpy.random.RandomState, optional
+            Source of the random numbers, which is passed to the bias parameter functions. Default is None, which uses
+            NumPy's global random state
+        """
+        if type(draws) is not int or draws < 1:
+            raise ValueError('draws must be a positive integer')
+        if type(chunk_size) is not int or chunk_size < 1:
+            raise ValueError('chunk_size must be a positive integer')
+        if type(replicates) is not int or not 1 <= replicates <= draws:
+            raise ValueError('replicates must be a positive integer, and no more than draws')
+        if method not in ['random', 'sobol', 'halton']:
+            raise ValueError('method must be one of "random", "sobol", or "halton"')
+        rng = _check_random_state(random_state)
+
+        # Splitting the draws into equal chunks
+        chunks, extra = divmod(draws, max(replicates, int(np.ceil(draws / chunk_size))))
+        sizes = [chunks + 1] * extra + [chunks] * (max(replicates, int(np.ceil(draws / chunk_size))) - extra)
+
+        q = [2.5, 25, 50, 75, 97.5]
+        systematic = StreamingSummary()
+        total = StreamingSummary()
+        estimates = {'systematic error': [], 'total error': []}
+        discarded = 0
+        for n in sizes:
+            if method == 'random':
+                chunk_rng = rng
+            else:
+                chunk_rng = QuasiRandom(self._dimensions(random_error), method=method, seed=_spawn_seed(rng))
+            rr_s, rr_t = self._correct(n, chunk_rng, random_error)
+            discarded += n - rr_s.shape[0]
+            for label, rr, merged in [('systematic error', rr_s, systematic), ('total error', rr_t, total)]:
+                if rr.shape[0] == 0 or (label == 'total error' and not random_error):
+                    continue
+                chunk_summary = StreamingSummary()
+                chunk_summary.update(rr)
+                estimates[label].append(chunk_summary.quantile(q))
+                merged.merge(chunk_summary)
+
+        if systematic.count == 0:
+            raise ValueError('All draws led to impossible corrected 2x2 tables. The bias parameters are not '
+                             'compatible with the observed data')
+        rows = {'systematic error': systematic.quantile(q)}
+        if random_error:
+            rows['total error'] = total.quantile(q)
+        self.quantiles = pd.DataFrame.from_dict(rows, orient='index', columns=q)
+        if len(estimates['systematic error']) > 1:
+            self.mc_error = pd.DataFrame.from_dict({k: np.std(v, axis=0, ddof=1) / np.sqrt(len(v))
+                                                    for k, v in estimates.items() if len(v) > 1},
+                                                   orient='index', columns=q).loc[self.quantiles.index]
+        else:
+            self.mc_error = None
+        self.systematic_summary = systematic
+        self.total_summary = total if random_error else None
+        self.n_draws = draws
+        self.n_discarded = discarded
+
+    def summary(self, decimal=3):
+        """Print the summary of the bias analysis. fit() must be run before this
+
+        Parameters
+        -------------
+        decimal : int, optional
+            Decimal places to display in output. Default is 3
+        """
+        if self.quantiles is None:
+            raise ValueError('fit() must be run before summary()')
+        print('----------------------------------------------------------------------')
+        print('Observed Risk Ratio: ', np.round((self.a / (self.a + self.b)) / (self.c / (self.c + self.d)), decimal))
+        print('Draws: ', self.n_draws, '   Discarded: ', self.n_discarded)
+        print('----------------------------------------------------------------------')
+        for label, row in self.quantiles.iterrows():
+            print(label.capitalize())
+            print('Median corrected Risk Ratio: ', np.round(row[50], decimal))
+            print('2.5th & 97.5th Percentiles: ', np.round([row[2.5], row[97.5]], decimal))
+            if self.mc_error is not None:
+                e = self.mc_error.loc[label]
+                print('Monte Carlo standard errors: ', np.round([e[50], e[2.5], e[97.5]], decimal + 1))
+        print('----------------------------------------------------------------------')
+
+    def plot(self, total_error=True, bw_method='scott', fill=True, color='b', ax=None):
+        """Generate a Gaussian kernel density plot of the corrected risk ratio distribution. See
+        StreamingSummary.plot() for details
+
+        Parameters
+        -------------
+        total_error : bool, optional
+            Whether to plot the corrected risk ratios for total error, rather than systematic error only. Default is
+            True
+        bw_method : str, optional
+            Method used to estimate the bandwidth. Following SciPy, either 'scott' or 'silverman' are valid options
+        fill : bool, optional
+            Whether to color the area under the density curves. Default is true
+        color : str, optional
+            Color of the line/area. Default is Blue
+        ax : matplotlib axes, optional
+            Axes to draw on. Default is None, which draws on the current axes of pyplot
+
+        Returns
+        ------------
+        matplotlib axes
+        """
+        if self.systematic_summary is None:
+            raise ValueError('fit() must be run before plot()')
+        if total_error and self.total_summary is None:
+            raise ValueError('random_error must be True in fit() to plot the total error')
+        s = self.total_summary if total_error else self.systematic_summary
+        ax = s.plot(bw_method=bw_method, fill=fill, color=color, ax=ax)
+        ax.set_xlabel('Corrected Risk Ratio')
+        return ax
+
+    def _dimensions(self, random_error):
+        """Hidden function that counts the number of bias parameters (and random error) drawn for each chunk
+        """
+        parameters = []
+        for p in [self._exposure_mis, self._outcome_mis, self._selection, self._confounder]:
+            if p is not None:
+                parameters.extend(p)
+        return max(sum(callable(p) for p in parameters) + int(random_error), 1)
+
+    def _correct(self, n, rng, random_error):
+        """Hidden function that corrects the 2x2 table for n draws of the bias parameters. Returns the corrected risk
+        ratios for systematic error and total error of the valid draws
+        """
+        a, b, c, d = (np.full(n, float(x)) for x in [self.a, self.b, self.c, self.d])
+
+        # Exposure misclassification, within cases and within non-cases
+        if self._exposure_mis is not None:
+            se1, sp1 = _draw(self._exposure_mis[0], n, rng), _draw(self._exposure_mis[1], n, rng)
+            se0 = se1 if self._exposure_mis[2] is None else _draw(self._exposure_mis[2], n, rng)
+            sp0 = sp1 if self._exposure_mis[3] is None else _draw(self._exposure_mis[3], n, rng)
+            cases, noncases = a + c, b + d
+            a = (a - (1 - sp1) * cases) / (se1 + sp1 - 1)
+            c = cases - a
+            b = (b - (1 - sp0) * noncases) / (se0 + sp0 - 1)
+            d = noncases - b
+
+        # Outcome misclassification, within exposed and within unexposed
+        if self._outcome_mis is not None:
+            se1, sp1 = _draw(self._outcome_mis[0], n, rng), _draw(self._outcome_mis[1], n, rng)
+            se0 = se1 if self._outcome_mis[2] is None else _draw(self._outcome_mis[2], n, rng)
+            sp0 = sp1 if self._outcome_mis[3] is None else _draw(self._outcome_mis[3], n, rng)
+            exposed, unexposed = a + b, c + d
+            a = (a - (1 - sp1) * exposed) / (se1 + sp1 - 1)
+            b = exposed - a
+            c = (c - (1 - sp0) * unexposed) / (se0 + sp0 - 1)
+            d = unexposed - c
+
+        # Selection bias
+        if self._selection is not None:
+            a = a / _draw(self._selection[0], n, rng)
+            b = b / _draw(self._selection[1], n, rng)
+            c = c / _draw(self._selection[2], n, rng)
+            d = d / _draw(self._selection[3], n, rng)
+
+        rr = (a / (a + b)) / (c / (c + d))
+
+        # Unmeasured confounding
+        if self._confounder is not None:
+            rr_c = _draw(self._confounder[0], n, rng)
+            p1 = _draw(self._confounder[1], n, rng)
+            p0 = _draw(self._confounder[2], n, rng)
+            rr = rr / _bias_factor(rr_c, p1, p0)
+
+        # Random error
+        if random_error:
+            se = np.sqrt(np.abs(1 / a - 1 / (a + b) + 1 / c - 1 / (c + d)))
+            rr_total = rr * np.exp(rng.standard_normal(size=n) * se)
+        else:
+            rr_total = rr
+
+        valid = (a > 0) & (b > 0) & (c > 0) & (d > 0) & (rr > 0) & np.isfinite(rr)
+        return rr[valid], rr_total[valid]
+
+
+def _draw(parameter, n, rng):
+    """Hidden function that draws n values of a bias parameter, which is either a fixed number or a function
+    """
+    if callable(parameter):
+        return np.asarray(parameter(size=n, random_state=rng), dtype=float)
+    return np.full(n, float(parameter))
+
@@ -1,7 +1,9 @@
 import numpy as np
 import pandas as pd
-from scipy import stats
-import matplotlib.pyplot as plt
+
+from .distributions import QuasiRandom, _check_random_state, _spawn_seed
+from .Streaming import StreamingSummary
+from .grid import _bias_factor
 
 
 class MonteCarloRR:
@@ -44,6 +46,8 @@ class MonteCarloRR:
         self.pc1 = None
         self.RRc_dist = None
         self.corrected_RR = None
+        self.corrected_summary = None
+        self.mc_error = None
 
     def confounder_RR_distribution(self, dist, seed=None):
         """Distribution of the risk ratio between the unmeasured confounder and the outcome. This
@@ -98,7 +102,7 @@ class MonteCarloRR:
             np.random.seed(seed)
         self.pc0 = dist
 
-    def fit(self):
+    def fit(self, method='random', replicates=10, random_state=None):
         """After the observed Risk Ratio, distribution of the confounder-outcome Risk Ratio, proportion
         of the unmeasured confounder in exposed, proportion of the unmeasured confounder in the unexposed.
 
@@ -109,6 +113,29 @@ class MonteCarloRR:
         Where RR* is the corrected risk ratio, RR is the observed risk ratio in the data set, RRc is the risk ratio
         between unmeasured confounder and outcome, p1 is the probability/proportion of unmeasured confounder in
         exposed, and p0 is the probability/proportion of unmeasured confounder in unexposed
+
+        The corrected risk ratios are stored in the corrected_RR array, which summary() reports exact percentiles of.
+        A constant-memory summary of them is also stored in corrected_summary (see StreamingSummary). It is used by
+        plot(), and can be merged with the summaries of other runs
+
+        Instead of arrays of draws, the distributions can be functions that take the arguments size and random_state
+        (like the distributions in zepid.sensitivity_analysis, with their parameters set by functools.partial). The
+        draws are then generated here, which allows quasi-random draws with method.
+
+        The draws are split into replicates. The Monte Carlo standard errors of the median and percentiles, estimated
+        from the spread between replicates, are stored in mc_error
+
+        Parameters
+        -------------
+        method : str, optional
+            How distributions given as functions are drawn. Options are 'random' (default) for pseudo-random draws,
+            or 'sobol' or 'halton' for scrambled quasi-random draws (see QuasiRandom). Quasi-random draws give more
+            precise percentiles for the same number of draws. Each replicate is an independently scrambled sequence
+        replicates : int, optional
+            Number of replicates to split the draws into, to estimate the Monte Carlo error. Default is 10
+        random_state : None, int, numpy.random.Generator, numpy.random.RandomState, optional
+            Source of the random numbers for distributions given as functions. Default is None, which uses NumPy's
+            global random state
         """
         if self.RRc_dist is None:
             raise ValueError('"confounder_RR_distribution()" has not been specified')
@@ -117,16 +144,41 @@ class MonteCarloRR:
         if self.pc0 is None:
             raise ValueError('"prop_confounder_unexposed()" has not been specified')
         
-        # Monte Carlo
-        sf = pd.DataFrame(index=[i for i in range(self.sample)])
-        sf['RR_cnf'] = self.RRc_dist
-        sf['p1'] = self.pc1
-        sf['p0'] = self.pc0
-        sf['RR_obs'] = self.RRo
-        sf['RR_cor'] = sf['RR_obs'] / ((sf['p1']*(sf['RR_cnf']-1)+1) / (sf['p0'] * (sf['RR_cnf'] - 1) + 1))
+        if method not in ['random', 'sobol', 'halton']:
+            raise ValueError('method must be one of "random", "sobol", or "halton"')
+        if type(replicates) is not int or not 1 <= replicates <= self.sample:
+            raise ValueError('replicates must be a positive integer, and no more than sample')
+        dists = [self.RRc_dist, self.pc1, self.pc0]
+        if method != 'random' and not any(callable(d) for d in dists):
+            raise ValueError('Quasi-random draws are only available when the distributions are given as functions')
+        rng = _check_random_state(random_state)
+
+        # Monte Carlo, in replicates of equal size
+        size, extra = divmod(self.sample, replicates)
+        corrected, estimates = [], []
+        start = 0
+        for r in range(replicates):
+            n = size + 1 if r < extra else size
+            if method == 'random':
+                rep_rng = rng
+            else:
+                rep_rng = QuasiRandom(sum(callable(d) for d in dists), method=method, seed=_spawn_seed(rng))
+            rr_cnf, p1, p0 = [np.asarray(d(size=n, random_state=rep_rng), dtype=float) if callable(d) else
+                              np.broadcast_to(np.asarray(d, dtype=float), (self.sample, ))[start:start + n]
+                              for d in dists]
+            corrected.append(self.RRo / _bias_factor(rr_cnf, p1, p0))
+            estimates.append(np.percentile(corrected[-1], q=[2.5, 25, 50, 75, 97.5]))
+            start += n
 
         # Setting new attribute
-        self.corrected_RR = list(sf['RR_cor'])
+        self.corrected_RR = np.concatenate(corrected)
+        self.corrected_summary = StreamingSummary()
+        self.corrected_summary.update(self.corrected_RR)
+        if replicates > 1:
+            self.mc_error = pd.Series(np.std(estimates, axis=0, ddof=1) / np.sqrt(replicates),
+                                      index=[2.5, 25, 50, 75, 97.5])
+        else:
+            self.mc_error = None
 
     def summary(self, decimal=3):
         """Generate the summary information after the corrected risk ratio distribution is
@@ -138,17 +190,21 @@ class MonteCarloRR:
             Decimal places to display in output. Default is 3
         """
         print('----------------------------------------------------------------------')
-        print('Median corrected Risk Ratio: ', np.round(np.median(self.corrected_RR),decimal))
-        print('Mean corrected Risk Ratio: ', np.round(np.mean(self.corrected_RR),decimal))
-        print('25th & 75th Percentiles: ', np.round_(np.percentile(self.corrected_RR,q=[25, 75]), decimals=decimal))
-        print('2.5th & 97.5th Percentiles: ', np.round_(np.percentile(self.corrected_RR,q=[2.5, 97.5]),
-                                                        decimals=decimal))
+        print('Median corrected Risk Ratio: ', np.round(np.median(self.corrected_RR), decimal))
+        print('Mean corrected Risk Ratio: ', np.round(np.mean(self.corrected_RR), decimal))
+        print('25th & 75th Percentiles: ', np.round(np.percentile(self.corrected_RR, q=[25, 75]), decimals=decimal))
+        print('2.5th & 97.5th Percentiles: ', np.round(np.percentile(self.corrected_RR, q=[2.5, 97.5]),
+                                                       decimals=decimal))
+        if self.mc_error is not None:
+            print('Monte Carlo standard errors of median, 2.5th & 97.5th: ',
+                  np.round(self.mc_error[[50, 2.5, 97.5]].values, decimal + 1))
         print('----------------------------------------------------------------------')
 
-    def plot(self, bw_method='scott', fill=True, color='b'):
+    def plot(self, bw_method='scott', fill=True, color='b', ax=None):
         """Generate a Gaussian kernel density plot of the corrected risk ratio distribution. The
         kernel density used is SciPy's Gaussian kernel. Either Scott's Rule or Silverman's Rule can
-        be implemented
+        be implemented. The density is estimated from a histogram of the corrected risk ratios, so it does
+        not depend on the number of draws
 
         Parameters
         -------------
@@ -158,19 +214,13 @@ class MonteCarloRR:
             Whether to color the area under the density curves. Default is true
         color : str, optional
             Color of the line/area for the treated group. Default is Blue
+        ax : matplotlib axes, optional
+            Axes to draw on. Default is None, which draws on the current axes of pyplot
 
         Returns
         ------------
         matplotlib axes
         """
-        x = np.linspace(np.min(self.corrected_RR),np.max(self.corrected_RR),100)
-        density = stats.kde.gaussian_kde(self.corrected_RR,bw_method=bw_method)
-
-        # Creating density plot
-        ax = plt.gca()
-        if fill:
-            ax.fill_between(x, density(x), color=color, alpha=0.2)
-        ax.plot(x, density(x), color=color)
+        ax = self.corrected_summary.plot(bw_method=bw_method, fill=fill, color=color, ax=ax)
         ax.set_xlabel('Corrected Risk Ratio')
-        ax.set_ylabel('Density')
         return ax
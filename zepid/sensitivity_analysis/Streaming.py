@@ -0,0 +1,195 @@
+import warnings
+import numpy as np
+
+
+class StreamingSummary:
+    def __init__(self, relative_accuracy=0.0001, min_value=1e-6, max_value=1e6):
+        """Summary of a stream of positive values, like the corrected risk ratios of a Monte Carlo bias analysis, that
+        uses constant memory. Values are added in chunks with update(), and summaries of separate chunks (or separate
+        worker processes) can be combined with merge().
+
+        Values are counted in bins that are evenly spaced on the log scale. Any quantile of the values between
+        min_value and max_value is reported with a relative error of at most relative_accuracy, regardless of the
+        number of values
+
+        Parameters
+        ------------
+        relative_accuracy : float, optional
+            Maximum relative error of the reported quantiles. Default is 0.0001 (0.01%)
+        min_value : float, optional
+            Smallest value that is summarized with the stated accuracy. Default is 1e-6
+        max_value : float, optional
+            Largest value that is summarized with the stated accuracy. Default is 1e6
+
+        Examples
+        -------------
+        >>>from zepid.sensitivity_analysis import StreamingSummary
+        >>>s = StreamingSummary()
+        >>>for i in range(100):
+        >>>    s.update(np.random.lognormal(size=1000000))
+        >>>s.quantile([2.5, 50, 97.5])
+
+        References
+        ----------
+        Masson C, Rim JE, Lee HK. (2019). DDSketch: A fast and fully-mergeable quantile sketch with relative-error
+        guarantees. Proceedings of the VLDB Endowment, 12(12), 2195-2205.
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError('relative_accuracy must be between 0 and 1')
+        if not 0 < min_value < max_value:
+            raise ValueError('The values must satisfy 0 < min_value < max_value')
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self._gamma)
+        self._offset = int(np.ceil(np.log(min_value) / self._log_gamma))
+        self.counts = np.zeros(int(np.ceil(np.log(max_value) / self._log_gamma)) - self._offset + 1, dtype=np.int64)
+        self.count = 0
+        self.underflow = 0
+        self.overflow = 0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        self._sum = 0.
+
+    def update(self, values):
+        """Add a chunk of values to the summary
+
+        Parameters
+        ------------
+        values : array
+            Positive values to add
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        if values.shape[0] == 0:
+            return
+        if not (values > 0).all():
+            raise ValueError('Only positive values can be summarized')
+        idx = np.ceil(np.log(values) / self._log_gamma).astype(np.int64) - self._offset
+        under = idx < 0
+        over = idx >= self.counts.shape[0]
+        self.counts += np.bincount(idx[~(under | over)], minlength=self.counts.shape[0])
+        self.underflow += int(np.sum(under))
+        self.overflow += int(np.sum(over))
+        self.count += values.shape[0]
+        self.minimum = min(self.minimum, np.min(values))
+        self.maximum = max(self.maximum, np.max(values))
+        self._sum += np.sum(values)
+
+    def merge(self, other):
+        """Add the values of another summary to this summary. Both must have the same relative_accuracy, min_value,
+        and max_value
+
+        Parameters
+        ------------
+        other : StreamingSummary
+            Summary to merge into this one
+        """
+        if ((self.relative_accuracy, self.min_value, self.max_value) !=
+                (other.relative_accuracy, other.min_value, other.max_value)):
+            raise ValueError('Only summaries with the same relative_accuracy, min_value, and max_value can be merged')
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        self.count += other.count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self._sum += other._sum
+
+    def mean(self):
+        """Mean of the values. This is calculated exactly
+        """
+        return self._sum / self.count
+
+    def quantile(self, q):
+        """Percentiles of the values, with a relative error of at most relative_accuracy
+
+        Parameters
+        ------------
+        q : float, list
+            Percentile(s) to calculate, between 0 and 100
+
+        Returns
+        ------------
+        float or array
+        """
+        if self.count == 0:
+            raise ValueError('No values have been added to the summary')
+        q = np.asarray(q, dtype=float)
+        if ((q < 0) | (q > 100)).any():
+            raise ValueError('Percentiles must be between 0 and 100')
+
+        # Finding the bin that holds each rank, with the underflow and overflow counts at either end
+        rank = np.floor(q / 100 * (self.count - 1))
+        cumulative = self.underflow + np.cumsum(self.counts)
+        idx = np.searchsorted(cumulative, rank, side='right')
+        values = 2 * self._gamma ** (idx + self._offset) / (self._gamma + 1)
+        under = rank < self.underflow
+        over = idx >= self.counts.shape[0]
+        if under.any() or over.any():
+            warnings.warn('Some percentiles are outside of min_value and max_value, so the minimum or maximum value is '
+                          'reported instead. These are not within the stated accuracy', UserWarning)
+        values = np.where(under, self.minimum, np.where(over, self.maximum, values))
+        values = np.clip(values, self.minimum, self.maximum)
+        if values.ndim == 0:
+            return float(values)
+        return values
+
+    def histogram(self, bins=100):
+        """Histogram of the values with evenly spaced bins between the minimum and maximum value
+
+        Parameters
+        ------------
+        bins : int, optional
+            Number of bins. Default is 100
+
+        Returns
+        ------------
+        tuple
+            Counts and edges of the bins, like numpy.histogram
+        """
+        centers = 2 * self._gamma ** (np.arange(self.counts.shape[0]) + self._offset) / (self._gamma + 1)
+        centers = np.append(centers, [self.minimum, self.maximum])
+        weights = np.append(self.counts, [self.underflow, self.overflow])
+        return np.histogram(np.clip(centers, self.minimum, self.maximum), bins=bins,
+                            range=(self.minimum, self.maximum), weights=weights)
+
+    def plot(self, bw_method='scott', fill=True, color='b', bins=1000, ax=None):
+        """Gaussian kernel density plot of the values. The kernel density is estimated from the histogram by
+        binned_kde(), so the time and memory used do not depend on the number of values
+
+        Parameters
+        -------------
+        bw_method : str, optional
+            Method used to estimate the bandwidth. Following SciPy, either 'scott' or 'silverman' are valid options
+        fill : bool, optional
+            Whether to color the area under the density curves. Default is true
+        color : str, optional
+            Color of the line/area. Default is Blue
+        bins : int, optional
+            Number of histogram bins the kernel density is estimated from. Default is 1000
+        ax : matplotlib axes, optional
+            Axes to draw on. Default is None, which draws on the current axes of pyplot
+
+        Returns
+        ------------
+        matplotlib axes
+        """
+        import matplotlib.pyplot as plt
+        from zepid.graphics import binned_kde
+
+        counts, edges = self.histogram(bins=bins)
+        x = np.linspace(self.minimum, self.maximum, 100)
+        if np.sum(counts > 0) > 1:
+            density = binned_kde(counts=counts, edges=edges, bw_method=bw_method, x=x)[1]
+        else:  # a single value, so there is no spread to estimate
+            density = np.zeros(x.shape[0])
+
+        if ax is None:
+            ax = plt.gca()
+        if fill:
+            ax.fill_between(x, density, color=color, alpha=0.2)
+        ax.plot(x, density, color=color)
+        ax.set_ylabel('Density')
+        return ax
@@ -3,9 +3,25 @@ for multiple bias analysis. This branch is still very much a work in progress. T
 to simplify sensitivity analyses, in the hopes they become more common in publications
 
 -MonteCarloRR(): generates a corrected RR distribution based on binary confounder
+-MultipleBiasAnalysis(): probabilistic bias analysis of a 2x2 table for misclassification, selection bias, unmeasured
+    confounding, and random error
+-StreamingSummary(): constant-memory, mergeable quantile summary of Monte Carlo draws
 -trapezoidal(): generates a trapezoidal distribution of values
+-triangular(): generates a triangular distribution of values
+-lognormal_ratio(): generates a log-normal distribution of ratio measures from their 95% limits
+-bounded_beta(): generates a beta distribution between a minimum and maximum
+-QuasiRandom(): scrambled Sobol or Halton numbers to draw the distributions with
+-confounding_grid(): corrected RR over a grid of unmeasured confounder parameters
+-confounding_tipping_point(): confounder-outcome RR at which the corrected CI reaches the null
 '''
 
 
-from .Simple import MonteCarloRR
-from .distributions import trapezoidal
+from zepid._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    attributes={'Simple': ['MonteCarloRR'],
+                'Multiple': ['MultipleBiasAnalysis'],
+                'Streaming': ['StreamingSummary'],
+                'distributions': ['trapezoidal', 'triangular', 'lognormal_ratio', 'bounded_beta', 'QuasiRandom'],
+                'grid': ['confounding_grid', 'confounding_tipping_point']})
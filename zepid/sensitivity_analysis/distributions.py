@@ -1,7 +1,7 @@
 import numpy as np
 
 
-def trapezoidal(mini, mode1, mode2, maxi, size=None):
+def trapezoidal(mini, mode1, mode2, maxi, size=None, random_state=None):
     """Creates trapezoidal distribution based on Fox & Lash 2005. This function can be used to generate distributions
     of probabilities and effect measures for sensitivity analyses. It is particularly useful when used in conjunction
     with rr_corr to determine a distribution of potential results due to a single unadjusted
@@ -19,6 +19,10 @@ def trapezoidal(mini, mode1, mode2, maxi, size=None):
         Maximum value of trapezoidal distribution
     size : int, optional
         Number of observations to generate. Default is None, which returns a single draw
+    random_state : None, int, numpy.random.Generator, numpy.random.RandomState, QuasiRandom, optional
+        Source of the random numbers. Default is None, which uses NumPy's global random state (so results are
+        reproducible with numpy.random.seed). An integer seeds a new numpy.random.Generator. With QuasiRandom, the
+        draws come from a scrambled low-discrepancy sequence
 
     Returns
     --------------
@@ -33,26 +37,257 @@ def trapezoidal(mini, mode1, mode2, maxi, size=None):
 
     100 draws from a trapezoidal distribution
     >>>trapezoidal(mini=0.2, mode1=0.3, mode2=0.5, maxi=0.6, size=100)
+
+    Draws using a numpy.random.Generator
+    >>>rng = np.random.default_rng(20)
+    >>>trapezoidal(mini=0.2, mode1=0.3, mode2=0.5, maxi=0.6, size=100, random_state=rng)
     """
-    if size is None:
-        p = np.random.uniform()
-        v = (p*(maxi+mode2-mini-mode1)+(mini+mode1)) / 2
-        if v < mode1:
-            v = mini + np.sqrt((mode1-mini)*(2*v-mini-mode1))
-        elif v > mode2:
-            v = maxi - np.sqrt(2*(maxi-mode2)*(v-mode2))
-        else:
-            pass   
-        return v
-    
-    # Draws the number specified by size
-    elif type(size) is int:
-        va = []
-        for i in range(size):
-            va.append(trapezoidal(mini=mini, mode1=mode1, mode2=mode2, maxi=maxi, size=None))
-        return np.array(va)
-    
-    # ValueError is size is not an integer
+    if not mini <= mode1 <= mode2 <= maxi:
+        raise ValueError('The parameters must satisfy mini <= mode1 <= mode2 <= maxi')
+    rng = _check_random_state(random_state)
+    n = _check_size(size)
+
+    # Inverse CDF of the trapezoidal distribution, applied to all uniform draws at once
+    p = rng.uniform(size=n)
+    v = (p*(maxi+mode2-mini-mode1)+(mini+mode1)) / 2
+    lower = v < mode1
+    upper = v > mode2
+    v[lower] = mini + np.sqrt((mode1-mini)*(2*v[lower]-mini-mode1))
+    v[upper] = maxi - np.sqrt(2*(maxi-mode2)*(v[upper]-mode2))
+    return _return_size(v, size)
+
+
+def triangular(mini, mode, maxi, size=None, random_state=None):
+    """Creates triangular distribution. Useful for sensitivity analyses when a most likely value and the bounds of a
+    bias parameter are known
+
+    Parameters
+    --------------
+    mini : float
+        Minimum value of triangular distribution
+    mode : float
+        Most likely value of triangular distribution
+    maxi : float
+        Maximum value of triangular distribution
+    size : int, optional
+        Number of observations to generate. Default is None, which returns a single draw
+    random_state : None, int, numpy.random.Generator, numpy.random.RandomState, QuasiRandom, optional
+        Source of the random numbers. Default is None, which uses NumPy's global random state
+
+    Returns
+    --------------
+    float or array
+        Returns either a single float from the distribution or an array of floats
+
+    Examples
+    --------------
+    >>>from zepid.sensitivity_analysis import triangular
+    >>>triangular(mini=0.9, mode=1.2, maxi=1.6, size=100)
+    """
+    if not mini <= mode <= maxi or mini == maxi:
+        raise ValueError('The parameters must satisfy mini <= mode <= maxi, with mini < maxi')
+    rng = _check_random_state(random_state)
+    if isinstance(rng, QuasiRandom):  # inverse CDF of the triangular distribution
+        p = rng.uniform(size=_check_size(size))
+        split = (mode - mini) / (maxi - mini)
+        v = np.where(p < split, mini + np.sqrt(p * (maxi - mini) * (mode - mini)),
+                     maxi - np.sqrt((1 - p) * (maxi - mini) * (maxi - mode)))
+    else:
+        v = rng.triangular(mini, mode, maxi, size=_check_size(size))
+    return _return_size(v, size)
+
+
+def lognormal_ratio(lower, upper, size=None, random_state=None):
+    """Creates log-normal distribution for a ratio measure (like a risk ratio) from its 95% limits. The natural log of
+    the ratio is normally distributed, with the mean at the midpoint of log(lower) and log(upper) and the standard
+    deviation chosen so that 95% of the draws are between lower and upper
+
+    Parameters
+    --------------
+    lower : float
+        Lower 95% limit of the ratio. Must be greater than zero
+    upper : float
+        Upper 95% limit of the ratio
+    size : int, optional
+        Number of observations to generate. Default is None, which returns a single draw
+    random_state : None, int, numpy.random.Generator, numpy.random.RandomState, QuasiRandom, optional
+        Source of the random numbers. Default is None, which uses NumPy's global random state
+
+    Returns
+    --------------
+    float or array
+        Returns either a single float from the distribution or an array of floats
+
+    Examples
+    --------------
+    >>>from zepid.sensitivity_analysis import lognormal_ratio
+    >>>lognormal_ratio(lower=1.1, upper=2.5, size=100)
+    """
+    if not 0 < lower < upper:
+        raise ValueError('The limits must satisfy 0 < lower < upper')
+    rng = _check_random_state(random_state)
+    mu = (np.log(lower) + np.log(upper)) / 2
+    sigma = (np.log(upper) - np.log(lower)) / (2 * 1.959964)
+    v = np.exp(mu + sigma * rng.standard_normal(size=_check_size(size)))
+    return _return_size(v, size)
+
+
+def bounded_beta(alpha, beta, mini=0, maxi=1, size=None, random_state=None):
+    """Creates beta distribution rescaled to lie between mini and maxi. Useful for bias parameters that are
+    proportions (like sensitivity, specificity, or the prevalence of an unmeasured confounder) and are known to fall
+    within certain bounds
+
+    Parameters
+    --------------
+    alpha : float
+        Alpha (first shape) parameter of the beta distribution. Must be greater than zero
+    beta : float
+        Beta (second shape) parameter of the beta distribution. Must be greater than zero
+    mini : float, optional
+        Minimum value of the distribution. Default is 0
+    maxi : float, optional
+        Maximum value of the distribution. Default is 1
+    size : int, optional
+        Number of observations to generate. Default is None, which returns a single draw
+    random_state : None, int, numpy.random.Generator, numpy.random.RandomState, QuasiRandom, optional
+        Source of the random numbers. Default is None, which uses NumPy's global random state
+
+    Returns
+    --------------
+    float or array
+        Returns either a single float from the distribution or an array of floats
+
+    Examples
+    --------------
+    >>>from zepid.sensitivity_analysis import bounded_beta
+    >>>bounded_beta(alpha=20, beta=5, mini=0.7, maxi=0.95, size=100)
+    """
+    if alpha <= 0 or beta <= 0:
+        raise ValueError('alpha and beta must be greater than zero')
+    if not mini < maxi:
+        raise ValueError('mini must be less than maxi')
+    rng = _check_random_state(random_state)
+    if isinstance(rng, QuasiRandom):  # inverse CDF of the beta distribution
+        from scipy import stats
+        v = mini + (maxi - mini) * stats.beta.ppf(rng.uniform(size=_check_size(size)), alpha, beta)
     else:
-        raise ValueError('"size" must be an integer')
+        v = mini + (maxi - mini) * rng.beta(alpha, beta, size=_check_size(size))
+    return _return_size(v, size)
+
+
+class QuasiRandom:
+    def __init__(self, dimensions, method='sobol', seed=None):
+        """Scrambled quasi-random (low-discrepancy) numbers, which can be used as the random_state of the
+        distributions in zepid.sensitivity_analysis. The distributions are then drawn by pushing the quasi-random
+        numbers through their inverse CDF. Quasi-random draws cover the distributions more evenly than pseudo-random
+        draws, so the percentiles of a bias analysis are more precise for the same number of draws.
+
+        Each call for draws uses the next dimension of the sequence, so the distributions drawn together are jointly
+        evenly spread. After all dimensions are used, the next call starts the next block of points. Requires
+        scipy 1.7 or newer
+
+        Parameters
+        --------------
+        dimensions : int
+            Number of distributions drawn together, which is the number of calls for draws in each block
+        method : str, optional
+            Low-discrepancy sequence to use. Options are 'sobol' (default) or 'halton'. Sobol sequences are most even
+            when the number of draws is a power of 2
+        seed : None, int, numpy.random.Generator, optional
+            Seed for the scrambling. Independently scrambled sequences give independent estimates, which can be used
+            to estimate the Monte Carlo error
 
+        Examples
+        --------------
+        >>>from zepid.sensitivity_analysis import QuasiRandom, trapezoidal
+        >>>qr = QuasiRandom(dimensions=2, seed=1)
+        >>>rr = trapezoidal(mini=0.9, mode1=1.1, mode2=1.7, maxi=1.8, size=1024, random_state=qr)
+        >>>p1 = trapezoidal(mini=0.25, mode1=0.28, mode2=0.32, maxi=0.35, size=1024, random_state=qr)
+        """
+        try:
+            from scipy.stats import qmc
+        except ImportError:
+            raise ImportError('QuasiRandom requires scipy 1.7 or newer')
+        if type(dimensions) is not int or dimensions < 1:
+            raise ValueError('dimensions must be a positive integer')
+        if method == 'sobol':
+            self._engine = qmc.Sobol(d=dimensions, scramble=True, seed=seed)
+        elif method == 'halton':
+            self._engine = qmc.Halton(d=dimensions, scramble=True, seed=seed)
+        else:
+            raise ValueError('method must be either "sobol" or "halton"')
+        self.dimensions = dimensions
+        self.method = method
+        self._block = None
+        self._column = dimensions
+
+    def uniform(self, size=None):
+        """Next dimension of quasi-random numbers on the unit interval
+
+        Parameters
+        --------------
+        size : int
+            Number of draws. Must be the same for all dimensions of a block
+        """
+        n = 1 if size is None else size
+        if self._column == self.dimensions:  # starting the next block of points
+            self._block = self._engine.random(n)
+            self._column = 0
+        elif self._block.shape[0] != n:
+            raise ValueError('All draws in a block of QuasiRandom numbers must have the same size. The previous block '
+                             'has ' + str(self._column) + ' of ' + str(self.dimensions) + ' dimensions used')
+        u = self._block[:, self._column]
+        self._column += 1
+        # keeping away from 0, where the inverse CDF of unbounded distributions is infinite
+        u = np.clip(u, np.finfo(float).tiny, 1 - np.finfo(float).eps)
+        return u[0] if size is None else u
+
+    def standard_normal(self, size=None):
+        """Next dimension of quasi-random numbers from the standard normal distribution
+
+        Parameters
+        --------------
+        size : int
+            Number of draws. Must be the same for all dimensions of a block
+        """
+        from scipy import stats
+        return stats.norm.ppf(self.uniform(size=size))
+
+
+def _check_random_state(random_state):
+    """Hidden function that converts the random_state argument into an object with NumPy's random sampling methods
+    """
+    if random_state is None:
+        return np.random.mtrand._rand  # the global RandomState, so np.random.seed() applies
+    if isinstance(random_state, (int, np.integer)):
+        return np.random.default_rng(random_state)
+    if isinstance(random_state, (np.random.Generator, np.random.RandomState, QuasiRandom)):
+        return random_state
+    raise ValueError('random_state must be None, an integer, a numpy.random.Generator, a numpy.random.RandomState, '
+                     'or a QuasiRandom')
+
+
+def _spawn_seed(rng):
+    """Hidden function that draws an integer seed from a random state, to seed independent streams
+    """
+    if isinstance(rng, np.random.Generator):
+        return int(rng.integers(2**31))
+    return int(rng.randint(2**31))
+
+
+def _check_size(size):
+    """Hidden function that checks the size argument. A single draw is generated as an array of length one
+    """
+    if size is None:
+        return 1
+    if isinstance(size, (int, np.integer)) and not isinstance(size, bool):
+        return size
+    raise ValueError('"size" must be an integer')
+
+
+def _return_size(values, size):
+    """Hidden function that returns a single float when size is None, and the array of draws otherwise
+    """
+    if size is None:
+        return values[0]
+    return values
@@ -0,0 +1,107 @@
+import numpy as np
+
+
+def confounding_grid(observed_RR, rr_confounder, prop_exposed, prop_unexposed):
+    """Corrected risk ratios for an unmeasured binary confounder over a grid of bias parameters. The same correction
+    as MonteCarloRR is evaluated for every combination of the bias parameters and every observed risk ratio at once
+
+    Parameters
+    --------------
+    observed_RR : float, array
+        Observed risk ratio(s). Confidence limits can be included, for example as an array of shape (n, 3) holding
+        the point estimate, lower, and upper limit of n estimates
+    rr_confounder : float, array
+        Values of the risk ratio between the unmeasured confounder and the outcome
+    prop_exposed : float, array
+        Values of the proportion of the exposed with the unmeasured confounder
+    prop_unexposed : float, array
+        Values of the proportion of the unexposed with the unmeasured confounder
+
+    Returns
+    --------------
+    array
+        Corrected risk ratios, with the shape of observed_RR followed by the lengths of rr_confounder, prop_exposed,
+        and prop_unexposed. For example, 10 observed risk ratios over a 50 x 20 x 20 grid returns an array of shape
+        (10, 50, 20, 20)
+
+    Examples
+    --------------
+    >>>from zepid.sensitivity_analysis import confounding_grid
+    >>>confounding_grid(observed_RR=[0.73, 1.4], rr_confounder=np.linspace(1, 3, 21),
+    >>>                 prop_exposed=np.linspace(0.1, 0.5, 5), prop_unexposed=np.linspace(0.1, 0.5, 5))
+    """
+    rr_c, p1, p0 = _check_parameters(rr_confounder, prop_exposed, prop_unexposed)
+    rr_obs = np.asarray(observed_RR, dtype=float)
+    if (rr_obs <= 0).any():
+        raise ValueError('observed_RR must be greater than zero')
+
+    # Bias factor over the (rr_confounder x prop_exposed x prop_unexposed) grid, broadcast against the estimates
+    bias = _bias_factor(rr_c[:, None, None], p1[None, :, None], p0[None, None, :])
+    return rr_obs[..., None, None, None] / bias
+
+
+def confounding_tipping_point(lower, upper, prop_exposed, prop_unexposed):
+    """Tipping points of an unmeasured binary confounder. For each estimate and each combination of the proportions of
+    the confounder in the exposed and unexposed, the confounder-outcome risk ratio at which the corrected confidence
+    interval reaches the null (RR=1) is found. Plotting the tipping points against the proportions gives the
+    tipping-point contours
+
+    Parameters
+    --------------
+    lower : float, array
+        Lower confidence limit(s) of the observed risk ratio(s)
+    upper : float, array
+        Upper confidence limit(s) of the observed risk ratio(s)
+    prop_exposed : float, array
+        Values of the proportion of the exposed with the unmeasured confounder
+    prop_unexposed : float, array
+        Values of the proportion of the unexposed with the unmeasured confounder
+
+    Returns
+    --------------
+    array
+        Confounder-outcome risk ratios at the tipping point, with the shape of lower followed by the lengths of
+        prop_exposed and prop_unexposed. The tipping point is 1 when the confidence interval already includes the null,
+        and NaN when no confounder-outcome risk ratio moves the confidence interval to the null
+
+    Examples
+    --------------
+    >>>from zepid.sensitivity_analysis import confounding_tipping_point
+    >>>rrc = confounding_tipping_point(lower=[1.2, 0.5], upper=[2.1, 0.9], prop_exposed=np.linspace(0.05, 0.95, 19),
+    >>>                                prop_unexposed=np.linspace(0.05, 0.95, 19))
+    >>>plt.contour(np.linspace(0.05, 0.95, 19), np.linspace(0.05, 0.95, 19), rrc[0].T, levels=[1.5, 2, 3, 5])
+    """
+    lower, upper = np.broadcast_arrays(np.asarray(lower, dtype=float), np.asarray(upper, dtype=float))
+    if (lower <= 0).any() or (lower > upper).any():
+        raise ValueError('The confidence limits must satisfy 0 < lower <= upper')
+    _, p1, p0 = _check_parameters(1., prop_exposed, prop_unexposed)
+    p1 = p1[None, :, None]
+    p0 = p0[None, None, :]
+
+    # The bias factor must reach the confidence limit closest to the null. Solving
+    # (p1*(RRc-1)+1) / (p0*(RRc-1)+1) = limit for RRc
+    limit = np.where(lower > 1, lower, np.where(upper < 1, upper, 1.))[..., None, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tipping = 1 + (limit - 1) / (p1 - limit * p0)
+    tipping = np.where(limit == 1, 1., tipping)
+    return np.where(np.isfinite(tipping) & (tipping > 0), tipping, np.nan)
+
+
+def _bias_factor(rr_confounder, prop_exposed, prop_unexposed):
+    """Hidden function for the bias factor of an unmeasured binary confounder, by which the observed risk ratio is
+    divided to correct for it
+    """
+    return (prop_exposed*(rr_confounder-1)+1) / (prop_unexposed*(rr_confounder-1)+1)
+
+
+def _check_parameters(rr_confounder, prop_exposed, prop_unexposed):
+    """Hidden function that converts the bias parameters to one-dimensional arrays and checks their values
+    """
+    rr_c, p1, p0 = (np.atleast_1d(np.asarray(x, dtype=float)) for x in [rr_confounder, prop_exposed, prop_unexposed])
+    if rr_c.ndim > 1 or p1.ndim > 1 or p0.ndim > 1:
+        raise ValueError('The bias parameters must be numbers or one-dimensional arrays')
+    if (rr_c <= 0).any():
+        raise ValueError('rr_confounder must be greater than zero')
+    if (p1 < 0).any() or (p1 > 1).any() or (p0 < 0).any() or (p0 > 1).any():
+        raise ValueError('The proportions must be between 0 and 1')
+    return rr_c, p1, p0